@@ -0,0 +1,148 @@
+"""
+Extract - Section extraction for fetch_full
+- SectionFilter: the `filter` keyword compiled once. It finds every matching line, scores it
+  (the whole phrase beats a few of its words), widens each hit to a context window and
+  returns the best sections first.
+- text_part(): picks the text/plain part (or text/html) from an IMAP BODYSTRUCTURE, so only
+  that part is downloaded with BODY.PEEK[n] instead of the whole message and its attachments.
+- decode_part(): undoes the part's transfer encoding and charset.
+"""
+import re
+import base64
+import quopri
+
+
+class SectionFilter:
+    def __init__(self, term, before=2, after=5, max_sections=3):
+        words = re.findall(r"\w+", (term or "").lower())
+        # Very short words ("of", "a") match almost everywhere; only keep them if nothing else is left
+        self.words = [w for w in dict.fromkeys(words) if len(w) > 2] or list(dict.fromkeys(words))
+        self.term = term
+        self.before, self.after = max(0, int(before)), max(0, int(after))
+        self.max_sections = max(1, int(max_sections))
+        # Phrase: the words in order, with any punctuation/spacing in between ("Final-Equity:" matches)
+        self._phrase = re.compile(r"\b" + r"\W+".join(map(re.escape, words)), re.IGNORECASE) if words else None
+        self._word = re.compile(r"\b(" + "|".join(map(re.escape, self.words)) + ")", re.IGNORECASE) if self.words else None
+
+    def __bool__(self):
+        return self._word is not None
+
+    def imap_criteria(self):
+        """IMAP SEARCH criteria matching bodies with any of the words ('' if not expressible in ASCII)."""
+        if not self.words or not all(w.isascii() for w in self.words):
+            return ""
+        criteria = f'BODY "{self.words[0]}"'
+        for word in self.words[1:]:
+            criteria = f'OR {criteria} BODY "{word}"'
+        return criteria
+
+    def _score(self, line):
+        words = {m.lower() for m in self._word.findall(line)}
+        if not words:
+            return 0
+        return len(words) + (len(self.words) + 1 if len(self.words) > 1 and self._phrase.search(line) else 0)
+
+    def sections(self, text):
+        """The best-scoring context windows as [(score, text)], best first."""
+        if not self:
+            return []
+        lines = text.split("\n")
+        hits = [(idx, score) for idx, score in ((idx, self._score(line)) for idx, line in enumerate(lines)) if score]
+        # Merge hits whose windows overlap into one section
+        windows = []
+        for idx, score in hits:
+            start, end = max(0, idx - self.before), min(len(lines), idx + self.after + 1)
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], end)
+                windows[-1][2].append(score)
+            else:
+                windows.append([start, end, [score]])
+        # Best line first, then how many hits the section has; earlier sections win ties
+        ranked = sorted(windows, key=lambda w: (-max(w[2]), -len(w[2]), w[0]))[:self.max_sections]
+        return [(max(scores), "\n".join(lines[start:end]).strip("\n")) for start, end, scores in ranked]
+
+    def extract(self, text):
+        """Sections joined for the reply, or None if the filter doesn't match."""
+        found = self.sections(text)
+        return "\n...\n".join(section for _, section in found) if found else None
+
+
+def parse_sexp(data):
+    """IMAP parenthesized list (e.g. a BODYSTRUCTURE) -> nested Python lists of str/None."""
+    tokens = re.findall(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}|[^\s()"]+', data)
+    stack, current = [], []
+    for token in tokens:
+        if token == b"(":
+            stack.append(current)
+            current = []
+        elif token == b")":
+            if not stack:
+                break
+            parent = stack.pop()
+            parent.append(current)
+            current = parent
+        elif token.startswith(b'"'):
+            current.append(re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode(errors="ignore"))
+        elif token.upper() == b"NIL":
+            current.append(None)
+        else:
+            current.append(token.decode(errors="ignore"))
+    return current
+
+
+def bodystructure(response):
+    """The BODYSTRUCTURE list from a FETCH response line, or None."""
+    match = re.search(rb"BODYSTRUCTURE\s*\(", response, re.IGNORECASE)
+    if not match:
+        return None
+    parsed = parse_sexp(response[match.end() - 1:])
+    return parsed[0] if parsed and isinstance(parsed[0], list) else None
+
+
+def _is_attachment(part):
+    return any(isinstance(ext, list) and ext and isinstance(ext[0], str) and ext[0].lower() == "attachment"
+               for ext in part[7:])
+
+
+def _params(part):
+    values = part[2] if len(part) > 2 and isinstance(part[2], list) else []
+    return {str(k).lower(): v for k, v in zip(values[::2], values[1::2])}
+
+
+def _leaves(structure, prefix=""):
+    if structure and isinstance(structure[0], list):
+        # Multipart: the child parts come first, then the subtype and extension data
+        for number, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            yield from _leaves(child, f"{prefix}{number}.")
+    elif len(structure) >= 7:
+        yield prefix.rstrip(".") or "1", structure
+
+
+def text_part(structure):
+    """(section, subtype, encoding, charset) of the readable body part, or None."""
+    plain = html = None
+    for section, part in _leaves(structure or []):
+        if str(part[0]).lower() != "text" or _is_attachment(part):
+            continue
+        info = (section, str(part[1]).lower(), str(part[5] or "7bit").lower(), _params(part).get("charset") or "utf-8")
+        if info[1] == "plain" and plain is None:
+            plain = info
+        elif info[1] == "html" and html is None:
+            html = info
+    return plain or html
+
+
+def decode_part(data, encoding, charset):
+    try:
+        if encoding == "base64":
+            data = base64.b64decode(data)
+        elif encoding == "quoted-printable":
+            data = quopri.decodestring(data)
+    except ValueError:
+        pass
+    try:
+        return data.decode(charset, errors="ignore")
+    except LookupError:
+        return data.decode("utf-8", errors="ignore")
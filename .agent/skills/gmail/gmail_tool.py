@@ -1,10 +1,21 @@
 import imaplib
 import email
-from email.header import decode_header
+from email.header import decode_header, make_header
+import email.utils
 import datetime
+import time
 import os
+import re
+import sys
+import json
+import tempfile
+import threading
 from dotenv import load_dotenv
 
+from imap_pool import ImapPool, DaemonClient, serve, CONNECTION_ERRORS
+from mail_cache import MailCache
+from extract import SectionFilter, bodystructure, text_part, decode_part
+
 # Load config (Traverse up from .agent/skills/gmail/ to project root)
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 env_path = os.path.join(PROJECT_ROOT, "satele.config")
@@ -13,225 +24,410 @@ load_dotenv(env_path)
 GMAIL_USER = os.getenv("GMAIL_USER")
 GMAIL_PASS = os.getenv("GMAIL_APP_PASSWORD") # Requires App Password
 
+# Commands run in a small background daemon that keeps the IMAP login alive between
+# invocations (see imap_pool.py). GMAIL_DAEMON=0 runs every command in-process instead.
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), f"satele-gmail-{os.getuid() if hasattr(os, 'getuid') else 'user'}.sock")
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)]"
+# Local copy of recent INBOX mail (see mail_cache.py); GMAIL_CACHE=0 always asks the server
+CACHE_PATH = os.getenv("GMAIL_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".mail_cache.db"))
+
+def env_int(name, default):
+    try:
+        return int(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
+
 def connect():
     if not GMAIL_USER or not GMAIL_PASS:
         raise Exception("GMAIL_USER and GMAIL_APP_PASSWORD must be set in satele.config")
-    
-    mail = imaplib.IMAP4_SSL("imap.gmail.com")
+
+    mail = imaplib.IMAP4_SSL("imap.gmail.com", timeout=30)
     mail.login(GMAIL_USER, GMAIL_PASS)
     return mail
 
-def search_emails(query_params):
+_pool = None
+_config_mtime = os.path.getmtime(env_path) if os.path.exists(env_path) else None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ImapPool(connect, size=env_int("GMAIL_POOL_SIZE", 2))
+    return _pool
+
+def reload_config_if_changed():
+    """The daemon outlives `satele gmail <user> <password>`: pick up new credentials."""
+    global GMAIL_USER, GMAIL_PASS, _config_mtime
+    mtime = os.path.getmtime(env_path) if os.path.exists(env_path) else None
+    if mtime == _config_mtime:
+        return
+    _config_mtime = mtime
+    load_dotenv(env_path, override=True)
+    GMAIL_USER, GMAIL_PASS = os.getenv("GMAIL_USER"), os.getenv("GMAIL_APP_PASSWORD")
+    if _pool:
+        _pool.close_all()
+
+def with_inbox(fn):
+    """Runs fn(mail) on a pooled connection with INBOX selected (read-only, so nothing is marked as read).
+    A connection the server dropped is replaced and the call retried once."""
+    for attempt in range(2):
+        try:
+            with get_pool().connection() as mail:
+                mail.select("inbox", readonly=True)
+                return fn(mail)
+        except CONNECTION_ERRORS:
+            if attempt:
+                raise
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if os.getenv("GMAIL_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        _cache = MailCache(CACHE_PATH)
+    return _cache
+
+def date_epoch(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except Exception:
+        return time.time()
+
+def parse_message(raw):
+    msg = email.message_from_bytes(raw)
+    return {
+        "sender": msg.get("From"),
+        "subject": decode_mime_header(msg.get("Subject")),
+        "date": msg.get("Date"),
+        "date_epoch": date_epoch(msg.get("Date")),
+        "body": message_text(msg),
+    }
+
+def run_sync(cache, max_new=None, max_initial=None, reset=False):
+    return with_inbox(lambda mail: cache.sync(
+        mail, uid_search, fetch_texts,
+        since_days=env_int("GMAIL_CACHE_DAYS", 30), max_initial=max_initial or env_int("GMAIL_CACHE_MAX_INITIAL", 500),
+        max_new=max_new, reset=reset))
+
+# Only the daemon lives long enough to finish a sync in a background thread
+BACKGROUND_SYNC = False
+_sync_thread = None
+
+def start_background_sync(cache):
+    """Syncs the cache in a daemon thread (no-op if one is already running); errors are retried on the next request."""
+    global _sync_thread
+    if _sync_thread and _sync_thread.is_alive():
+        return
+    def run():
+        try:
+            run_sync(cache)
+        except Exception as e:
+            print(f"Mail cache sync failed: {e}", file=sys.stderr)
+    _sync_thread = threading.Thread(target=run, name="gmail-cache-sync", daemon=True)
+    _sync_thread.start()
+
+def synced_cache():
     """
-    query_params: dict with keys like 'sender', 'subject', 'days'
+    The mail cache after an incremental sync (at most every GMAIL_SYNC_INTERVAL seconds),
+    plus whether the sync failed (offline). None if the cache is disabled or not filled yet.
+    In the daemon, the first fill and any sync with more than GMAIL_SYNC_INLINE_MAX new
+    messages run in the background while requests are answered by the server. In-process,
+    the cache is instead refilled inline with just the newest GMAIL_SYNC_INLINE_MAX messages.
     """
-    mail = connect()
-    mail.select("inbox")
-    
+    cache = get_cache()
+    if cache is None:
+        return None, False
+    state = cache.state()
+    filled = bool(state and state["synced_at"])
+    if filled and cache.age() < env_int("GMAIL_SYNC_INTERVAL", 120):
+        return cache, False
+    inline_max = env_int("GMAIL_SYNC_INLINE_MAX", 50)
+    try:
+        added = run_sync(cache, max_new=inline_max) if filled else None
+        if added is None and not BACKGROUND_SYNC:
+            added = run_sync(cache, max_initial=inline_max, reset=True)
+    except Exception:
+        return (cache, True) if filled else (None, False)
+    if added is None:
+        start_background_sync(cache)
+        return None, False
+    return cache, False
+
+def since_epoch(query_params):
+    if not query_params.get('days'):
+        return None
+    date = datetime.date.today() - datetime.timedelta(days=int(query_params['days']))
+    return time.mktime(date.timetuple())
+
+def cached_messages(query_params, with_body=False, body_words=None):
+    """
+    Matches from the local cache as (messages, offline), or (None, False) when the cache
+    can't answer: disabled, never synced, or the query may reach past the cached window.
+    """
+    cache, offline = synced_cache()
+    if cache is None:
+        return None, False
+    limit = int(query_params.get('limit', 5))
+    since = since_epoch(query_params)
+    rows = cache.query(query_params.get('sender'), query_params.get('subject'), since,
+                       text=query_params.get('query'), limit=limit, with_body=with_body, body_words=body_words)
+    # Newest-first window: `limit` hits are the answer; fewer are only complete if the window covers the query
+    if len(rows) >= limit or cache.covers(since) or offline:
+        return rows, offline
+    return None, False
+
+def build_query(query_params, extra=None):
     criterion = []
     if query_params.get('sender'):
         criterion.append(f'FROM "{query_params["sender"]}"')
     if query_params.get('subject'):
         # Use substring search for subjects to be more flexible
         criterion.append(f'SUBJECT "{query_params["subject"]}"')
-    
+
     if query_params.get('days'):
         date = (datetime.date.today() - datetime.timedelta(days=int(query_params['days']))).strftime("%d-%b-%Y")
         criterion.append(f'SINCE "{date}"')
-    
-    search_query = " ".join(criterion) if criterion else 'ALL'
-    
-    status, messages = mail.search(None, search_query)
+    if query_params.get('query'):
+        criterion.append(f'TEXT "{query_params["query"]}"')
+    if extra:
+        criterion.append(extra)
+
+    return " ".join(criterion) if criterion else 'ALL'
+
+def uid_search(mail, search_query):
+    status, messages = mail.uid("SEARCH", None, search_query)
     if status != "OK":
-        return f"Search failed with status: {status}"
-    
-    ids = messages[0].split()
-    if not ids:
-        return f"No emails found matching query: {search_query}"
-        
-    results = []
+        raise imaplib.IMAP4.error(f"Search failed with status: {status}")
+    return [uid.decode() for uid in messages[0].split()]
+
+def fetch_items(mail, uids, items):
+    """
+    One UID FETCH round trip for all `uids`; returns [(uid, response, data)] in the order of
+    `uids`, where `response` is the untagged line around the literal `data`.
+    """
+    if not uids:
+        return []
+    status, data = mail.uid("FETCH", ",".join(uids), f"(UID {items})")
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"Fetch failed with status: {status}")
+    found = {}
+    for idx, part in enumerate(data):
+        if not isinstance(part, tuple):
+            continue
+        # The UID (and other items) may come before or after the literal, depending on the server
+        response = part[0]
+        if idx + 1 < len(data) and isinstance(data[idx + 1], bytes):
+            response += b" " + data[idx + 1]
+        match = re.search(rb"UID (\d+)", response)
+        if match:
+            found[match.group(1).decode()] = (response, part[1])
+    return [(uid, *found[uid]) for uid in uids if uid in found]
+
+def fetch_batch(mail, uids, item):
+    """One UID FETCH round trip for all `uids`; returns [(uid, data)] in the order of `uids`."""
+    return [(uid, data) for uid, _, data in fetch_items(mail, uids, item)]
+
+def fetch_texts(mail, uids):
+    """
+    Headers and readable body of each message, without downloading attachments: BODYSTRUCTURE
+    says which MIME part holds the text, then only that part is fetched (one round trip per
+    distinct part number, usually one or two).
+    """
+    messages, parts, whole = {}, {}, []
+    for uid, response, header in fetch_items(mail, uids, f"BODYSTRUCTURE {HEADER_FIELDS}"):
+        msg = email.message_from_bytes(header)
+        messages[uid] = {"uid": uid, "sender": msg.get("From"), "subject": decode_mime_header(msg.get("Subject")),
+                         "date": msg.get("Date"), "date_epoch": date_epoch(msg.get("Date")), "body": ""}
+        structure = bodystructure(response)
+        if structure is None:
+            whole.append(uid)   # couldn't parse it; fall back to the full message
+            continue
+        part = text_part(structure)
+        if part:
+            parts.setdefault(part[0], []).append((uid, part))
+
+    for section, entries in parts.items():
+        info = dict(entries)
+        for uid, data in fetch_batch(mail, list(info), f"BODY.PEEK[{section}]"):
+            _, subtype, encoding, charset = info[uid]
+            text = decode_part(data, encoding, charset)
+            messages[uid]["body"] = html_to_text(text) if subtype == "html" else text
+    for uid, raw in fetch_batch(mail, whole, "BODY.PEEK[]"):
+        messages[uid].update(parse_message(raw))
+    return [messages[uid] for uid in uids if uid in messages]
+
+def decode_mime_header(value):
+    if not value:
+        return ""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+def html_to_text(html_content):
+    # Remove script and style tags
+    html_content = re.sub(r'<(script|style)[^>]*>.*?</\1>', '', html_content, flags=re.DOTALL)
+    # Remove HTML tags
+    html_content = re.sub(r'<[^>]+>', '\n', html_content)
+    # Decode HTML entities
+    html_content = html_content.replace('&nbsp;', ' ').replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
+    # Clean up whitespace
+    return re.sub(r'\n\s*\n', '\n', html_content)
+
+def message_text(msg):
+    """Plain-text body (attachments skipped); falls back to the HTML part converted to text."""
+    if not msg.is_multipart():
+        try:
+            payload = msg.get_payload(decode=True)
+            text = payload.decode(errors='ignore') if payload else ""
+        except Exception:
+            return ""
+        return html_to_text(text) if msg.get_content_type() == "text/html" else text
+    content, html = "", ""
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        if "attachment" in str(part.get("Content-Disposition")):
+            continue
+        try:
+            payload = part.get_payload(decode=True)
+        except Exception:
+            continue
+        if not payload:
+            continue
+        if content_type == "text/plain":
+            content += payload.decode(errors='ignore')
+        elif content_type == "text/html" and not html:
+            html = payload.decode(errors='ignore')
+    return content or (html_to_text(html) if html else "")
+
+def search_emails(query_params):
+    """
+    query_params: dict with keys like 'sender', 'subject', 'days'
+    """
+    search_query = build_query(query_params)
     # Get last N (specified by limit or default 5)
     limit = int(query_params.get('limit', 5))
-    for i in ids[-limit:]:
-        res, msg_data = mail.fetch(i, "(RFC822)")
-        for response_part in msg_data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-                subject, encoding = decode_header(msg["Subject"])[0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode(encoding if encoding else "utf-8")
-                
-                from_ = msg.get("From")
-                date = msg.get("Date")
-                
-                results.append({
-                    "id": i.decode(),
-                    "from": from_,
-                    "subject": subject,
-                    "date": date
-                })
-    
-    mail.logout()
-    return results
+
+    cached, _ = cached_messages(query_params)
+    if cached is not None:
+        if not cached:
+            return f"No emails found matching query: {search_query}"
+        return [{"id": str(m["uid"]), "from": m["sender"], "subject": m["subject"], "date": m["date"]} for m in cached]
+
+    def run(mail):
+        uids = uid_search(mail, search_query)
+        if not uids:
+            return f"No emails found matching query: {search_query}"
+        # Headers only, for all matches in one round trip
+        results = []
+        for uid, header in fetch_batch(mail, uids[-limit:], HEADER_FIELDS):
+            msg = email.message_from_bytes(header)
+            results.append({
+                "id": uid,
+                "from": msg.get("From"),
+                "subject": decode_mime_header(msg.get("Subject")),
+                "date": msg.get("Date")
+            })
+        return results
+
+    return with_inbox(run)
 
 def read_email(msg_id):
-    mail = connect()
-    mail.select("inbox")
-    res, msg_data = mail.fetch(msg_id, "(RFC822)")
-    
-    content = ""
-    for response_part in msg_data:
-        if isinstance(response_part, tuple):
-            msg = email.message_from_bytes(response_part[1])
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    if content_type == "text/plain" and "attachment" not in content_disposition:
-                        try:
-                            payload = part.get_payload(decode=True)
-                            if payload:
-                                content += payload.decode(errors='ignore')
-                        except: pass
-            else:
-                try:
-                    payload = msg.get_payload(decode=True)
-                    if payload:
-                        content = payload.decode(errors='ignore')
-                except: pass
-    
-    mail.logout()
-    return content
+    cache = get_cache()
+    cached = cache.get(msg_id) if cache and str(msg_id).isdigit() else None
+    if cached:
+        return cached["body"]
+
+    def run(mail):
+        fetched = fetch_batch(mail, [str(msg_id)], "BODY.PEEK[]")
+        return message_text(email.message_from_bytes(fetched[0][1])) if fetched else ""
+
+    return with_inbox(run)
 
 def fetch_full(query_params):
     """
     Finds emails matching query and returns a text dump of all bodies.
-    Supports optional 'filter' parameter to extract specific sections.
+    Supports optional 'filter' parameter to extract specific sections: only emails containing
+    it are fetched, and each one is cut down to its best-matching sections
+    ('sections', default 3), with 'before' / 'after' lines of context (default 2 / 5).
     """
-    mail = connect()
-    mail.select("inbox")
-    
-    criterion = []
-    if query_params.get('sender'):
-        criterion.append(f'FROM "{query_params["sender"]}"')
-    if query_params.get('subject'):
-        criterion.append(f'SUBJECT "{query_params["subject"]}"')
-    if query_params.get('days'):
-        date = (datetime.date.today() - datetime.timedelta(days=int(query_params['days']))).strftime("%d-%b-%Y")
-        criterion.append(f'SINCE "{date}"')
-    
-    search_query = " ".join(criterion) if criterion else 'ALL'
-    
-    status, messages = mail.search(None, search_query)
-    if status != "OK":
-        return f"Search failed with status: {status}"
-    
-    ids = messages[0].split()
-    if not ids:
-        return f"No emails found for content fetch matching: {search_query}"
-        
-    results = []
-    content_filter = query_params.get('filter', '').lower()  # Optional filter keyword
-    
+    content_filter = SectionFilter(query_params.get('filter'),
+                                   before=query_params.get('before', 2), after=query_params.get('after', 5),
+                                   max_sections=query_params.get('sections', 3))
+    # The server (or cache) drops emails without any of the filter words
+    search_query = build_query(query_params, extra=content_filter.imap_criteria())
     # Limit to prevent token overflow
     limit = int(query_params.get('limit', 5))
-    for i in ids[-limit:]:
-        # Fetch body
-        res, msg_data = mail.fetch(i, "(RFC822)")
-        for response_part in msg_data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-                subject, encoding = decode_header(msg["Subject"])[0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode(encoding if encoding else "utf-8")
-                
-                content = ""
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        if content_type == "text/plain":
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    content += payload.decode(errors='ignore')
-                            except: pass
-                        elif content_type == "text/html" and not content:
-                            # Fallback to HTML if no plain text found
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    html_content = payload.decode(errors='ignore')
-                                    # Simple HTML to text conversion
-                                    import re
-                                    # Remove script and style tags
-                                    html_content = re.sub(r'<(script|style)[^>]*>.*?</\1>', '', html_content, flags=re.DOTALL)
-                                    # Remove HTML tags
-                                    html_content = re.sub(r'<[^>]+>', '\n', html_content)
-                                    # Decode HTML entities
-                                    html_content = html_content.replace('&nbsp;', ' ').replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
-                                    # Clean up whitespace
-                                    html_content = re.sub(r'\n\s*\n', '\n', html_content)
-                                    content += html_content
-                            except: pass
-                else:
-                    try:
-                        payload = msg.get_payload(decode=True)
-                        if payload:
-                            content = payload.decode(errors='ignore')
-                    except: pass
-                
-                # Apply content filter if specified
-                if content_filter:
-                    filtered_lines = []
-                    content_lines = content.split('\n')
-                    
-                    # Normalize filter term (remove special chars, extra spaces)
-                    import re
-                    normalized_filter = re.sub(r'[^\w\s]', '', content_filter).strip()
-                    
-                    for idx, line in enumerate(content_lines):
-                        # Normalize line for comparison
-                        normalized_line = re.sub(r'[^\w\s]', '', line.lower()).strip()
-                        
-                        # Check if filter keywords appear in the line
-                        if normalized_filter in normalized_line or any(word in normalized_line for word in normalized_filter.split()):
-                            # Include context: 2 lines before and 5 lines after (to capture full sections)
-                            start = max(0, idx - 2)
-                            end = min(len(content_lines), idx + 6)
-                            filtered_lines = content_lines[start:end]
-                            break  # Only get first match per email
-                    
-                    if filtered_lines:
-                        content = '\n'.join(filtered_lines)
-                    else:
-                        content = f"[Filter '{content_filter}' not found in email. Try: 'equity', 'portfolio', 'performance', or 'summary']"
-                
-                results.append(f"--- EMAIL ID: {i.decode()} ---\nSubject: {subject}\nFrom: {msg.get('From')}\nDate: {msg.get('Date')}\nContent:\n{content}\n")
-    
-    mail.logout()
+
+    def run(mail):
+        uids = uid_search(mail, search_query)
+        if not uids:
+            return f"No emails found for content fetch matching: {search_query}"
+        return fetch_texts(mail, uids[-limit:])
+
+    # Bodies are stored decoded in the local cache; only go to the server if it can't answer
+    messages, offline = cached_messages(query_params, with_body=True, body_words=content_filter.words)
+    if messages is None:
+        messages = with_inbox(run)
+        if isinstance(messages, str):
+            return messages
+    elif not messages:
+        return f"No emails found for content fetch matching: {search_query}"
+
+    results = []
+    if offline:
+        results.append("[Offline: answered from the local mail cache]\n")
+    for msg in messages:
+        uid, subject, content = msg["uid"], msg["subject"], msg["body"]
+
+        # Apply content filter if specified
+        if content_filter:
+            content = content_filter.extract(content) or \
+                f"[Filter '{content_filter.term}' not found in email. Try: 'equity', 'portfolio', 'performance', or 'summary']"
+
+        results.append(f"--- EMAIL ID: {uid} ---\nSubject: {subject}\nFrom: {msg['sender']}\nDate: {msg['date']}\nContent:\n{content}\n")
+
     return "\n".join(results)
 
-if __name__ == "__main__":
-    import sys
-    import json
-    
-    if len(sys.argv) < 2:
-        print("Usage: gmail_tool.py [search|fetch_full|read] <args>")
-        sys.exit(1)
-        
-    cmd = sys.argv[1]
-    
+def run_command(cmd, args):
+    """Executes one CLI command and returns what it prints (runs in the daemon or in-process)."""
+    reload_config_if_changed()
     try:
         if cmd == "search":
-            params = json.loads(sys.argv[2]) if len(sys.argv) > 2 else {}
+            params = json.loads(args[0]) if args else {}
             res = search_emails(params)
-            print(json.dumps(res, indent=2) if isinstance(res, list) else res)
+            return json.dumps(res, indent=2) if isinstance(res, list) else res
         elif cmd == "fetch_full":
-            params = json.loads(sys.argv[2]) if len(sys.argv) > 2 else {}
-            print(fetch_full(params))
+            params = json.loads(args[0]) if args else {}
+            return fetch_full(params)
         elif cmd == "read":
-            print(read_email(sys.argv[2]))
+            return read_email(args[0])
         else:
-            print(f"Unknown command: {cmd}")
+            return f"Unknown command: {cmd}"
     except Exception as e:
-        print(f"Error: {e}")
+        return f"Error: {e}"
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: gmail_tool.py [search|fetch_full|read] <args>")
+        sys.exit(1)
+
+    cmd = sys.argv[1]
+
+    if cmd == "daemon":
+        BACKGROUND_SYNC = True
+        # Exit normally on SIGTERM so the socket is removed and the IMAP sessions logged out
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        serve(SOCKET_PATH, run_command, idle_timeout=env_int("GMAIL_DAEMON_IDLE", 900),
+              on_exit=lambda: _pool and _pool.close_all())
+        sys.exit(0)
+
+    output = None
+    if os.getenv("GMAIL_DAEMON", "1") != "0":
+        client = DaemonClient(SOCKET_PATH, start_command=[sys.executable, os.path.abspath(__file__), "daemon"])
+        output = client.request(cmd, sys.argv[2:])
+    if output is None:
+        output = run_command(cmd, sys.argv[2:])
+    print(output)
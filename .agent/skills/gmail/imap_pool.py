@@ -0,0 +1,221 @@
+"""
+IMAP Pool - Kept-alive IMAP sessions shared across gmail_tool.py invocations
+- ImapPool: a few logged-in connections, checked with NOOP after sitting idle and
+  replaced when the server dropped them
+- serve(): the small local daemon that owns the pool. gmail_tool.py sends each command
+  to it over a Unix socket (one JSON request/response per connection), so consecutive
+  commands skip the TLS handshake and LOGIN. It exits after `idle_timeout` seconds
+  without requests.
+- DaemonClient: used by the CLI. Starts the daemon on first use and returns None when it
+  is unavailable, so the caller can run the command in-process instead. A request the
+  daemon already received is never re-run: a timeout is reported as an error.
+"""
+import os
+import json
+import time
+import socket
+import imaplib
+import threading
+import subprocess
+import socketserver
+from contextlib import contextmanager
+
+# Errors after which a connection can't be reused
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError)
+
+
+def _logout(mail):
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+
+class ImapPool:
+    def __init__(self, factory, size=2, check_after=60):
+        self.factory = factory          # returns a new logged-in IMAP4 connection
+        self.size = max(1, size)
+        self.check_after = check_after  # NOOP before reusing a connection idle this long
+        self._idle = []                 # [(connection, last_used)]
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                self._cond.wait()
+            if self._idle:
+                mail, last_used = self._idle.pop()
+            else:
+                self._open += 1
+                mail, last_used = None, None
+        if mail is not None and time.time() - last_used > self.check_after:
+            try:
+                mail.noop()
+            except CONNECTION_ERRORS:
+                # Dropped by the server while idle; reconnect in the same slot
+                _logout(mail)
+                mail = None
+        if mail is None:
+            try:
+                mail = self.factory()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+        return mail
+
+    def _close(self, mail):
+        _logout(mail)
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        mail = self._acquire()
+        try:
+            yield mail
+        except imaplib.IMAP4.error as e:
+            # A refused command (NO/BAD) leaves the session usable; a dropped one doesn't
+            if isinstance(e, imaplib.IMAP4.abort):
+                self._close(mail)
+            else:
+                self._release(mail)
+            raise
+        except BaseException:
+            # The session may be mid-command (e.g. interrupted fetch); don't hand it out again
+            self._close(mail)
+            raise
+        self._release(mail)
+
+    def _release(self, mail):
+        with self._cond:
+            self._idle.append((mail, time.time()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for mail, _ in idle:
+            self._close(mail)
+
+
+if hasattr(socket, "AF_UNIX"):
+    class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.activity:
+            server.active += 1
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            output = server.command_handler(request.get("cmd"), request.get("args") or [])
+            self.wfile.write(json.dumps({"output": output}).encode() + b"\n")
+        except (OSError, ValueError):
+            pass
+        finally:
+            with server.activity:
+                server.active -= 1
+                server.last_request = time.time()
+
+
+def _is_listening(path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def serve(path, command_handler, idle_timeout=900, on_exit=None):
+    """Runs the daemon until it has been idle for `idle_timeout` seconds."""
+    if _is_listening(path):
+        return   # another daemon won the race
+    if os.path.exists(path):
+        os.unlink(path)   # stale socket from a crashed daemon
+    old_umask = os.umask(0o177)   # socket readable/writable by this user only
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.command_handler = command_handler
+    server.activity = threading.Lock()
+    server.active = 0
+    server.last_request = time.time()
+    threading.Thread(target=server.serve_forever, name="imap-daemon", daemon=True).start()
+    try:
+        while True:
+            time.sleep(5)
+            with server.activity:
+                if server.active == 0 and time.time() - server.last_request > idle_timeout:
+                    break
+    finally:
+        server.shutdown()
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        if on_exit:
+            on_exit()
+
+
+class DaemonClient:
+    def __init__(self, path, start_command=None, timeout=120):
+        self.path = path
+        self.start_command = start_command
+        self.timeout = timeout
+
+    def _send(self, cmd, args):
+        """A connection with the request written to it (raises OSError if the daemon isn't there)."""
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.settimeout(self.timeout)
+            conn.connect(self.path)
+            conn.sendall(json.dumps({"cmd": cmd, "args": args}).encode() + b"\n")
+        except OSError:
+            conn.close()
+            raise
+        return conn
+
+    def _start(self):
+        subprocess.Popen(self.start_command, start_new_session=True, close_fds=True,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if _is_listening(self.path):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def request(self, cmd, args):
+        """
+        The command's output from the daemon, or None if it can't be reached (the caller then
+        runs it in-process). Once the request is sent, a failure is returned as an error
+        instead: the daemon may still be running the command.
+        """
+        if not hasattr(socket, "AF_UNIX"):
+            return None
+        for attempt in range(2):
+            try:
+                conn = self._send(cmd, args)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if attempt or not self.start_command or not self._start():
+                    return None
+            except OSError:
+                return None
+        with conn:
+            try:
+                with conn.makefile("rb") as reader:
+                    return json.loads(reader.readline())["output"]
+            except socket.timeout:
+                return f"Error: no answer from the daemon within {self.timeout}s (the command may still be running)"
+            except (OSError, ValueError, KeyError) as e:
+                return f"Error: the daemon failed to answer: {e}"
@@ -0,0 +1,239 @@
+"""
+Mail Cache - Local SQLite copy of recent INBOX mail, synced incrementally by UID
+- Keyed by (UIDVALIDITY, UID). A sync only fetches UIDs above the last one seen; if the
+  server's UIDVALIDITY changes, the cache is rebuilt.
+- Bodies are decoded to plain text once (HTML converted) and indexed with FTS5, so
+  search / fetch_full / read are answered locally with bm25 ranking, in milliseconds
+  and also offline.
+- The first sync covers the last `since_days` days (at most `max_initial` messages); the
+  caller runs it in the background. Progress is saved per batch, so an interrupted sync
+  resumes where it stopped. Messages expunged on the server are pruned on every sync.
+- Only one sync runs at a time, and reads are never blocked by one (the database lock is
+  only held while a batch is written).
+"""
+import re
+import time
+import sqlite3
+import datetime
+import threading
+
+
+def imap_date(epoch):
+    return datetime.date.fromtimestamp(epoch).strftime("%d-%b-%Y")
+
+
+def fts_query(text):
+    """Free text -> FTS5 query: any of the words (bm25 ranks messages with more of them higher)."""
+    tokens = re.findall(r"\w+", (text or "").lower())
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(tokens))
+
+
+def _like(value):
+    return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class MailCache:
+    def __init__(self, path, mailbox="INBOX"):
+        self.mailbox = mailbox
+        self._lock = threading.RLock()        # database access
+        self._sync_lock = threading.Lock()    # one sync at a time
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                mailbox TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL,
+                last_uid INTEGER NOT NULL,
+                covers_since REAL,
+                synced_at REAL
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                mailbox TEXT NOT NULL,
+                uid INTEGER NOT NULL,
+                sender TEXT,
+                subject TEXT,
+                date TEXT,
+                date_epoch REAL,
+                body TEXT,
+                UNIQUE(mailbox, uid)
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(mailbox, date_epoch)")
+        try:
+            self.db.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+                USING fts5(subject, sender, body, content='messages', content_rowid='id')""")
+            self.db.execute("""
+                CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts(rowid, subject, sender, body) VALUES (new.id, new.subject, new.sender, new.body);
+                END""")
+            self.db.execute("""
+                CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+                    VALUES ('delete', old.id, old.subject, old.sender, old.body);
+                END""")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: text queries fall back to LIKE, unranked
+            self.fts = False
+
+    def state(self):
+        with self._lock:
+            row = self.db.execute("SELECT * FROM sync_state WHERE mailbox = ?", (self.mailbox,)).fetchone()
+        return dict(row) if row else None
+
+    def age(self):
+        """Seconds since the last successful sync (inf if never synced)."""
+        state = self.state()
+        return time.time() - state["synced_at"] if state and state["synced_at"] else float("inf")
+
+    def covers(self, since):
+        """True if every message newer than `since` (epoch) is in the cache."""
+        state = self.state()
+        return bool(state) and since is not None and state["covers_since"] is not None and since >= state["covers_since"]
+
+    def _reset(self):
+        self.db.execute("DELETE FROM messages WHERE mailbox = ?", (self.mailbox,))
+        self.db.execute("DELETE FROM sync_state WHERE mailbox = ?", (self.mailbox,))
+
+    def sync(self, mail, search, fetch, since_days=30, max_initial=500, batch=50, max_new=None, reset=False):
+        """
+        Brings the cache up to date using an IMAP connection with the mailbox selected.
+        search(mail, criteria) -> [uid]; fetch(mail, uids) -> [{"uid", "sender", "subject",
+        "date", "date_epoch", "body"}] (headers and text only, no attachments).
+        Returns the number of new messages, or None without syncing if another sync is
+        running or more than `max_new` messages are new (too slow to wait for).
+        reset=True drops the cached messages and starts over with a first sync.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return None
+        try:
+            uidvalidity = self._uidvalidity(mail)
+            state = self.state()
+            if state and (reset or state["uidvalidity"] != uidvalidity):
+                # UIDs were renumbered on the server; cached ones mean nothing now
+                with self._lock:
+                    self._reset()
+                state = None
+
+            if state is None:
+                since = time.time() - since_days * 86400
+                uids = search(mail, f'SINCE "{imap_date(since)}"')
+                covers_since = since if len(uids) <= max_initial else None
+                uids = uids[-max_initial:]
+                if max_new is not None and len(uids) > max_new:
+                    return None
+                top = search(mail, "UID *")
+                last_uid = int(top[-1]) if top else 0
+                with self._lock:
+                    self.db.execute(
+                        "INSERT INTO sync_state (mailbox, uidvalidity, last_uid, covers_since) VALUES (?, ?, ?, ?)",
+                        (self.mailbox, uidvalidity, 0, covers_since))
+            else:
+                last_uid = state["last_uid"]
+                uids = [u for u in search(mail, f"UID {last_uid + 1}:*") if int(u) > last_uid]
+                if max_new is not None and len(uids) > max_new:
+                    return None
+                self._prune(mail, search, last_uid)
+
+            added = 0
+            for start in range(0, len(uids), batch):
+                chunk = uids[start:start + batch]
+                messages = fetch(mail, chunk)
+                with self._lock:
+                    self.db.execute("BEGIN")
+                    try:
+                        for msg in messages:
+                            self.db.execute(
+                                "INSERT OR IGNORE INTO messages (mailbox, uid, sender, subject, date, date_epoch, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (self.mailbox, int(msg["uid"]), msg["sender"], msg["subject"], msg["date"], msg["date_epoch"], msg["body"]))
+                        # Progress is saved per batch, so an interrupted sync resumes where it stopped
+                        self.db.execute("UPDATE sync_state SET last_uid = MAX(last_uid, ?) WHERE mailbox = ?",
+                                        (max(int(u) for u in chunk), self.mailbox))
+                        self.db.execute("COMMIT")
+                    except Exception:
+                        self.db.execute("ROLLBACK")
+                        raise
+                added += len(messages)
+
+            with self._lock:
+                self.db.execute("UPDATE sync_state SET last_uid = MAX(last_uid, ?), synced_at = ? WHERE mailbox = ?",
+                                (last_uid, time.time(), self.mailbox))
+                if self.state()["covers_since"] is None:
+                    # Initial sync was capped: coverage starts at the oldest message we have
+                    self.db.execute(
+                        "UPDATE sync_state SET covers_since = (SELECT MIN(date_epoch) FROM messages WHERE mailbox = ?) WHERE mailbox = ?",
+                        (self.mailbox, self.mailbox))
+            return added
+        finally:
+            self._sync_lock.release()
+
+    def _uidvalidity(self, mail):
+        # Sent with the SELECT response; ask with STATUS if it is no longer around
+        typ, data = mail.response("UIDVALIDITY")
+        if data and data[-1]:
+            return int(data[-1])
+        typ, data = mail.status(self.mailbox, "(UIDVALIDITY)")
+        return int(re.search(rb"UIDVALIDITY (\d+)", data[0]).group(1))
+
+    def _prune(self, mail, search, last_uid):
+        with self._lock:
+            first = self.db.execute("SELECT MIN(uid) FROM messages WHERE mailbox = ?", (self.mailbox,)).fetchone()[0]
+        if first is None:
+            return
+        present = {int(u) for u in search(mail, f"UID {first}:{last_uid}")}
+        with self._lock:
+            cached = [row[0] for row in self.db.execute("SELECT uid FROM messages WHERE mailbox = ?", (self.mailbox,))]
+            gone = [uid for uid in cached if uid not in present]
+            if gone:
+                self.db.executemany("DELETE FROM messages WHERE mailbox = ? AND uid = ?", [(self.mailbox, uid) for uid in gone])
+
+    def query(self, sender=None, subject=None, since=None, text=None, limit=5, with_body=False, body_words=None):
+        """
+        Cached messages matching the filters: the `limit` newest ones, oldest first (like the
+        IMAP path), or with `text` the `limit` best full-text matches, best first.
+        `body_words` keeps only messages whose body has at least one of the words.
+        """
+        columns = "m.uid, m.sender, m.subject, m.date, m.date_epoch" + (", m.body" if with_body else "")
+        where, params = ["m.mailbox = ?"], [self.mailbox]
+        if sender:
+            where.append("m.sender LIKE ? ESCAPE '\\'")
+            params.append(_like(sender))
+        if subject:
+            where.append("m.subject LIKE ? ESCAPE '\\'")
+            params.append(_like(subject))
+        if since is not None:
+            where.append("m.date_epoch >= ?")
+            params.append(since)
+        if body_words and self.fts:
+            where.append("m.id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            params.append("body : (" + " OR ".join(f'"{w}"*' for w in body_words) + ")")
+        elif body_words:
+            where.append("(" + " OR ".join("m.body LIKE ? ESCAPE '\\'" for _ in body_words) + ")")
+            params += [_like(w) for w in body_words]
+
+        ranked = bool(text and fts_query(text))
+        if ranked and self.fts:
+            sql = (f"SELECT {columns} FROM messages_fts f JOIN messages m ON m.id = f.rowid "
+                   f"WHERE messages_fts MATCH ? AND {' AND '.join(where)} "
+                   f"ORDER BY bm25(messages_fts, 5.0, 2.0, 1.0), m.date_epoch DESC LIMIT ?")
+            params = [fts_query(text)] + params + [limit]
+        else:
+            if ranked:
+                words = re.findall(r"\w+", text.lower())
+                where.append("(" + " OR ".join("(m.subject LIKE ? ESCAPE '\\' OR m.body LIKE ? ESCAPE '\\')" for _ in words) + ")")
+                for word in words:
+                    params += [_like(word), _like(word)]
+            sql = f"SELECT {columns} FROM messages m WHERE {' AND '.join(where)} ORDER BY m.date_epoch DESC, m.uid DESC LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = [dict(row) for row in self.db.execute(sql, params)]
+        return rows if ranked else rows[::-1]
+
+    def get(self, uid):
+        with self._lock:
+            row = self.db.execute("SELECT * FROM messages WHERE mailbox = ? AND uid = ?", (self.mailbox, int(uid))).fetchone()
+        return dict(row) if row else None
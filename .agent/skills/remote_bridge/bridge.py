@@ -9,6 +9,8 @@ from datetime import datetime
 # REMOTE_BRIDGE_URL should be the full URL to your FastAPI server (e.g. via Ngrok)
 BASE_URL = os.getenv("REMOTE_BRIDGE_URL", "http://localhost:8000")
 AUTH_TOKEN = os.getenv("BRIDGE_SECRET_KEY", "default-secret-key")
+# Seconds the server may hold /get-task open waiting for a task (long-poll)
+LONG_POLL_WAIT = float(os.getenv("LONG_POLL_WAIT", "25"))
 
 def log(message):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
@@ -74,11 +76,13 @@ def sync_loop():
     
     while True:
         try:
-            # 1. Poll for a new command
+            # 1. Wait for a new command (server holds the request until one arrives)
+            poll_started = time.time()
             response = requests.get(
                 f"{BASE_URL}/get-task", 
+                params={"wait": LONG_POLL_WAIT},
                 headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                timeout=10
+                timeout=LONG_POLL_WAIT + 10
             )
             
             if response.status_code == 200:
@@ -99,9 +103,15 @@ def sync_loop():
                         headers={"Authorization": f"Bearer {AUTH_TOKEN}"}
                     )
                     log(f"✅ Task {task_id} completed and reported.")
+                    continue
             
             elif response.status_code != 204: # 204 No Content is expected when no task
                 log(f"⚠️ Server returned status {response.status_code}")
+            
+            # Empty long-poll: go straight back to waiting unless the server answered
+            # instantly (no long-poll support), in which case fall back to 5s polling.
+            if time.time() - poll_started >= 1:
+                continue
                 
         except requests.exceptions.ConnectionError:
             log("❌ Connection Error: Is the FastAPI server running?")
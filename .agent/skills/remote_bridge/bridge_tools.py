@@ -9,16 +9,18 @@ load_dotenv()
 BASE_URL = os.getenv("REMOTE_BRIDGE_URL", "http://localhost:8000")
 AUTH_TOKEN = os.getenv("BRIDGE_SECRET_KEY", "default-secret-key")
 
-def fetch_next_task():
+def fetch_next_task(wait=0):
     """
     Fetches the next pending message from the bridge server.
     Used by the Antigravity Agent to check for remote instructions.
+    With wait > 0 the server holds the request open until a task arrives.
     """
     try:
         response = requests.get(
             f"{BASE_URL}/get-task", 
+            params={"wait": wait},
             headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-            timeout=5
+            timeout=wait + 5
         )
         if response.status_code == 200:
             return response.json() # Returns {id, instruction, sender, source}
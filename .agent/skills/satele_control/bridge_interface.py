@@ -9,12 +9,14 @@ load_dotenv()
 BASE_URL = os.getenv("REMOTE_BRIDGE_URL", "http://localhost:8000")
 AUTH_TOKEN = os.getenv("BRIDGE_SECRET_KEY", "default-secret-key")
 
-def check_task():
+def check_task(wait=0):
+    # wait > 0 asks the server to hold the request until a task arrives (long-poll)
     try:
         response = requests.get(
             f"{BASE_URL}/get-task", 
+            params={"wait": wait},
             headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-            timeout=5
+            timeout=wait + 5
         )
         if response.status_code == 200:
             task = response.json()
@@ -44,13 +46,14 @@ def reply_task(task_id, message):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: check | reply <id> <msg>")
+        print("Usage: check [wait_seconds] | reply <id> <msg>")
         sys.exit(1)
         
     cmd = sys.argv[1]
     
     if cmd == "check":
-        check_task()
+        wait = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+        check_task(wait)
     elif cmd == "reply":
         if len(sys.argv) < 4:
             print("Usage: reply <id> <msg>")
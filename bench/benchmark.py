@@ -0,0 +1,324 @@
+"""
+Benchmark - End-to-end latency and throughput of the bridge + monitor, fully offline
+Starts server/main.py and brain/monitor.py (monitor_loop) as subprocesses, with the
+Node.js WhatsApp bridge and the Gemini/Ollama APIs replaced by local fakes with
+injectable latency (see fakes.py), then replays a corpus of messages against
+/webhook/message.
+
+    python3 bench/benchmark.py --messages 200 --concurrency 20 --llm-latency 300
+    python3 bench/benchmark.py --provider ollama --workers 4 --corpus my_messages.txt --json bench_output.txt
+
+Every message gets its own sender, so its latency is measured from the webhook POST to
+the last reply the fake Node bridge received for that sender. The report has p50/p95/p99
+end-to-end latency, tasks per second, peak RSS of both processes, and the mean of each
+stage from the bridge's /metrics. The monitor's state (token usage, sessions, memory DB)
+goes to a scratch directory, not to the real install, and it embeds with a stub model
+(stubs/sentence_transformers.py). A run whose monitor logged memory or embedding errors
+fails instead of reporting timings of the failure path.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fakes import Latency, FakeNodeBridge, FakeGemini, FakeOllama
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.txt")
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+# Monitor log lines that mean memory or embeddings failed, so their stage timings are meaningless
+MONITOR_ERRORS = re.compile(r"Memory flush failed|Memory Init Warning|Memory Save Error|Memory maintenance error|"
+                            r"Context error|Embedding (?:model|service) unavailable|Skill indexer unavailable")
+AUTH_HEADERS = {"Authorization": "Bearer default-secret-key"}
+
+
+def load_corpus(path):
+    with open(path, "r") as f:
+        messages = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    if not messages:
+        raise SystemExit(f"❌ Empty corpus: {path}")
+    return messages
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def rss_mb(pid):
+    """Resident memory of a process in MB (Linux /proc, else psutil if installed), or None."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+
+class MemorySampler:
+    def __init__(self, processes, interval=0.5):
+        self.processes = processes   # name -> Popen
+        self.interval = interval
+        self.peak = {}
+        self.last = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        for name, proc in self.processes.items():
+            value = rss_mb(proc.pid)
+            if value is not None:
+                self.last[name] = value
+                self.peak[name] = max(self.peak.get(name, 0), value)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def stage_means(metrics_text):
+    """Mean seconds per stage from the satele_stage_duration_seconds histogram."""
+    sums, counts = {}, {}
+    for match in re.finditer(r'^satele_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', metrics_text, re.M):
+        kind, stage, value = match.groups()
+        (sums if kind == "sum" else counts)[stage] = float(value)
+    return {stage: sums.get(stage, 0) / count for stage, count in counts.items() if count}
+
+
+def wait_for(check, timeout, interval=0.2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if check():
+            return True
+        time.sleep(interval)
+    return False
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.state_dir = tempfile.mkdtemp(prefix="satele-bench-")
+        self.bridge_url = f"http://127.0.0.1:{args.bridge_port}"
+        self.node = FakeNodeBridge(args.node_port, Latency(args.node_latency))
+        llm_latency = Latency(args.llm_latency, args.llm_jitter)
+        self.gemini = FakeGemini(0, llm_latency, reply=args.llm_reply)
+        self.ollama = FakeOllama(0, llm_latency, reply=args.llm_reply)
+        self.processes = {}
+        self._logs = []
+        self.monitor_errors = []
+
+    def _spawn(self, name, script, env):
+        log_file = open(os.path.join(self.state_dir, f"{name}.log"), "w")
+        self._logs.append(log_file)
+        self.processes[name] = subprocess.Popen(
+            [sys.executable, script], cwd=PROJECT_ROOT, env={**os.environ, **env},
+            stdout=log_file, stderr=subprocess.STDOUT,
+        )
+
+    def start(self):
+        for fake in (self.node, self.gemini, self.ollama):
+            fake.start()
+        self._spawn("server", os.path.join("server", "main.py"), {
+            "BRIDGE_PORT": str(self.args.bridge_port),
+            "NODE_BRIDGE_URL": self.node.url,
+        })
+        if not wait_for(self._bridge_up, 30):
+            raise SystemExit(f"❌ Bridge did not start, see {self.state_dir}/server.log")
+        self._spawn("monitor", os.path.join("brain", "monitor.py"), {
+            "REMOTE_BRIDGE_URL": self.bridge_url,
+            "AI_PROVIDER": self.args.provider,
+            "GOOGLE_API_KEY": "bench-fake-key",
+            "GEMINI_BASE_URL": self.gemini.url,
+            "OLLAMA_HOST": self.ollama.url,
+            "SATELE_STATE_DIR": self.state_dir,
+            "MONITOR_WORKERS": str(self.args.workers),
+            "AI_CACHE_SIZE": "0" if self.args.no_response_cache else os.getenv("AI_CACHE_SIZE", "256"),
+            "LONG_POLL_WAIT": "5",
+            "PYTHONUNBUFFERED": "1",
+            # Offline stand-in for the embedding model (memory and skill search)
+            "PYTHONPATH": os.pathsep.join(p for p in (STUBS_DIR, os.getenv("PYTHONPATH")) if p),
+        })
+
+    def _bridge_up(self):
+        try:
+            return requests.get(f"{self.bridge_url}/", timeout=1).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def stop(self):
+        for proc in self.processes.values():
+            proc.terminate()
+        for proc in self.processes.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for log_file in self._logs:
+            log_file.close()
+        self.monitor_errors = self._scan_monitor_log()
+        for fake in (self.node, self.gemini, self.ollama):
+            fake.stop()
+        if self.args.keep_state:
+            print(f"📁 State and logs kept in {self.state_dir}")
+        else:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def _scan_monitor_log(self):
+        try:
+            with open(os.path.join(self.state_dir, "monitor.log"), errors="replace") as f:
+                return [line.rstrip() for line in f if MONITOR_ERRORS.search(line)]
+        except OSError:
+            return []
+
+    def send(self, sender, text):
+        started = time.time()
+        resp = requests.post(f"{self.bridge_url}/webhook/message", json={
+            "text": text, "sender": sender, "source": "whatsapp",
+        }, timeout=30)
+        resp.raise_for_status()
+        return started
+
+    def warm_up(self):
+        """Waits until the monitor answers (model loading, first connections) before timing."""
+        for i in range(self.args.warmup):
+            sender = f"bench-warmup-{i}"
+            self.send(sender, "satele warm up")
+            if not wait_for(lambda: self.node.last_reply(sender), self.args.timeout):
+                raise SystemExit(f"❌ Monitor did not answer the warm-up message, see {self.state_dir}/monitor.log")
+
+    def run(self, messages):
+        sent = {}   # sender -> webhook POST time
+        interval = 1 / self.args.rate if self.args.rate > 0 else 0
+        begin = time.time()
+
+        def submit(i):
+            if interval:
+                time.sleep(max(0, begin + i * interval - time.time()))
+            sender = f"bench-{i}"
+            sent[sender] = self.send(sender, messages[i % len(messages)])
+
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            list(executor.map(submit, range(self.args.messages)))
+
+        wait_for(lambda: self._idle(len(sent)), self.args.timeout)
+        latencies, finished = [], []
+        for sender, started in sent.items():
+            reply = self.node.last_reply(sender)
+            if reply:
+                latencies.append(reply[0] - started)
+                finished.append(reply[0])
+        elapsed = (max(finished) - begin) if finished else 0
+        return sorted(latencies), elapsed
+
+    def _idle(self, expected):
+        """All replies seen and nothing left queued, leased or waiting for delivery."""
+        replied = sum(1 for sender in list(self.node.replies) if sender and sender.startswith("bench-") and not sender.startswith("bench-warmup"))
+        if replied < expected:
+            return False
+        try:
+            stats = requests.get(f"{self.bridge_url}/stats", headers=AUTH_HEADERS, timeout=5).json()
+        except requests.RequestException:
+            return False
+        return stats["pending"] == 0 and stats["leased"] == 0 and stats["outbound"]["queued"] == 0
+
+    def metrics(self):
+        try:
+            return requests.get(f"{self.bridge_url}/metrics", headers=AUTH_HEADERS, timeout=5).text
+        except requests.RequestException:
+            return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the Satele bridge + monitor")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="text file, one message per line")
+    parser.add_argument("--messages", type=int, default=100, help="messages to send (the corpus is cycled)")
+    parser.add_argument("--concurrency", type=int, default=10, help="parallel webhook senders")
+    parser.add_argument("--rate", type=float, default=0, help="messages per second (0 = as fast as possible)")
+    parser.add_argument("--provider", choices=("gemini", "ollama"), default="gemini")
+    parser.add_argument("--workers", type=int, default=0, help="MONITOR_WORKERS for the monitor (0 = inline)")
+    parser.add_argument("--llm-latency", type=float, default=200, help="fake LLM latency, ms")
+    parser.add_argument("--llm-jitter", type=float, default=50, help="fake LLM latency jitter, +/- ms")
+    parser.add_argument("--llm-reply", default='echo "pong"', help="what the fake LLM answers")
+    parser.add_argument("--node-latency", type=float, default=5, help="fake Node bridge latency, ms")
+    parser.add_argument("--bridge-port", type=int, default=8765)
+    parser.add_argument("--node-port", type=int, default=8001)
+    parser.add_argument("--no-response-cache", action="store_true", help="disable the monitor's response cache")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed messages sent first")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for replies")
+    parser.add_argument("--keep-state", action="store_true", help="keep logs and monitor state")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    messages = load_corpus(args.corpus)
+    bench = Benchmark(args)
+    try:
+        bench.start()
+        sampler = MemorySampler(bench.processes)
+        sampler.start()
+        print(f"🔥 Warming up ({args.provider}, {args.workers or 'inline'} workers)...")
+        bench.warm_up()
+        print(f"🚀 Sending {args.messages} messages ({args.concurrency} concurrent)...")
+        latencies, elapsed = bench.run(messages)
+        sampler.stop()
+        stages = stage_means(bench.metrics())
+    finally:
+        bench.stop()
+
+    if bench.monitor_errors:
+        print(f"\n❌ The monitor logged {len(bench.monitor_errors)} memory/embedding errors, timings not reported:")
+        for line in bench.monitor_errors[:10]:
+            print(f"   {line}")
+        return 2
+
+    report = {
+        "messages": args.messages,
+        "completed": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)},
+        "rss_mb": {name: {"peak": round(sampler.peak.get(name, 0), 1), "end": round(sampler.last.get(name, 0), 1)}
+                   for name in bench.processes},
+        "stage_mean_ms": {stage: round(seconds * 1000, 1) for stage, seconds in sorted(stages.items())},
+    }
+
+    print(f"\n📊 {report['completed']}/{report['messages']} completed in {report['elapsed_s']}s "
+          f"({report['tasks_per_s']} tasks/s)")
+    print("⏱️ End-to-end: " + " ".join(f"{k}={v}ms" for k, v in report["latency_ms"].items()))
+    for name, rss in report["rss_mb"].items():
+        print(f"💾 {name}: peak {rss['peak']} MB, end {rss['end']} MB")
+    if report["stage_mean_ms"]:
+        print("🔬 Stages (mean): " + " ".join(f"{k}={v}ms" for k, v in report["stage_mean_ms"].items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["completed"] == report["messages"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Fakes - Local stand-ins for the services around Satele, with injectable latency
+- FakeNodeBridge: the Baileys send API of whatsapp_bridge.js (POST /send, /send-media);
+  records when each recipient got a reply
+- FakeGemini: generateContent / cachedContents of the Gemini REST API (google-genai SDK)
+- FakeOllama: /api/chat and /api/generate
+Each one is a ThreadingHTTPServer on a daemon thread (stdlib only).
+"""
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Latency:
+    """Delay added to every request: mean_ms +/- jitter_ms (uniform)."""
+
+    def __init__(self, mean_ms=0, jitter_ms=0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    def sleep(self):
+        delay = self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+def _estimate_tokens(payload):
+    return len(json.dumps(payload)) // 4 + 1
+
+
+class FakeService:
+    def __init__(self, port=0, latency=None, host="127.0.0.1"):
+        self.latency = latency or Latency()
+        self.requests = 0
+        self._lock = threading.Lock()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, payload):
+                with service._lock:
+                    service.requests += 1
+                service.latency.sleep()
+                status, response = service.handle(self.path, payload)
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    payload = {}
+                self._respond(payload)
+
+            def do_GET(self):
+                self._respond({})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, path, payload):
+        """Returns (status, json_body) for one request."""
+        raise NotImplementedError
+
+
+class FakeNodeBridge(FakeService):
+    def __init__(self, port=0, latency=None):
+        super().__init__(port, latency)
+        self.replies = {}   # recipient -> [(timestamp, text)]
+
+    def handle(self, path, payload):
+        if path not in ("/send", "/send-media"):
+            return 404, {"error": "not found"}
+        text = payload.get("text") or payload.get("caption") or ""
+        with self._lock:
+            self.replies.setdefault(payload.get("to"), []).append((time.time(), text))
+        return 200, {"status": "sent"}
+
+    def last_reply(self, recipient):
+        with self._lock:
+            replies = self.replies.get(recipient)
+            return replies[-1] if replies else None
+
+
+class FakeGemini(FakeService):
+    def __init__(self, port=0, latency=None, reply='echo "pong"'):
+        super().__init__(port, latency)
+        self.reply = reply
+
+    def handle(self, path, payload):
+        if "cachedContents" in path:
+            # Like a real prefix below the minimum cacheable size: the monitor sends it inline
+            return 400, {"error": {"code": 400, "message": "Cached content is too small (fake)", "status": "INVALID_ARGUMENT"}}
+        if ":generateContent" not in path:
+            return 404, {"error": {"code": 404, "message": f"Unknown path {path}", "status": "NOT_FOUND"}}
+        prompt_tokens = _estimate_tokens(payload)
+        output_tokens = len(self.reply) // 4 + 1
+        return 200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": self.reply}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens,
+            },
+        }
+
+
+class FakeOllama(FakeService):
+    def __init__(self, port=0, latency=None, reply='echo "pong"'):
+        super().__init__(port, latency)
+        self.reply = reply
+
+    def handle(self, path, payload):
+        usage = {"prompt_eval_count": _estimate_tokens(payload), "eval_count": len(self.reply) // 4 + 1}
+        if path == "/api/chat":
+            return 200, {"model": payload.get("model"), "message": {"role": "assistant", "content": self.reply}, "done": True, **usage}
+        if path == "/api/generate":
+            return 200, {"model": payload.get("model"), "response": self.reply, "done": True, **usage}
+        if path == "/api/tags":
+            return 200, {"models": []}
+        return 404, {"error": "not found"}
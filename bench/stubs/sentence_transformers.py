@@ -0,0 +1,29 @@
+"""
+Stub of sentence-transformers for the benchmark's monitor (put on its PYTHONPATH), so memory
+and skill search embed offline instead of downloading a model: deterministic pseudo-random
+unit vectors seeded by each text's hash, with the dimension of all-MiniLM-L6-v2.
+"""
+import hashlib
+
+import numpy as np
+
+DIMENSION = 384
+
+
+class SentenceTransformer:
+    def __init__(self, model_name_or_path=None, *args, **kwargs):
+        self.model_name = model_name_or_path
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        vectors = np.stack([self._vector(text) for text in ([sentences] if single else sentences)]) \
+            if sentences else np.zeros((0, DIMENSION), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+        return vector / np.linalg.norm(vector)
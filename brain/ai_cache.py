@@ -0,0 +1,121 @@
+"""
+AI Cache - Skips or shortens LLM calls in ai_interpret
+- ResponseCache: TTL + LRU cache of interpreted command lists, keyed on the
+  normalised instruction, CWD and skills version. Repeat intents ("what time is it")
+  never reach the LLM.
+- GeminiPrefixCache: registers the static part of the system prompt as Gemini
+  explicit cached content, so remaining calls only send the dynamic suffix.
+"""
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def normalize_instruction(instruction):
+    text = (instruction or "").lower().strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip(" ?!.")
+
+
+def make_key(*parts):
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, commands, tokens)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key):
+        """Returns (commands, tokens) or None."""
+        if not self.enabled: return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, commands, tokens = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return list(commands), tokens
+
+    def put(self, key, commands, tokens=0):
+        if not self.enabled or not commands: return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, list(commands), tokens)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class GeminiPrefixCache:
+    """
+    One explicit cached-content object per distinct prompt prefix.
+    Gemini rejects prefixes below the model's minimum cacheable size; such a prefix
+    is remembered as uncacheable and the caller falls back to sending it inline.
+    """
+
+    def __init__(self, client, model, ttl=3600, log=print):
+        self.client = client
+        self.model = model
+        self.ttl = ttl
+        self.log = log
+        self._lock = threading.Lock()
+        self._current = None      # (prefix_hash, cache_name, expires_at)
+        self._rejected = {}       # prefix_hash -> retry_after
+
+    def get(self, prefix_text):
+        """Returns the cached-content name for this prefix, creating it if needed, or None."""
+        if not self.client or self.ttl <= 0:
+            return None
+        prefix_hash = make_key(self.model, prefix_text)
+        now = time.time()
+        with self._lock:
+            if self._current and self._current[0] == prefix_hash and self._current[2] - 60 > now:
+                return self._current[1]
+            if self._rejected.get(prefix_hash, 0) > now:
+                return None
+            try:
+                from google.genai import types
+                cache = self.client.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=prefix_text,
+                        display_name="satele-interpret-prefix",
+                        ttl=f"{int(self.ttl)}s",
+                    ),
+                )
+            except Exception as e:
+                # Typically "cached content is too small"; don't retry this prefix for a while
+                self._rejected[prefix_hash] = now + self.ttl
+                self.log(f"ℹ️ Prompt prefix not cacheable, sending inline: {e}")
+                return None
+            old = self._current
+            self._current = (prefix_hash, cache.name, now + self.ttl)
+        if old and old[1] != cache.name:
+            self.invalidate(old[1], delete_only=True)
+        self.log(f"💾 Registered prompt prefix cache: {cache.name}")
+        return cache.name
+
+    def invalidate(self, name, delete_only=False):
+        """Forgets (and best-effort deletes) a cache entry, e.g. after it expired server-side."""
+        if not delete_only:
+            with self._lock:
+                if self._current and self._current[1] == name:
+                    self._current = None
+        try:
+            self.client.caches.delete(name=name)
+        except Exception:
+            pass
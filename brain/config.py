@@ -0,0 +1,21 @@
+"""
+Config - Numeric settings read from the environment
+An unset or malformed variable falls back to the default instead of failing at startup.
+"""
+import os
+
+
+def env_number(name, default):
+    """float(os.getenv(name)), or float(default) if unset or malformed."""
+    try:
+        return float(os.getenv(name, default))
+    except (ValueError, TypeError):
+        return float(default)
+
+
+def env_int(name, default):
+    """int(os.getenv(name)), or default if unset or malformed."""
+    try:
+        return int(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
@@ -0,0 +1,178 @@
+"""
+Embedding Service - One shared sentence-transformers model for the whole brain
+Used by Memory (remember/recall) and SkillIndexer, so a message costs at most one
+model pass per distinct text instead of one per component:
+- LRU cache of text -> vector (the same instruction is recalled, skill-searched and remembered)
+- Requests from concurrent threads arriving within a short window are encoded as one batch
+- The model (and torch) is only imported on load(), optionally on a background thread
+"""
+import os
+import time
+import queue
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+# Use a local cache for HuggingFace models to avoid permission issues
+HF_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "huggingface")
+os.makedirs(HF_CACHE, exist_ok=True)
+os.environ["HF_HOME"] = HF_CACHE
+
+# Suppress warnings
+warnings.filterwarnings('ignore')
+
+# Same model as ChromaDB's default embedding function, so existing memory vectors stay comparable.
+# After switching EMBED_MODEL, run `python3 brain/memory.py reindex` (with the monitor stopped).
+CHROMA_DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+MODEL_NAME = os.getenv("EMBED_MODEL", CHROMA_DEFAULT_MODEL)
+
+
+class EmbeddingService:
+    def __init__(self, model_name=MODEL_NAME, cache_size=2048, batch_window=0.005, max_batch=64):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.error = None
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._cache = OrderedDict()   # text -> float32 vector (L2-normalised)
+        self._cache_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._batcher = None
+        self._counters = {"hits": 0, "misses": 0, "batches": 0, "encoded": 0}
+
+    @property
+    def ready(self):
+        return self._model is not None
+
+    @property
+    def matches_chroma_default(self):
+        """True if Chroma's default embedding function computes the same vectors as this model."""
+        return self.model_name.split("/")[-1] == CHROMA_DEFAULT_MODEL
+
+    def load(self):
+        """Loads the model once (blocking; concurrent callers wait). Raises if it can't be loaded."""
+        with self._load_lock:
+            if self._model is None and self.error is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    start = time.time()
+                    self._model = SentenceTransformer(self.model_name)
+                    print(f"🧠 Embedding model {self.model_name} loaded in {time.time() - start:.1f}s")
+                except Exception as e:
+                    self.error = e
+                    print(f"⚠️ Embedding model unavailable: {e}")
+        if self._model is None:
+            raise RuntimeError(f"Embedding model unavailable: {self.error}")
+        return self._model
+
+    def start_loading(self):
+        """Loads the model on a daemon thread; use `ready` to check when it's done."""
+        def load():
+            try:
+                self.load()
+            except RuntimeError:
+                pass
+        threading.Thread(target=load, name="embedding-loader", daemon=True).start()
+
+    def embed(self, texts):
+        """float32 matrix (len(texts) x dim) of L2-normalised embeddings. Loads the model if needed."""
+        texts = list(texts)
+        vectors = [None] * len(texts)
+        missing = OrderedDict()   # text -> positions in `texts`
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                vector = self._cache.get(text)
+                if vector is not None:
+                    self._cache.move_to_end(text)
+                    vectors[i] = vector
+                else:
+                    missing.setdefault(text, []).append(i)
+            self._counters["hits"] += len(texts) - sum(len(p) for p in missing.values())
+            self._counters["misses"] += len(missing)
+
+        if missing:
+            encoded = self._encode_batched(list(missing))
+            with self._cache_lock:
+                for text, vector in zip(missing, encoded):
+                    self._cache[text] = vector
+                    self._cache.move_to_end(text)
+                    for i in missing[text]:
+                        vectors[i] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+    def stats(self):
+        with self._cache_lock:
+            return {"ready": self.ready, "cached": len(self._cache), **self._counters}
+
+    def _encode(self, texts):
+        model = self.load()
+        vectors = model.encode(texts, batch_size=self.max_batch, normalize_embeddings=True)
+        self._counters["batches"] += 1
+        self._counters["encoded"] += len(texts)
+        return list(np.asarray(vectors, dtype=np.float32))
+
+    def _encode_batched(self, texts):
+        if self.batch_window <= 0:
+            return self._encode(texts)
+        with self._cache_lock:
+            if self._batcher is None:
+                self._batcher = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+                self._batcher.start()
+        future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+
+    def _batch_loop(self):
+        while True:
+            pending = [self._requests.get()]
+            size = len(pending[0][0])
+            deadline = time.time() + self.batch_window
+            # Gather whatever else arrives within the window, up to max_batch texts
+            while size < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            unique = list(OrderedDict.fromkeys(t for texts, _ in pending for t in texts))
+            try:
+                by_text = dict(zip(unique, self._encode(unique)))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            for texts, future in pending:
+                future.set_result([by_text[t] for t in texts])
+
+
+# Global instance
+_embedding_service = None
+
+def get_embedding_service():
+    global _embedding_service
+    if _embedding_service is None:
+        try:
+            cache_size = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+            batch_window = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")) / 1000
+        except ValueError:
+            cache_size, batch_window = 2048, 0.005
+        _embedding_service = EmbeddingService(cache_size=cache_size, batch_window=batch_window)
+    return _embedding_service
@@ -24,13 +24,51 @@ pathlib.Path.stat = patched_path_stat
 
 import chromadb
 import uuid
+import time
+import atexit
 import datetime
+import threading
 import requests
+import re
 import json
+import math
 import platform
+from collections import defaultdict
+
+SUMMARY_MAX_CHARS = 2000
+
+# Hybrid recall: BM25 parameters, reciprocal-rank-fusion constant, prompt token estimate
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+CHARS_PER_TOKEN = 4
+STOP_WORDS = {"the", "and", "for", "with", "what", "how", "can", "you", "please", "from", "this", "that", "are", "was", "is", "me", "my", "it", "to", "a", "of", "in", "on"}
+
+def _epoch(iso_timestamp):
+    try:
+        return datetime.datetime.fromisoformat(iso_timestamp).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+def _as_epoch(value):
+    """Epoch seconds from a number, a datetime or an ISO string"""
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return _epoch(value)
+    return float(value)
+
+def _tokens(text, unique=False):
+    tokens = [t for t in re.findall(r"\w+", (text or "").lower()) if len(t) > 1 and t not in STOP_WORDS]
+    return list(dict.fromkeys(tokens)) if unique else tokens
+
+def _estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
 
 class Memory:
-    def __init__(self, db_path="satele_memory", silent=False):
+    def __init__(self, db_path="satele_memory", silent=False, embedder=None,
+                 write_behind=False, batch_size=32, flush_interval=2.0,
+                 retention_days=0, max_entries=0, compact_after_days=0):
         # Make path relative to this file's dir
         base_dir = os.path.dirname(os.path.abspath(__file__))
         full_path = os.path.join(base_dir, db_path)
@@ -38,10 +76,58 @@ class Memory:
         if not silent: print(f"🧠 Initializing Memory at {full_path}...")
         self.client = chromadb.PersistentClient(path=full_path)
         self.collection = self.client.get_or_create_collection(name="satele_logs")
+        self._backfill_once()
+        # Shared EmbeddingService; None = let Chroma embed with its default model
+        self.embedder = embedder
+
+        # Retention (0 = keep forever / unlimited / never compact), applied by maintain()
+        self.retention_days = retention_days
+        self.max_entries = max_entries
+        self.compact_after_days = compact_after_days
+
+        # Write-behind buffer: remember() only queues, a background thread embeds and adds
+        # entries in batches of `batch_size` or every `flush_interval` seconds
+        self.write_behind = write_behind
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending = []               # (document, metadata, id)
+        self._pending_cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closing = False
+        self._writer = None
+        if write_behind:
+            self._writer = threading.Thread(target=self._writer_loop, name="memory-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _chroma_can_embed(self):
+        """Chroma's default embedding function gives the same vectors as the shared model"""
+        return self.embedder is None or getattr(self.embedder, "matches_chroma_default", False)
+
+    def _embed(self, texts):
+        """
+        Vectors from the shared model, or None to let Chroma embed the text itself. Chroma only
+        stands in (while the model loads, or if it fails) when it runs the same model; a custom
+        EMBED_MODEL is waited for instead, so every vector in the collection is from one model.
+        """
+        if not self.embedder:
+            return None
+        if not self._chroma_can_embed():
+            return self.embedder.embed(texts).tolist()   # loads the model first; raises if unavailable
+        if not self.embedder.ready:
+            return None
+        try:
+            return self.embedder.embed(texts).tolist()
+        except Exception:
+            return None
 
     def get_count(self):
         return self.collection.count()
 
+    def pending(self):
+        with self._pending_cond:
+            return len(self._pending)
+
     def remember(self, text, role="user", metadata=None):
         if not text: return
         meta = metadata or {}
@@ -52,42 +138,342 @@ class Memory:
             if v is None: clean_meta[k] = ""
             else: clean_meta[k] = str(v)
             
-        clean_meta["timestamp"] = datetime.datetime.now().isoformat()
+        now = datetime.datetime.now()
+        clean_meta["timestamp"] = now.isoformat()
+        clean_meta["timestamp_epoch"] = now.timestamp()
         clean_meta["role"] = role
+        # Partition keys: recall() can be limited to one sender and/or working directory
+        clean_meta.setdefault("sender", "")
         
+        if not self.write_behind:
+            self._add([text], [clean_meta], [str(uuid.uuid4())])
+            return
+        with self._pending_cond:
+            self._pending.append((text, clean_meta, str(uuid.uuid4())))
+            if len(self._pending) >= self.batch_size:
+                self._pending_cond.notify()
+
+    def _add(self, documents, metadatas, ids):
+        embeddings = self._embed(documents)
         self.collection.add(
-            documents=[text],
-            metadatas=[clean_meta],
-            ids=[str(uuid.uuid4())]
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids,
+            **({"embeddings": embeddings} if embeddings else {})
         )
 
-    def recall(self, query_text, n_results=5):
+    def flush(self):
+        """Writes all buffered entries now (one batched add). Returns how many were written."""
+        with self._flush_lock:
+            with self._pending_cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            documents, metadatas, ids = (list(x) for x in zip(*batch))
+            try:
+                self._add(documents, metadatas, ids)
+            except Exception as e:
+                print(f"⚠️ Memory flush failed, {len(batch)} entries lost: {e}")
+                return 0
+            return len(batch)
+
+    def _writer_loop(self):
+        while True:
+            with self._pending_cond:
+                while not self._pending and not self._closing:
+                    self._pending_cond.wait()
+                if self._closing:
+                    return
+                # Collect more entries until the batch is full or the window closes
+                deadline = time.time() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closing:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._pending_cond.wait(remaining)
+            self.flush()
+
+    def close(self):
+        """Stops the background writer and flushes whatever is still buffered."""
+        with self._pending_cond:
+            self._closing = True
+            self._pending_cond.notify_all()
+        if self._writer and self._writer is not threading.current_thread():
+            self._writer.join(timeout=10)
+        self.flush()
+
+    def _build_where(self, sender=None, cwd=None, role=None, since=None, until=None, where=None):
+        """Chroma metadata filter for recall(); applied inside the query, before the vector search."""
+        conditions = []
+        if sender is not None:
+            conditions.append({"sender": {"$in": [str(sender), ""]}})
+        if cwd is not None:
+            conditions.append({"cwd": str(cwd)})
+        if role is not None:
+            conditions.append({"role": {"$in": list(role)}} if isinstance(role, (list, tuple, set)) else {"role": role})
+        if since is not None:
+            conditions.append({"timestamp_epoch": {"$gte": _as_epoch(since)}})
+        if until is not None:
+            conditions.append({"timestamp_epoch": {"$lte": _as_epoch(until)}})
+        if where:
+            conditions.append(where)
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _keyword_hits(self, terms, where, limit):
+        """
+        BM25 over the entries that contain at least one query term (Chroma filters on
+        metadata and document text first). Returns [(id, score, document, metadata)], best first.
+        """
+        if not terms:
+            return []
+        # $contains is case-sensitive; cover the common spellings
+        variants = sorted({v for t in terms for v in (t, t.capitalize(), t.upper())})
+        where_document = {"$contains": variants[0]} if len(variants) == 1 else {"$or": [{"$contains": v} for v in variants]}
+        got = self.collection.get(where=where, where_document=where_document,
+                                  include=["documents", "metadatas"], limit=limit)
+        ids = got.get("ids") or []
+        if not ids:
+            return []
+        docs = got.get("documents") or [""] * len(ids)
+        metas = got.get("metadatas") or [{}] * len(ids)
+
+        tokenized = [_tokens(doc) for doc in docs]
+        n_docs = max(self.collection.count(), len(ids))
+        avg_len = sum(len(t) for t in tokenized) / len(tokenized) or 1.0
+        # Every document containing a term is in `got` (unless `limit` was hit), so df is exact
+        df = {t: sum(1 for toks in tokenized if t in toks) for t in terms}
+        hits = []
+        for entry_id, doc, meta, toks in zip(ids, docs, metas, tokenized):
+            score = 0.0
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * len(toks) / avg_len)
+            for t in terms:
+                tf = toks.count(t)
+                if tf:
+                    idf = math.log(1 + (n_docs - df[t] + 0.5) / (df[t] + 0.5))
+                    score += idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+            if score > 0:
+                hits.append((entry_id, score, doc, meta or {}))
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits
+
+    def search(self, query_text, n_results=5, sender=None, cwd=None, role=None, since=None, until=None,
+               where=None, keyword=True, recency_half_life_days=30, recency_weight=0.3, candidates=None):
+        """
+        Hybrid search: vector and BM25 keyword rankings fused with reciprocal rank fusion,
+        then re-ranked by recency (an entry `recency_half_life_days` old keeps
+        1 - recency_weight/2 of its score). Filters (sender/cwd/role/since/until/where)
+        are applied by Chroma before either search.
+        Returns [{"id", "document", "metadata", "score"}], best first.
+        """
         if not query_text: return []
-        try:
+        where = self._build_where(sender, cwd, role, since, until, where)
+        pool = candidates or max(n_results * 4, 20)
+
+        embeddings = None
+        if self._chroma_can_embed() or self.embedder.ready:
+            embeddings = self._embed([query_text])
+        if embeddings:
+            results = self.collection.query(query_embeddings=embeddings, n_results=pool, where=where)
+        elif not self._chroma_can_embed():
+            # Custom model still loading: keyword ranking only, rather than wait on the reply path
+            results = {}
+        else:
             results = self.collection.query(
                 query_texts=[query_text],
-                n_results=n_results
+                n_results=pool,
+                where=where
             )
-            
-            # Use 'get' to safely access list inside structure
-            docs = results.get('documents', [[]])[0]
-            metas = results.get('metadatas', [[]])[0]
+        entries = {}
+        fused = defaultdict(float)
+        # Use 'get' to safely access list inside structure
+        ids = (results.get('ids') or [[]])[0]
+        docs = (results.get('documents') or [[]])[0]
+        metas = (results.get('metadatas') or [[]])[0]
+        for rank, (entry_id, doc, meta) in enumerate(zip(ids, docs, metas)):
+            entries[entry_id] = (doc, meta or {})
+            fused[entry_id] += 1.0 / (RRF_K + rank + 1)
+
+        if keyword:
+            for rank, (entry_id, _, doc, meta) in enumerate(self._keyword_hits(_tokens(query_text, unique=True), where, pool * 5)[:pool]):
+                entries.setdefault(entry_id, (doc, meta))
+                fused[entry_id] += 1.0 / (RRF_K + rank + 1)
+
+        now = time.time()
+        scored = []
+        for entry_id, score in fused.items():
+            doc, meta = entries[entry_id]
+            if recency_half_life_days and recency_weight:
+                age_days = max(0.0, now - float(meta.get("timestamp_epoch") or _epoch(meta.get("timestamp")))) / 86400
+                decay = 0.5 ** (age_days / recency_half_life_days)
+                score *= (1 - recency_weight) + recency_weight * decay
+            scored.append({"id": entry_id, "document": doc, "metadata": meta, "score": score})
+        scored.sort(key=lambda h: h["score"], reverse=True)
+        return scored[:n_results]
+
+    def recall(self, query_text, n_results=5, sender=None, cwd=None, token_budget=None, **filters):
+        """
+        Formatted context lines for the prompt (see search() for the ranking and filters).
+        `sender` limits results to that sender's entries plus shared ones with no sender.
+        With `token_budget`, lines are added best-first until ~token_budget tokens are used.
+        """
+        if not query_text: return []
+        try:
+            hits = self.search(query_text, n_results=n_results, sender=sender, cwd=cwd, **filters)
             
             context_lines = []
-            if not docs: return []
-            
-            for i, doc in enumerate(docs):
-                ts = metas[i].get("timestamp", "")[:16].replace("T", " ")
-                role = metas[i].get("role", "unknown")
-                cwd = metas[i].get("cwd", "?")
+            used_tokens = 0
+            for hit in hits:
+                meta = hit["metadata"]
+                ts = meta.get("timestamp", "")[:16].replace("T", " ")
+                role = meta.get("role", "unknown")
+                entry_cwd = meta.get("cwd", "?")
                 # Format: [Date] (Role) CWD -> Content
-                context_lines.append(f"[{ts}] ({role}) CWD:{cwd} -> {doc}")
+                line = f"[{ts}] ({role}) CWD:{entry_cwd} -> {hit['document']}"
+                if token_budget:
+                    remaining = token_budget - used_tokens
+                    if remaining <= 0:
+                        break
+                    if _estimate_tokens(line) > remaining:
+                        line = line[:remaining * CHARS_PER_TOKEN] + "..."
+                    used_tokens += _estimate_tokens(line)
+                context_lines.append(line)
                 
             return context_lines
         except Exception as e:
             # print(f"Query Error: {e}")
             return []
 
+    # --- Retention & compaction ---
+
+    def _all_metadata(self, page_size=1000):
+        """[(id, metadata)] for the whole collection, read in pages."""
+        entries = []
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            ids = page.get("ids") or []
+            entries.extend(zip(ids, page.get("metadatas") or [{}] * len(ids)))
+            if len(ids) < page_size:
+                return entries
+            offset += page_size
+
+    def replace_collection(self, collection):
+        """Swaps in `collection` (e.g. a re-embedded copy) under this store's name; the old one is dropped."""
+        name = self.collection.name
+        self.collection.modify(name=f"{name}_old")
+        collection.modify(name=name)
+        self.client.delete_collection(f"{name}_old")
+        self.collection = self.client.get_collection(name)
+
+    def _delete(self, ids):
+        for i in range(0, len(ids), 500):
+            self.collection.delete(ids=ids[i:i + 500])
+
+    def _backfill(self, entries):
+        """
+        Entries written before partitioning: shared (no sender), epoch from the ISO timestamp.
+        Updates `entries` ([(id, metadata)]) in place; returns how many were backfilled.
+        """
+        legacy = []
+        for i, (entry_id, meta) in enumerate(entries):
+            meta = dict(meta or {})
+            if "timestamp_epoch" in meta and "sender" in meta:
+                continue
+            meta.setdefault("timestamp_epoch", _epoch(meta.get("timestamp")))
+            meta.setdefault("sender", "")
+            entries[i] = (entry_id, meta)
+            legacy.append((entry_id, meta))
+        for i in range(0, len(legacy), 500):
+            chunk = legacy[i:i + 500]
+            self.collection.update(ids=[e[0] for e in chunk], metadatas=[e[1] for e in chunk])
+        return len(legacy)
+
+    def _backfill_once(self):
+        """
+        Backfills an existing collection when it is first opened, so recall(sender=...) (which
+        filters on sender) sees legacy entries right away. Recorded in the collection metadata.
+        """
+        metadata = dict(self.collection.metadata or {})
+        if metadata.get("partitioned"):
+            return
+        if self.collection.count():
+            self._backfill(self._all_metadata())
+        try:
+            # The index settings (hnsw:*) can't be passed again on modify
+            metadata = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+            self.collection.modify(metadata={**metadata, "partitioned": True})
+        except Exception:
+            pass   # checked (and found done) again on the next start
+
+    def maintain(self):
+        """
+        Bounds the collection: backfills partition metadata on legacy entries, merges entries
+        older than compact_after_days into one summary per (sender, cwd, day), deletes entries
+        older than retention_days, then the oldest ones beyond max_entries.
+        """
+        self.flush()
+        stats = {"backfilled": 0, "compacted": 0, "summaries": 0, "expired": 0, "trimmed": 0}
+        entries = self._all_metadata()
+
+        stats["backfilled"] = self._backfill(entries)
+
+        now = time.time()
+        if self.compact_after_days > 0:
+            cutoff = now - self.compact_after_days * 86400
+            groups = defaultdict(list)
+            for entry_id, meta in entries:
+                if meta.get("role") != "summary" and meta.get("timestamp_epoch", 0) < cutoff:
+                    day = datetime.datetime.fromtimestamp(meta["timestamp_epoch"]).date().isoformat()
+                    groups[(meta.get("sender", ""), meta.get("cwd", ""), day)].append(entry_id)
+            for (sender, cwd, day), ids in groups.items():
+                if len(ids) < 2:
+                    continue
+                self._compact_group(sender, cwd, day, ids)
+                stats["compacted"] += len(ids)
+                stats["summaries"] += 1
+            if stats["summaries"]:
+                entries = self._all_metadata()
+
+        if self.retention_days > 0:
+            cutoff = now - self.retention_days * 86400
+            expired = [e[0] for e in entries if e[1].get("timestamp_epoch", 0) < cutoff]
+            self._delete(expired)
+            stats["expired"] = len(expired)
+            expired = set(expired)
+            entries = [e for e in entries if e[0] not in expired]
+
+        if self.max_entries > 0 and len(entries) > self.max_entries:
+            entries.sort(key=lambda e: e[1].get("timestamp_epoch", 0))
+            oldest = [e[0] for e in entries[:len(entries) - self.max_entries]]
+            self._delete(oldest)
+            stats["trimmed"] = len(oldest)
+        return stats
+
+    def _compact_group(self, sender, cwd, day, ids):
+        """Replaces a group of old entries with one extractive summary entry."""
+        got = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        rows = sorted(zip(got.get("documents") or [], got.get("metadatas") or []),
+                      key=lambda r: r[1].get("timestamp_epoch", 0))
+        if not rows:
+            return
+        lines = [f"({meta.get('role', 'unknown')}) {' '.join(doc.split())[:200]}" for doc, meta in rows]
+        summary = f"Summary of {len(rows)} entries from {day}:\n" + "\n".join(lines)
+        if len(summary) > SUMMARY_MAX_CHARS:
+            summary = summary[:SUMMARY_MAX_CHARS - 3] + "..."
+        last = rows[-1][1]
+        meta = {
+            "role": "summary",
+            "sender": sender,
+            "cwd": cwd,
+            "timestamp": last.get("timestamp", ""),
+            "timestamp_epoch": last.get("timestamp_epoch", 0.0),
+            "entries": len(rows),
+        }
+        self._add([summary], [meta], [str(uuid.uuid4())])
+        self._delete(list(got.get("ids") or ids))
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == "status":
@@ -101,3 +487,23 @@ if __name__ == "__main__":
             # sys.stderr.write(f"Memory Error: {e}\n")
             # For the CLI, we want to know it failed
             print(f"ERROR: {e}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "maintain":
+        # Manual retention/compaction run, using the monitor's settings
+        m = Memory(
+            retention_days=float(os.getenv("MEMORY_RETENTION_DAYS", "90")),
+            max_entries=int(os.getenv("MEMORY_MAX_ENTRIES", "5000")),
+            compact_after_days=float(os.getenv("MEMORY_COMPACT_AFTER_DAYS", "7")),
+        )
+        print(json.dumps(m.maintain()))
+    elif len(sys.argv) > 1 and sys.argv[1] in ("export", "import", "reindex"):
+        from memory_tools import main
+
+        def open_memory(needs_model):
+            embedder = None
+            if needs_model:
+                from embedding_service import get_embedding_service
+                embedder = get_embedding_service()
+                embedder.load()
+            return Memory(silent=True, embedder=embedder)
+
+        main(open_memory, sys.argv[1:])
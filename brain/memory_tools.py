@@ -0,0 +1,232 @@
+"""
+Memory Tools - Bulk operations on the satele_memory Chroma store
+- export: streams every entry to JSONL (or Parquet, if pyarrow is installed)
+- import: loads an export in batches, embedding each batch with one model pass
+- reindex: re-embeds the whole collection in parallel batches into a new collection (e.g.
+  after a model change, even to another vector size) and swaps it in when done; an
+  interrupted run resumes where it stopped
+Usage: python3 brain/memory.py export|import|reindex ... (see --help)
+"""
+import os
+import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Collection the re-embedded entries are written to until reindex swaps it in
+REINDEX_SUFFIX = "_reindex"
+
+
+def _progress(label, done, total, started):
+    rate = done / max(time.time() - started, 1e-6)
+    pct = f" ({done * 100 // total}%)" if total else ""
+    sys.stderr.write(f"\r🔄 {label}: {done}/{total or '?'}{pct} - {rate:.0f}/s   ")
+    sys.stderr.flush()
+
+
+def _pages(collection, include, page_size):
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        if ids:
+            yield page
+        if len(ids) < page_size:
+            return
+        offset += page_size
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return "parquet" if path.endswith(".parquet") else "jsonl"
+
+
+def export_memory(memory, path, fmt=None, with_embeddings=False, page_size=500):
+    """Writes all entries as {"id", "document", "metadata"[, "embedding"]} records. Returns the count."""
+    memory.flush()
+    fmt = _detect_format(path, fmt)
+    include = ["documents", "metadatas"] + (["embeddings"] if with_embeddings else [])
+    total = memory.get_count()
+    started = time.time()
+    written = 0
+
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow), or use JSONL")
+        writer = None
+        try:
+            for page in _pages(memory.collection, include, page_size):
+                columns = {
+                    "id": page["ids"],
+                    "document": page["documents"],
+                    # JSON keeps the schema stable across entries with different metadata keys
+                    "metadata": [json.dumps(m or {}) for m in page["metadatas"]],
+                }
+                if with_embeddings:
+                    columns["embedding"] = [[float(x) for x in e] for e in page["embeddings"]]
+                table = pa.table(columns)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                written += len(page["ids"])
+                _progress("Exported", written, total, started)
+        finally:
+            if writer:
+                writer.close()
+    else:
+        out = sys.stdout if path == "-" else open(path, "w")
+        try:
+            for page in _pages(memory.collection, include, page_size):
+                for i, entry_id in enumerate(page["ids"]):
+                    record = {"id": entry_id, "document": page["documents"][i], "metadata": page["metadatas"][i] or {}}
+                    if with_embeddings:
+                        record["embedding"] = [float(x) for x in page["embeddings"][i]]
+                    out.write(json.dumps(record) + "\n")
+                written += len(page["ids"])
+                _progress("Exported", written, total, started)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    sys.stderr.write("\n")
+    return written
+
+
+def _read_records(path, fmt, batch_size):
+    """Yields lists of up to batch_size records from a JSONL or Parquet export."""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            rows = batch.to_pylist()
+            for row in rows:
+                row["metadata"] = json.loads(row.get("metadata") or "{}")
+            yield rows
+        return
+
+    source = sys.stdin if path == "-" else open(path, "r")
+    try:
+        batch = []
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def import_memory(memory, path, fmt=None, batch_size=256, keep_embeddings=False):
+    """
+    Upserts records from an export. Each batch is embedded with one model pass, unless
+    keep_embeddings is set and the records carry embeddings. Returns the count.
+    """
+    fmt = _detect_format(path, fmt)
+    started = time.time()
+    imported = 0
+    for batch in _read_records(path, fmt, batch_size):
+        ids = [r.get("id") or os.urandom(16).hex() for r in batch]
+        documents = [r.get("document") or "" for r in batch]
+        metadatas = [r.get("metadata") or {} for r in batch]
+        if keep_embeddings and all(r.get("embedding") for r in batch):
+            embeddings = [r["embedding"] for r in batch]
+        else:
+            embeddings = memory._embed(documents)
+        memory.collection.upsert(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            **({"embeddings": embeddings} if embeddings else {})
+        )
+        imported += len(batch)
+        _progress("Imported", imported, None, started)
+    sys.stderr.write("\n")
+    return imported
+
+
+def reindex_memory(memory, batch_size=256, workers=2, restart=False):
+    """
+    Re-embeds every entry with the current embedding model into a new collection, `workers`
+    batches at a time, then swaps it in for the old one (so the vector size may change).
+    The new collection doubles as the checkpoint: a rerun skips the entries already in it.
+    Returns the number of entries re-embedded in this run.
+    """
+    if not memory.embedder:
+        raise RuntimeError("reindex needs the embedding service")
+    memory.embedder.load()
+    memory.flush()
+    client, source = memory.client, memory.collection
+    target_name = f"{source.name}{REINDEX_SUFFIX}"
+    if restart:
+        try:
+            client.delete_collection(target_name)
+        except Exception:
+            pass
+    target = client.get_or_create_collection(name=target_name, metadata=dict(source.metadata or {}) or None)
+
+    done = {entry_id for page in _pages(target, [], 1000) for entry_id in page["ids"]}
+    if done:
+        sys.stderr.write(f"↩️ Resuming reindex, {len(done)} entries already done\n")
+    todo = [entry_id for page in _pages(source, [], 1000) for entry_id in page["ids"] if entry_id not in done]
+    total = len(todo)
+    started = time.time()
+    finished = 0
+
+    def reembed(ids):
+        got = source.get(ids=ids, include=["documents", "metadatas"])
+        vectors = memory.embedder.embed([doc or "" for doc in got["documents"]])
+        target.add(ids=got["ids"], documents=got["documents"], metadatas=got["metadatas"], embeddings=vectors.tolist())
+        return got["ids"]
+
+    batches = [todo[i:i + batch_size] for i in range(0, total, batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for ids in pool.map(reembed, batches):
+            finished += len(ids)
+            _progress("Reindexed", finished, total, started)
+    sys.stderr.write("\n")
+    memory.replace_collection(target)
+    return finished
+
+
+def main(memory_factory, argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="memory.py", description="Bulk tools for the Satele memory store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Stream all entries to JSONL or Parquet")
+    p.add_argument("path", help="Output file (.jsonl, .parquet, or - for stdout)")
+    p.add_argument("--format", choices=["jsonl", "parquet"])
+    p.add_argument("--with-embeddings", action="store_true", help="Include stored vectors")
+
+    p = sub.add_parser("import", help="Load an export, embedding in batches")
+    p.add_argument("path", help="Input file (.jsonl, .parquet, or - for stdin)")
+    p.add_argument("--format", choices=["jsonl", "parquet"])
+    p.add_argument("--batch", type=int, default=256)
+    p.add_argument("--keep-embeddings", action="store_true", help="Reuse vectors from the export instead of re-embedding")
+
+    p = sub.add_parser("reindex", help="Re-embed the whole collection with the current model")
+    p.add_argument("--batch", type=int, default=256)
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--restart", action="store_true", help="Discard the partial copy of an interrupted run")
+
+    args = parser.parse_args(argv)
+    needs_model = args.command == "reindex" or (args.command == "import" and not args.keep_embeddings)
+    memory = memory_factory(needs_model)
+
+    if args.command == "export":
+        count = export_memory(memory, args.path, args.format, args.with_embeddings)
+        sys.stderr.write(f"✅ Exported {count} entries\n")
+    elif args.command == "import":
+        count = import_memory(memory, args.path, args.format, args.batch, args.keep_embeddings)
+        sys.stderr.write(f"✅ Imported {count} entries\n")
+    elif args.command == "reindex":
+        count = reindex_memory(memory, args.batch, args.workers, restart=args.restart)
+        sys.stderr.write(f"✅ Reindexed {count} entries\n")
@@ -2,6 +2,8 @@ import os
 import sys
 import time
 import datetime
+import atexit
+import threading
 import subprocess
 import requests
 import json
@@ -53,9 +55,36 @@ else:
     # Fallback to current environment if config is missing
     load_dotenv() 
 
+# Where the monitor keeps its state (token usage, sessions, memory DB). Unset = the usual
+# install locations; the benchmark points it at a scratch directory.
+STATE_DIR = os.getenv("SATELE_STATE_DIR")
+if STATE_DIR:
+    os.makedirs(STATE_DIR, exist_ok=True)
+
+# One embedding model shared by memory and skill search, warmed up in the background
+try:
+    from embedding_service import get_embedding_service
+    embedder = get_embedding_service()
+    embedder.start_loading()
+except Exception as e:
+    log(f"⚠️ Embedding service unavailable: {e}")
+    embedder = None
+
 try:
     from memory import Memory
-    brain_memory = Memory()
+    # Writes are buffered and added in batches off the reply path (flushed on exit)
+    brain_memory = Memory(
+        db_path=os.path.join(STATE_DIR, "satele_memory") if STATE_DIR else "satele_memory",
+        embedder=embedder,
+        write_behind=True,
+        batch_size=int(os.getenv("MEMORY_BATCH_SIZE", "32")),
+        flush_interval=float(os.getenv("MEMORY_FLUSH_INTERVAL", "2")),
+        retention_days=float(os.getenv("MEMORY_RETENTION_DAYS", "90")),
+        max_entries=int(os.getenv("MEMORY_MAX_ENTRIES", "5000")),
+        compact_after_days=float(os.getenv("MEMORY_COMPACT_AFTER_DAYS", "7")),
+    )
+    # Upper bound on recalled context added to a prompt (~4 characters per token)
+    MEMORY_RECALL_TOKENS = int(os.getenv("MEMORY_RECALL_TOKENS", "600"))
 except Exception as e:
     print(f"⚠️ Memory Init Warning: {e}")
     brain_memory = None
@@ -66,6 +95,21 @@ if os.path.basename(os.getcwd()) == "brain":
     os.chdir("..")
     log(f"🏠 Set Project Root: {os.getcwd()}")
 
+# Per-sender sessions (cwd + env). The process CWD itself is never changed after startup.
+from session import SessionStore
+default_cwd = os.getcwd()
+try:
+    # Legacy single-session file: use it as the starting folder for new sessions
+    cwd_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".satele_cwd")
+    if os.path.exists(cwd_file):
+        with open(cwd_file, "r") as f:
+            last_wd = f.read().strip()
+        if os.path.isdir(last_wd):
+            default_cwd = last_wd
+except Exception as e:
+    log(f"⚠️ Failed to read legacy session: {e}")
+sessions = SessionStore(os.path.join(STATE_DIR or os.path.dirname(os.path.abspath(__file__)), ".satele_sessions.json"), default_cwd)
+
 # Environment variables loaded at top level
 
 
@@ -73,11 +117,22 @@ if os.path.basename(os.getcwd()) == "brain":
 BASE_URL = os.getenv("REMOTE_BRIDGE_URL", "http://localhost:8000")
 AUTH_TOKEN = os.getenv("BRIDGE_SECRET_KEY", "default-secret-key")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Alternative Gemini API endpoint (e.g. the local fake used by bench/benchmark.py)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 try:
     POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "2"))
 except (ValueError, TypeError):
     POLL_INTERVAL = 2
 if POLL_INTERVAL < 0.5: POLL_INTERVAL = 0.5 # Safety minimum
+# Long-poll: how long the bridge may hold /get-task open waiting for a task (0 = classic polling)
+try:
+    LONG_POLL_WAIT = float(os.getenv("LONG_POLL_WAIT", "25"))
+except (ValueError, TypeError):
+    LONG_POLL_WAIT = 25.0
+# Identity of this monitor when several consume from the same bridge, and the capability
+# tags it offers (e.g. MONITOR_TAGS=gmail on the host with the Gmail credentials)
+CONSUMER_ID = os.getenv("MONITOR_ID") or f"{platform.node()}-{os.getpid()}"
+MONITOR_TAGS = [t.strip().lower() for t in os.getenv("MONITOR_TAGS", "").split(",") if t.strip()]
 
 # Initialize Gemini if key is available
 client = None
@@ -85,7 +140,7 @@ gemini_model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 
 if GOOGLE_API_KEY:
     try:
-        client = genai.Client(api_key=GOOGLE_API_KEY)
+        client = genai.Client(api_key=GOOGLE_API_KEY, http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None)
         log(f"🧠 Using Gemini Model (genai SDK): {gemini_model_name}")
         log_brain = "🧠 AI Brain (Gemini v2) Active"
     except Exception as e:
@@ -98,7 +153,63 @@ else:
 
 log(f"🌍 Startup Environment: Provider={os.getenv('AI_PROVIDER')} | Bot={os.getenv('BOT_TRIGGER')}")
 
-def run_shell(cmd):
+# AI response cache (AI_CACHE_TTL=0 disables) and Gemini prompt-prefix caching (GEMINI_PREFIX_CACHE_TTL=0 disables)
+from google.genai import types as genai_types
+from ai_cache import ResponseCache, GeminiPrefixCache, normalize_instruction, make_key
+
+from config import env_int
+
+# Shell output streaming: progress pushed to WhatsApp every SHELL_PROGRESS_INTERVAL seconds (0 = off);
+# only the first SHELL_OUTPUT_HEAD and last SHELL_OUTPUT_TAIL characters of the output are kept.
+SHELL_PROGRESS_INTERVAL = env_int("SHELL_PROGRESS_INTERVAL", 10)
+SHELL_OUTPUT_HEAD = env_int("SHELL_OUTPUT_HEAD", 8000)
+SHELL_OUTPUT_TAIL = env_int("SHELL_OUTPUT_TAIL", 4000)
+
+# Skill catalogue: parsed once, then re-parsed per skill when its SKILL.md changes
+from skill_registry import SkillRegistry
+skill_registry = SkillRegistry(PROJECT_ROOT, poll_interval=env_int("SKILL_WATCH_INTERVAL", 5), log=log)
+skill_registry.start_watching()
+
+# Per-instruction skill ranking (top SKILL_TOP_K, 0 = always send the full catalogue).
+# The embedding model loads in the background; keyword ranking is used until it's warm.
+SKILL_TOP_K = env_int("SKILL_TOP_K", 5)
+skill_indexer = None
+if SKILL_TOP_K > 0:
+    try:
+        from skill_indexer import get_skill_indexer
+        skill_indexer = get_skill_indexer(PROJECT_ROOT, background=True, registry=skill_registry)
+        skill_registry.on_change(skill_indexer.refresh)
+    except Exception as e:
+        log(f"⚠️ Skill indexer unavailable, sending the full skill catalogue: {e}")
+
+# Token usage: accumulated in memory, merged into token_usage.json every USAGE_FLUSH_INTERVAL seconds
+from usage_tracker import UsageTracker
+usage_tracker = UsageTracker(os.path.join(STATE_DIR or PROJECT_ROOT, "token_usage.json"), flush_interval=env_int("USAGE_FLUSH_INTERVAL", 5), log=log)
+usage_tracker.start()
+
+response_cache = ResponseCache(max_entries=env_int("AI_CACHE_SIZE", 256), ttl=env_int("AI_CACHE_TTL", 3600))
+prefix_cache = GeminiPrefixCache(client, gemini_model_name, ttl=env_int("GEMINI_PREFIX_CACHE_TTL", 3600), log=log) if client else None
+
+from shell_stream import run_streaming
+from sandbox_kernel import KernelPool
+SANDBOX_STEP_TIMEOUT = env_int("SANDBOX_STEP_TIMEOUT", 35)
+# Independent probe scripts the model may run at once per agentic turn (1 = one script per turn)
+AGENTIC_PARALLEL = max(1, env_int("AGENTIC_PARALLEL", 3))
+from tracing import start_trace, end_trace, current_trace, stage as trace_stage, record_stage
+
+def send_status(task_id, msg):
+    """Pushes an intermediate message for a running task to the user."""
+    if not task_id: return
+    try:
+        requests.post(
+            f"{BASE_URL}/status-update",
+            json={"id": task_id, "message": msg},
+            headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
+            timeout=5
+        )
+    except: pass
+
+def run_shell(cmd, cwd=None, env=None, task_id=None):
     try:
         # Prevent dangerous or interactive commands
         if any(bad in cmd for bad in ["> /dev/sda", "rm -rf /", "mkfs"]):
@@ -111,118 +222,109 @@ def run_shell(cmd):
         elif cmd.strip().startswith("python"):
             cmd = cmd.replace("python", sys.executable, 1)
             
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=180)
-        return (result.stdout + result.stderr).strip() or "Success (No output)"
+        on_progress = None
+        if task_id and SHELL_PROGRESS_INTERVAL > 0:
+            label = cmd if len(cmd) < 60 else cmd[:60] + "..."
+            on_progress = lambda chunk, elapsed: send_status(task_id, f"⏳ **Still running** ({elapsed}s): {label}\n---\n{chunk.strip()}")
+
+        with trace_stage("shell"):
+            output, _ = run_streaming(cmd, cwd=cwd, env=env, timeout=180, on_progress=on_progress,
+                                      progress_interval=SHELL_PROGRESS_INTERVAL,
+                                      head_chars=SHELL_OUTPUT_HEAD, tail_chars=SHELL_OUTPUT_TAIL)
+        return output.strip() or "Success (No output)"
     except subprocess.TimeoutExpired:
         return "Error: Command timed out after 180 seconds. The task might be too complex or Malgus is still thinking."
     except Exception as e:
         return f"Execution Error: {str(e)}"
 
-def track_usage(response):
+def track_usage(response, site="interpret", sender=None, latency=None):
     """
     [v2.3] Centralized token usage tracking for Gemini responses.
+    Accumulated in memory and flushed to token_usage.json in the background.
     """
     try:
-        if not response or not hasattr(response, 'usage_metadata'):
-            return
-            
-        usage = response.usage_metadata
-        if usage:
-            t_in = usage.prompt_token_count
-            t_out = usage.candidates_token_count
-            t_total = usage.total_token_count
-            
-            # Use absolute path for token_usage.json to ensure consistency
-            usage_file = os.path.join(PROJECT_ROOT, "token_usage.json")
-            data = {"total": 0, "in": 0, "out": 0}
-            
-            if os.path.exists(usage_file):
-                with open(usage_file, "r") as f:
-                    try: 
-                        data = json.load(f)
-                    except: 
-                        pass
-            
-            data["total"] += t_total
-            data["in"] += t_in
-            data["out"] += t_out
-            
-            with open(usage_file, "w") as f:
-                json.dump(data, f)
+        usage = getattr(response, 'usage_metadata', None) if response else None
+        usage_tracker.record(
+            "gemini", gemini_model_name, site, sender,
+            tokens_in=usage.prompt_token_count if usage else 0,
+            tokens_out=usage.candidates_token_count if usage else 0,
+            total=usage.total_token_count if usage else 0,
+            # Prompt tokens served from an explicit/implicit Gemini context cache
+            cached_tokens=getattr(usage, "cached_content_token_count", 0) if usage else 0,
+            latency=latency,
+        )
     except Exception as e:
         log(f"Token tracking error: {e}")
 
-def get_skills_context(instruction=None):
-    # Temporarily bypass indexer due to slow model download
-    return get_skills_context_legacy()
-
-def get_skills_context_legacy():
-    """Legacy skill loading (fallback if indexer fails)"""
-    skills_dir = os.path.join(PROJECT_ROOT, ".agent", "skills")
-
-    if not os.path.exists(skills_dir):
-        log(f"⚠️ Skills directory not found: {skills_dir}")
-        return ""
-    
-    skills_context = "\n🚀 AVAILABLE SKILLS & CUSTOM SCRIPTS:\n"
-    found_any = False
-    
+def track_ollama_usage(resp_json, model_name, site, sender=None, latency=None):
     try:
-        for skill_name in os.listdir(skills_dir):
-            skill_path = os.path.join(skills_dir, skill_name, "SKILL.md")
-            if os.path.exists(skill_path):
-                with open(skill_path, "r") as f:
-                    content = f.read()
-                    desc = ""
-                    name = skill_name
-                    # Extract metadata from YAML-ish frontmatter
-                    for line in content.split("\n"):
-                        if line.startswith("description:"):
-                            desc = line.replace("description:", "").strip()
-                        if line.startswith("name:"):
-                            name = line.replace("name:", "").strip()
-                    
-                    # Extract ALL commands (look for python3 commands in backticks)
-                    # Match both inline and multiline code blocks
-                    all_matches = re.finditer(r'`(python3\s+[^`]+)`', content, re.MULTILINE)
-                    commands = []
-                    for match in all_matches:
-                        cmd_text = match.group(1).strip()
-                        # Ensure absolute paths for .agent/skills
-                        if ".agent/skills/" in cmd_text:
-                            cmd_text = cmd_text.replace(".agent/skills/", os.path.join(PROJECT_ROOT, ".agent/skills/"))
-                        elif "brain/" in cmd_text:
-                            cmd_text = cmd_text.replace("brain/", os.path.join(PROJECT_ROOT, "brain/"))
-                        commands.append(cmd_text)
-                    
-                    if desc and commands:
-                        skills_context += f"- {name}: {desc}\n"
-                        for c in commands:
-                            skills_context += f"  COMMAND: {c}\n"
-                        found_any = True
-                        log(f"📦 Loaded skill: {name} ({len(commands)} commands)")
+        usage_tracker.record(
+            "ollama", model_name, site, sender,
+            tokens_in=resp_json.get("prompt_eval_count") or 0,
+            tokens_out=resp_json.get("eval_count") or 0,
+            latency=latency,
+        )
     except Exception as e:
-        log(f"Error loading skills: {e}")
-    
-    if found_any:
-        log("✅ Loaded Skills Context with absolute paths.")
-    return skills_context if found_any else ""
+        log(f"Token tracking error: {e}")
+
+def track_cache(hit, tokens_saved=0):
+    if hit:
+        usage_tracker.increment(cache_hits=1, cache_tokens_saved=tokens_saved)
+    else:
+        usage_tracker.increment(cache_misses=1)
 
-def ai_interpret(instruction, media_path=None):
+def get_skills_context(instruction=None):
+    # Only the skills relevant to the instruction; the full catalogue (prebuilt by the
+    # skill registry) when there is no indexer or nothing matched
+    if instruction and skill_indexer:
+        try:
+            names = skill_indexer.search_ids(instruction, top_k=SKILL_TOP_K)
+            skills_str = skill_registry.get_context(names) if names else ""
+            if skills_str:
+                return skills_str
+        except Exception as e:
+            log(f"Skill search error: {e}")
+    return skill_registry.get_context()
+
+def ai_interpret(instruction, media_path=None, cwd=None, sender=None):
     """
     [v2.2] Uses Gemini or Ollama to translate natural language into a bash command.
     """
+    cwd = cwd or os.getcwd()
     # Load audio if present (Gemini only supports this via API, Ollama likely plain text)
     # We prepare content_parts but might not use it for Ollama
     
     username = os.getenv("USER", "User")
     home_dir = os.path.expanduser("~")
     
+    provider = os.getenv("AI_PROVIDER", "gemini").lower()
+    current_model = os.getenv("OLLAMA_MODEL", "gemma:2b") if provider == "ollama" else "gemini"
+    
+    # Get relevant skills using semantic search
+    with trace_stage("skill_context"):
+        skills_str = get_skills_context(instruction)
+    # The full catalogue is stable and belongs in the (cacheable) prefix; a per-instruction selection doesn't
+    static_skills = skills_str == skill_registry.get_context()
+    
+    # Response cache: a repeated text instruction in the same folder with the same skills
+    # gets the same commands back without asking the LLM again
+    cache_key = None
+    if not media_path and response_cache.enabled:
+        cache_key = make_key(normalize_instruction(instruction), cwd, make_key(skills_str), provider, current_model)
+        cached = response_cache.get(cache_key)
+        if cached:
+            commands, tokens = cached
+            log(f"⚡ Response cache hit ({len(commands)} commands, ~{tokens} tokens saved)")
+            track_cache(True, tokens)
+            return commands
+        track_cache(False)
+    
     # Context Retrieval
     context_str = ""
     if brain_memory:
         try:
-            hits = brain_memory.recall(instruction, n_results=3)
+            with trace_stage("memory_recall"):
+                hits = brain_memory.recall(instruction, n_results=3, sender=sender, token_budget=MEMORY_RECALL_TOKENS)
             if hits:
                 context_str = "\n\n🧠 Previous Relevant Context:\n" + "\n".join(hits)
         except Exception as e:
@@ -254,19 +356,18 @@ def ai_interpret(instruction, media_path=None):
     - User Home: {home_dir}
     - Downloads: {home_dir}/Downloads"""
         example_dest = f"{home_dir}/Downloads"
-    
-    # Get relevant skills using semantic search
-    skills_str = get_skills_context(instruction)
 
-    prompt_text = f"""
+    # Static prefix (identical across calls with the same skills) + per-call session suffix.
+    # For Gemini the prefix is registered as cached content when possible.
+    prompt_prefix = f"""
     You are an AI bridge. You translate natural language to safe bash commands.
     {env_context}
-    {skills_str}
+    {skills_str if static_skills else ""}
     
     CRITICAL RULES:
     1. Respond ONLY with safe bash commands, ONE PER LINE. No explanation. No markdown.
     2. USE ABSOLUTE PATHS for all scripts and tools mentioned in "AVAILABLE SKILLS".
-    3. YOUR CURRENT LOCATION (CWD): {os.getcwd()}
+    3. YOUR CURRENT LOCATION (CWD) is given in the SESSION section below.
     4. PRESERVE PATH CASE EXACTLY.
     5. FOCUS ON RELEVANCE: Generate commands ONLY for the current instruction. Do NOT include other skills (like trading monitor or status checks) unless explicitly asked in the instruction.
     6. IGNORE IRRELEVANT LOGS: If "Previous Relevant Context" contains unrelated tasks (like trading), ignore them. Only use context that helps fulfill the CURRENT instruction.
@@ -286,13 +387,20 @@ def ai_interpret(instruction, media_path=None):
     14. NO TOOL UPLOADING: NEVER use `UPLOAD:` on scripts located in `.agent/skills/`. If the user asks for a "result" or "help", they want the OUTPUT of the script, not the script file itself.
     
     CRITICAL FILE HANDLING RULES:
-    - If saving a file: `mv {media_path} <destination>`
+    - If saving a file: `mv <RECEIVED MEDIA FILE> <destination>`
     - To send a file: `UPLOAD:<filename>`
     - NEVER use `UPLOAD:` on a directory (like `UPLOAD:.` or `UPLOAD:/path/to/folder`). It MUST be a single file.
     - If a user asks to "send/summarize" something that a SKILL already handles, DO NOT add extra `UPLOAD:` commands. Trust the skill script to produce the correct output.
     - To find latest file: `echo "UPLOAD:$(find . -maxdepth 1 -type f -not -path '*/.*' -exec stat -f "%m %N" {{}} + | sort -rn | head -1 | cut -d' ' -f2- | xargs realpath)"`
+    """
+    prompt_session = f"""
+    SESSION:
+    - YOUR CURRENT LOCATION (CWD): {cwd}
+    - RECEIVED MEDIA FILE: {media_path}
+    {"" if static_skills else skills_str}
     {context_str}
     """
+    prompt_text = prompt_prefix + prompt_session
     
     content_parts = [f"INSTRUCTION: {instruction}"]
     
@@ -311,15 +419,13 @@ def ai_interpret(instruction, media_path=None):
         except Exception as e:
             log(f"Media upload error: {e}")
     
-    provider = os.getenv("AI_PROVIDER", "gemini").lower()
-    current_model = os.getenv("OLLAMA_MODEL", "gemma:2b") if provider == "ollama" else "gemini"
-    
     log(f"🧠 AI Provider: {provider} | Model: {current_model}")
     
     system_os = platform.system()
     
     
     text_response = ""
+    tokens_used = 0
     
     if provider == "ollama":
         try:
@@ -338,9 +444,14 @@ def ai_interpret(instruction, media_path=None):
             ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
             if not ollama_host.startswith("http"): ollama_host = f"http://{ollama_host}"
 
+            call_started = time.time()
             resp = requests.post(f"{ollama_host}/api/chat", json=payload, timeout=30)
             if resp.status_code == 200:
-                text_response = resp.json().get("message", {}).get("content", "").strip()
+                resp_json = resp.json()
+                track_ollama_usage(resp_json, model_name, "interpret", sender, time.time() - call_started)
+                record_stage("llm", time.time() - call_started)
+                text_response = resp_json.get("message", {}).get("content", "").strip()
+                tokens_used = (resp_json.get("prompt_eval_count") or 0) + (resp_json.get("eval_count") or 0)
             else:
                 log(f"Ollama Error: {resp.status_code} - {resp.text}")
                 return None
@@ -352,15 +463,34 @@ def ai_interpret(instruction, media_path=None):
     
     if provider == "gemini" or not text_response: # Fallback or direct Gemini
         try:
-            # Send everything to Gemini
-            total_prompt = [prompt_text] + content_parts
-            response = client.models.generate_content(
-                model=gemini_model_name,
-                contents=total_prompt
-            )
+            response = None
+            call_started = time.time()
+            cache_name = prefix_cache.get(prompt_prefix) if prefix_cache else None
+            if cache_name:
+                # Static prefix is served from Gemini's context cache; send only the session part
+                try:
+                    response = client.models.generate_content(
+                        model=gemini_model_name,
+                        contents=[prompt_session] + content_parts,
+                        config=genai_types.GenerateContentConfig(cached_content=cache_name)
+                    )
+                except Exception as e:
+                    log(f"⚠️ Cached prompt call failed ({e}), retrying inline")
+                    prefix_cache.invalidate(cache_name)
+                    response = None
+            if response is None:
+                # Send everything to Gemini
+                total_prompt = [prompt_text] + content_parts
+                response = client.models.generate_content(
+                    model=gemini_model_name,
+                    contents=total_prompt
+                )
             
             # 📊 Token Tracking
-            track_usage(response)
+            track_usage(response, "interpret", sender, time.time() - call_started)
+            record_stage("llm", time.time() - call_started)
+            if getattr(response, "usage_metadata", None):
+                tokens_used = response.usage_metadata.total_token_count or 0
 
             text_response = response.text.replace('`', '').strip()
         except Exception as e:
@@ -371,8 +501,8 @@ def ai_interpret(instruction, media_path=None):
     # Memory Storage
     if brain_memory and text_response:
         try:
-            brain_memory.remember(instruction, "user", {"cwd": os.getcwd()})
-            brain_memory.remember(text_response, "ai", {"cwd": os.getcwd()})
+            brain_memory.remember(instruction, "user", {"cwd": cwd, "sender": sender})
+            brain_memory.remember(text_response, "ai", {"cwd": cwd, "sender": sender})
         except Exception as e:
             log(f"Memory Save Error: {e}")
 
@@ -397,10 +527,13 @@ def ai_interpret(instruction, media_path=None):
         
         if line:
             cleaned_lines.append(line)
+    
+    if cache_key:
+        response_cache.put(cache_key, cleaned_lines, tokens_used)
             
     return cleaned_lines
 
-def agentic_mode(instruction, task_id=None):
+def agentic_mode(instruction, task_id=None, sender=None):
     """
     [v3.0] Autonomous Investigation Loop.
     Gemini iterates through scripts in a sandbox to solve complex tasks.
@@ -412,15 +545,7 @@ def agentic_mode(instruction, task_id=None):
     
     # helper for updates
     def notify(msg):
-        if task_id:
-            try:
-                requests.post(
-                    f"{BASE_URL}/status-update",
-                    json={"id": task_id, "message": msg},
-                    headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                    timeout=5
-                )
-            except: pass
+        send_status(task_id, msg)
 
     notify(f"🔎 **Starting Agentic Investigation**\n---\n**Task:** {instruction}\n**Status:** Creating sandbox environment. Please wait up to 2 minutes...")
 
@@ -444,19 +569,25 @@ def agentic_mode(instruction, task_id=None):
     start_time = time.time()
     max_duration = 110 # Slightly less than 2 mins buffer
     
-    history = []
-    current_attempt = 1
-    
     # Context Retrieval for Agentic Mode
     context_str = ""
     if brain_memory:
         try:
-            hits = brain_memory.recall(instruction, n_results=3)
+            with trace_stage("memory_recall"):
+                hits = brain_memory.recall(instruction, n_results=3, sender=sender, token_budget=MEMORY_RECALL_TOKENS)
             if hits:
                 context_str = "\n\n🧠 Previous Relevant Context:\n" + "\n".join(hits)
         except Exception as e:
             log(f"Context error: {e}")
 
+    if AGENTIC_PARALLEL > 1:
+        action_rule = (f"Each response is one action: reasoning, then THE CODE in a ```python ... ``` block. "
+                       f"If you need several INDEPENDENT probes (e.g. `arp`, `ip route` and a port check), put up to {AGENTIC_PARALLEL} "
+                       f"```python ... ``` blocks in the same response: they run at the same time, sharing the step time limit, and you get all outputs together. "
+                       f"Only the FIRST block runs in the persistent session; the others start from an empty namespace and their variables are not kept.")
+    else:
+        action_rule = "Each response must contain exactly one action. Provide reasoning, then THE CODE in a ```python ... ``` block."
+
     system_prompt = f"""
     You are in Satele AGENTIC INVESTIGATION MODE. Your goal is to solve a complex system task by writing and running Python scripts.
     
@@ -474,17 +605,32 @@ def agentic_mode(instruction, task_id=None):
        - macOS: `arp -an`, `ifconfig`, `netstat -rn`.
        - WINDOWS: `arp -a`, `ipconfig`, `route print`.
     5. PERFORMANCE & TIMEOUTS: 
-       - Be extremely efficient. Each script has a 35s limit. 
+       - Be extremely efficient. Each script has a {SANDBOX_STEP_TIMEOUT:.0f}s limit. 
+       - All steps run in ONE persistent Python session: variables, imports and open connections from earlier steps are still there. Reuse them instead of recomputing. If the output says the session restarted, they are gone.
        - DO NOT scan entire /24 subnets via sequential pings; it will timeout. 
        - HINT: The ARP cache (`arp`) is usually the fastest way to find active local devices and is often sufficient.
     6. CONCLUSION:
        - As soon as you have the answer, respond with "FINAL:" followed by a concise summary.
-    7. Each response must contain exactly one action. Provide reasoning, then THE CODE in a ```python ... ``` block.
+    7. {action_rule}
     
     USER TASK: {instruction}
     {context_str}
     """
     
+    # One warm interpreter for the whole investigation, plus helpers for parallel probes (see sandbox_kernel.py)
+    kernels = KernelPool(python_bin, working_dir, size=AGENTIC_PARALLEL)
+    try:
+        return agentic_loop(kernels, system_prompt, working_dir, start_time, max_duration, task_id, sender)
+    finally:
+        kernels.close()
+
+def agentic_loop(kernels, system_prompt, working_dir, start_time, max_duration, task_id, sender):
+    def notify(msg):
+        send_status(task_id, msg)
+
+    history = []
+    current_attempt = 1
+
     while time.time() - start_time < max_duration:
         context = ""
         # Keep more history to prevent "forgetting" success in earlier steps
@@ -494,41 +640,50 @@ def agentic_mode(instruction, task_id=None):
         full_prompt = f"{system_prompt}\n\n{context}\n\nDecision Time (Attempt {current_attempt}):"
         
         try:
+            call_started = time.time()
             response = client.models.generate_content(
                 model=gemini_model_name,
                 contents=full_prompt
             )
-            track_usage(response)
+            track_usage(response, "agentic", sender, time.time() - call_started)
+            record_stage("llm", time.time() - call_started)
             ai_text = response.text.strip()
             
             if "FINAL:" in ai_text:
                 parts = ai_text.split("FINAL:", 1)
                 return f"✅ Agentic Solution:\n{parts[1].strip()}"
             
-            # Extract python code
-            code = ""
-            py_match = re.search(r'```python\n(.*?)\n```', ai_text, re.DOTALL)
-            if py_match:
-                code = py_match.group(1).strip()
-            else:
+            # Extract python code (several blocks = independent probes, run in parallel)
+            codes = [c.strip() for c in re.findall(r'```python\n(.*?)\n```', ai_text, re.DOTALL) if c.strip()]
+            if not codes:
                 # Try generic code block
                 any_match = re.search(r'```(.*?)\n(.*?)\n```', ai_text, re.DOTALL)
-                if any_match: code = any_match.group(1).strip()
+                if any_match and any_match.group(2).strip(): codes = [any_match.group(2).strip()]
+            codes = codes[:AGENTIC_PARALLEL]
             
-            if code:
-                script_path = os.path.join(working_dir, f"step_{current_attempt}.py")
-                with open(script_path, "w") as f:
-                    f.write(code)
+            if codes:
+                if len(codes) == 1:
+                    blocks = [(codes[0], os.path.join(working_dir, f"step_{current_attempt}.py"))]
+                else:
+                    blocks = [(code, os.path.join(working_dir, f"step_{current_attempt}_{i}.py")) for i, code in enumerate(codes, 1)]
+                # Probes share what is left of the investigation's time
+                step_timeout = max(1, min(SANDBOX_STEP_TIMEOUT, max_duration - (time.time() - start_time)))
                 
-                log(f"🕵️ Agentic: Running Attempt {current_attempt}...")
-                notify(f"⚙️ **Investigation Step {current_attempt}:** Trying a new approach...")
+                log(f"🕵️ Agentic: Running Attempt {current_attempt} ({len(blocks)} script(s))...")
+                notify(f"⚙️ **Investigation Step {current_attempt}:** " +
+                       ("Trying a new approach..." if len(blocks) == 1 else f"Running {len(blocks)} probes in parallel..."))
                 
-                process = subprocess.run([python_bin, script_path], capture_output=True, text=True, timeout=35)
-                out = (process.stdout + "\n" + process.stderr).strip()
+                with trace_stage("shell"):
+                    results = kernels.run(blocks, timeout=step_timeout)
+                if len(results) == 1:
+                    out = results[0][0].strip()
+                else:
+                    out = "\n\n".join(f"[Probe {i}: {status}]\n{output.strip() or '[No Output/Success]'}"
+                                       for i, (output, status) in enumerate(results, 1))
                 
                 history.append({
                     "step": current_attempt,
-                    "action": f"Ran script {current_attempt}",
+                    "action": f"Ran script {current_attempt}" if len(blocks) == 1 else f"Ran {len(blocks)} probe scripts in parallel",
                     "result": out if out else "[No Output/Success]"
                 })
                 
@@ -550,7 +705,7 @@ def agentic_mode(instruction, task_id=None):
         
     return "⌛ Agentic timeout: The investigation took longer than 2 minutes. I've stopped to save resources."
 
-def ai_reason(instruction, tool_output):
+def ai_reason(instruction, tool_output, sender=None):
     """
     Second pass: Performs specific data extraction or analysis on the tool output.
     """
@@ -587,16 +742,24 @@ def ai_reason(instruction, tool_output):
                 "stream": False,
                 "options": {"num_predict": 100} # Cap response length
             }
-            resp = requests.post("http://localhost:11434/api/generate", json=payload, timeout=60)
-            res_text = resp.json().get("response", "Error").strip()
+            ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+            if not ollama_host.startswith("http"): ollama_host = f"http://{ollama_host}"
+            call_started = time.time()
+            resp = requests.post(f"{ollama_host}/api/generate", json=payload, timeout=60)
+            resp_json = resp.json()
+            track_ollama_usage(resp_json, model_name, "reason", sender, time.time() - call_started)
+            record_stage("reasoning", time.time() - call_started)
+            res_text = resp_json.get("response", "Error").strip()
         else:
             if not client:
                 return f"⚠️ Analysis requires key. Raw:\n{tool_output}"
+            call_started = time.time()
             response = client.models.generate_content(
                 model=gemini_model_name,
                 contents=extraction_prompt
             )
-            track_usage(response)
+            track_usage(response, "reason", sender, time.time() - call_started)
+            record_stage("reasoning", time.time() - call_started)
             res_text = response.text.strip()
 
         # Final Guard: If the AI was still too chatty, force it down
@@ -609,25 +772,26 @@ def ai_reason(instruction, tool_output):
         log(f"Reasoning Error: {e}")
         return f"[Error] {tool_output[:500]}..."
 
-def process_instruction(instruction, media_path=None, task_id=None):
+def process_instruction(instruction, media_path=None, task_id=None, session=None):
     log(f"📩 Processing: {instruction} (Media: {media_path is not None})")
+    session = session or sessions.get("local")
     
     # 1. Agentic Mode (Autonomous investigation loop)
     if instruction.lower().startswith("agentic -"):
         task = instruction[9:].strip()
         log(f"🕵️ Autonomous Agentic Mode Triggered: {task}")
-        return agentic_mode(task, task_id)
+        return agentic_mode(task, task_id, sender=session.sender)
 
     # 2. Direct Shell Access (Text only - supports multi-command with ;)
     if not media_path and instruction.lower().startswith("sh:"):
         cmd = instruction[3:].strip()
-        out = run_shell(cmd)
+        out = run_shell(cmd, cwd=session.cwd, env=session.environ(), task_id=task_id)
         if out.strip().upper().startswith("UPLOAD:"):
             return out.strip()
         return f"Executing Raw: {cmd}\n---\n{out}"
 
     # 2. AI Interpretation (Text or Voice) -> Returns LIST of commands
-    command_list = ai_interpret(instruction, media_path)
+    command_list = ai_interpret(instruction, media_path, cwd=session.cwd, sender=session.sender)
     
     if command_list and command_list[0] != "UNSUPPORTED":
         full_output = []
@@ -644,12 +808,12 @@ def process_instruction(instruction, media_path=None, task_id=None):
                 raw_path = parts[1].strip()
                 if "*" in raw_path or "?" in raw_path:
                     import glob
-                    matches = glob.glob(raw_path) if os.path.isabs(raw_path) else glob.glob(os.path.join(os.getcwd(), raw_path))
+                    matches = glob.glob(raw_path) if os.path.isabs(raw_path) else glob.glob(os.path.join(session.cwd, raw_path))
                     if matches:
                         matches.sort(key=os.path.getmtime, reverse=True)
                         raw_path = matches[0]
                 if not os.path.isabs(raw_path):
-                    raw_path = os.path.abspath(os.path.join(os.getcwd(), raw_path))
+                    raw_path = os.path.abspath(os.path.join(session.cwd, raw_path))
                 
                 def resolve_case_insensitive(path):
                     if os.path.exists(path): return path
@@ -675,22 +839,27 @@ def process_instruction(instruction, media_path=None, task_id=None):
                     continue
                 return f"UPLOAD: {raw_path}"
             
-            # Intercept 'cd'
+            # Intercept 'cd' (changes this sender's session, not the process)
             if cmd.strip().startswith("cd"):
                 try:
                     parts = cmd.strip().split(maxsplit=1)
-                    target = os.path.expanduser("~") if len(parts) == 1 else parts[1].strip()
+                    target = "~" if len(parts) == 1 else parts[1].strip()
                     if (target.startswith('"') and target.endswith('"')) or (target.startswith("'") and target.endswith("'")):
                         target = target[1:-1]
                     if target.upper().startswith("CWD:"): target = target[4:].strip()
-                    os.chdir(target)
-                    out = f"📂 Directory changed to: {os.getcwd()}"
-                    log(f"✅ Persistent CD: {os.getcwd()}")
+                    sessions.chdir(session, target)
+                    out = f"📂 Directory changed to: {session.cwd}"
+                    log(f"✅ Persistent CD ({session.sender}): {session.cwd}")
                 except Exception as e: out = f"❌ CD Failed: {e}"
+            # Intercept 'export KEY=VALUE' (kept in the session env for later commands)
+            elif re.match(r"^export\s+[A-Za-z_][A-Za-z0-9_]*=\S*$", cmd.strip()):
+                key, value = cmd.strip()[6:].strip().split("=", 1)
+                sessions.set_env(session, key, value.strip("'\""))
+                out = f"🔧 Session variable set: {key}"
             else:
                 if cmd.lower().startswith("sh:"): cmd = cmd[3:].strip()
                 log(f"➡️ Running: {cmd}")
-                out = run_shell(cmd)
+                out = run_shell(cmd, cwd=session.cwd, env=session.environ(), task_id=task_id)
                 
                 # Filter UPLOAD lines from 'out' to prevent invalid ones from leaking through
                 lines = out.split("\n")
@@ -698,6 +867,7 @@ def process_instruction(instruction, media_path=None, task_id=None):
                 for line in lines:
                     if line.strip().startswith("UPLOAD:"):
                         potential_path = line.strip().split(":", 1)[1].strip()
+                        potential_path = session.resolve(potential_path)
                         if os.path.isfile(potential_path):
                             return f"UPLOAD: {potential_path}"
                         else:
@@ -714,7 +884,6 @@ def process_instruction(instruction, media_path=None, task_id=None):
         combined_result = "\n".join(full_output)
         
         # 🧠 COGNITIVE PASS: If the user asked for summary/analysis/specific detail AND we have data
-        import re
         analysis_keywords = [r"\bsummarize\b", r"\banalyze\b", r"\bextract\b", r"\bwhat\b", r"\bhow\b", r"\bfeedback\b", r"\bstatus\b", r"\bis\b", r"\bequity\b", r"\bbalance\b", r"\btotal\b", r"\bworth\b"]
         should_reason = any(re.search(k, instruction.lower()) for k in analysis_keywords)
 
@@ -722,7 +891,7 @@ def process_instruction(instruction, media_path=None, task_id=None):
             # Check for data markers (case-insensitive) or substantial text
             res_lower = combined_result.lower()
             if "email id:" in res_lower or "subject:" in res_lower or "from:" in res_lower or len(combined_result) > 600:
-                combined_result = ai_reason(instruction, combined_result)
+                combined_result = ai_reason(instruction, combined_result, sender=session.sender)
 
         # Prevent huge payloads
         MAX_CHARS = 5000
@@ -738,150 +907,265 @@ def process_instruction(instruction, media_path=None, task_id=None):
     if command_list is None: error_detail = " (AI returned None - Check API Key/Model/Logs)"
     return f"I received: '{instruction}'. I couldn't safely translate this commands{error_detail}. Try 'sh: <command>'.\n[INTERNAL DEBUG]: Check /tmp/satele_dcaric.log"
 
+def report_result(task_id, result):
+    payload = {"id": task_id, "output": result, "consumer": CONSUMER_ID}
+    trace = current_trace()
+    if trace:
+        # Stage timings go to the bridge's /metrics; "process" is the whole handling time
+        payload["trace_id"] = trace.trace_id
+        payload["enqueued_at"] = trace.enqueued_at
+        payload["timings"] = {**trace.timings, "process": time.time() - trace.started}
+    requests.post(
+        f"{BASE_URL}/report-result",
+        json=payload,
+        headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
+        timeout=5
+    )
+
+def ack_task(task_id):
+    # Tells the bridge the task is handled even though no reply is sent (stops re-delivery)
+    requests.post(
+        f"{BASE_URL}/ack",
+        json={"id": task_id, "consumer": CONSUMER_ID},
+        headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
+        timeout=5
+    )
+
+# Tasks leased by this monitor and not finished yet; listed in every heartbeat
+in_flight = set()
+in_flight_lock = threading.Lock()
+
+def consumer_info(workers):
+    return {"consumer": CONSUMER_ID, "host": platform.node(), "tags": MONITOR_TAGS, "workers": workers}
+
+def heartbeat_loop(workers):
+    """Registers with the bridge, then keeps this monitor's leases alive while it works on them."""
+    interval = 10
+    registered = False
+    while True:
+        try:
+            if not registered:
+                resp = requests.post(f"{BASE_URL}/consumers/register", json=consumer_info(workers),
+                                     headers={"Authorization": f"Bearer {AUTH_TOKEN}"}, timeout=5)
+                if resp.status_code == 200:
+                    registered = True
+                    interval = max(1, resp.json().get("heartbeat_interval", interval))
+                    log(f"🤝 Registered as consumer {CONSUMER_ID} (tags: {', '.join(MONITOR_TAGS) or 'none'})")
+            else:
+                with in_flight_lock:
+                    tasks = list(in_flight)
+                requests.post(f"{BASE_URL}/consumers/heartbeat", json={**consumer_info(workers), "tasks": tasks},
+                              headers={"Authorization": f"Bearer {AUTH_TOKEN}"}, timeout=5)
+        except Exception as e:
+            log(f"⚠️ Heartbeat failed: {e}")
+        time.sleep(interval)
+
+def unregister_consumer():
+    # Unfinished tasks go straight back to the queue for the other monitors
+    try:
+        requests.post(f"{BASE_URL}/consumers/unregister", json={"consumer": CONSUMER_ID},
+                      headers={"Authorization": f"Bearer {AUTH_TOKEN}"}, timeout=2)
+    except Exception:
+        pass
+
+def route_task(instruction):
+    """Decides which handler a task goes to (order matters, first match wins)."""
+    if not instruction: return "ai"
+    if "use gravity" in instruction.lower(): return "handoff"
+    if re.search(r"(?i)\b(restart|reboot)\b", instruction): return "restart"
+    if re.search(r"(?i)\b(git pull|update|pull changes)\b", instruction): return "gitpull"
+    if re.search(r"(?i)(status|alive)", instruction): return "status"
+    if re.search(r"(?i)\b(run command|execute command)\b", instruction): return "run_command"
+    if re.search(r"(?i)send me printout", instruction): return "printout"
+    return "ai"
+
+def task_lane(task):
+    """
+    Built-in and direct shell commands go to the 'fast' lane; AI interpretation,
+    skills, media and agentic investigations go to the 'slow' lane.
+    """
+    instruction = task.get("instruction") or ""
+    if route_task(instruction) != "ai": return "fast"
+    if not task.get("media_path") and instruction.lower().startswith("sh:"): return "fast"
+    return "slow"
+
+def handle_task(task):
+    """Runs one task inside a trace (stage timings are reported with the result)."""
+    trace = start_trace(task.get("trace_id") or task.get("id"))
+    trace.enqueued_at = task.get("enqueued_at")
+    if task.get("received_at"):
+        trace.add("pool_wait", trace.started - task["received_at"])
+    try:
+        run_task(task)
+    finally:
+        with in_flight_lock:
+            in_flight.discard(task.get("id"))
+        trace = end_trace()
+        if trace and trace.timings:
+            log(f"⏱️ [{trace.trace_id}] {trace.summary()}")
+
+def run_task(task):
+    task_id = task.get('id')
+    instruction = task.get('instruction')
+    media_path = task.get('media_path')
+    route = route_task(instruction)
+    session = sessions.get(task.get('sender'))
+
+    # Satele Logic: If the user says "use gravity", we let the Antigravity Agent handle it.
+    if route == "handoff":
+        log(f"🧠 Handoff: '{instruction}' -> Letting Antigravity Agent handle this.")
+        ack_task(task_id)
+    elif route == "restart":
+        log("♻️ Internal Restart Triggered.")
+        result = "♻️ **Restarting Satele.** I will be back in a moment..."
+        # Send response BEFORE killing ourselves
+        report_result(task_id, result)
+        # Actual restart via background one-liner to ensure reliability
+        satele_path = os.path.join(PROJECT_ROOT, "satele")
+        os.system(f"nohup bash -c 'sleep 2; \"{satele_path}\" stop; \"{satele_path}\" start' > /dev/null 2>&1 &")
+    elif route == "gitpull":
+        log("📥 Internal Git Pull Triggered.")
+        satele_path = os.path.join(PROJECT_ROOT, "satele")
+        out = run_shell(f"\"{satele_path}\" gitpull")
+        result = f"📥 **System Update:**\n{out}"
+        report_result(task_id, result)
+    elif route == "status":
+        log("📊 Internal Status Check Triggered.")
+        satele_path = os.path.join(PROJECT_ROOT, "satele")
+        out = run_shell(f"\"{satele_path}\" status")
+        result = f"📊 **System Status:**\n{out}"
+        report_result(task_id, result)
+    elif route == "run_command":
+        log("🏃 Direct Run Command Triggered.")
+        # Extract command after 'run command' or 'execute command' (handles '-' or ':')
+        clean_cmd = re.sub(r"(?i)\b(run command|execute command)\s*([-:]\s*)?", "", instruction).strip()
+        
+        if clean_cmd.startswith("satele "):
+            sub_cmd = clean_cmd[7:].strip()
+            log(f"🏃 Running Satele sub-command: {sub_cmd}")
+            satele_path = os.path.join(PROJECT_ROOT, "satele")
+            out = run_shell(f"\"{satele_path}\" {sub_cmd}")
+            result = f"🧾 **Satele Printout ({sub_cmd}):**\n{out}"
+        elif clean_cmd:
+            log(f"🏃 Running Shell command: {clean_cmd}")
+            out = run_shell(clean_cmd, cwd=session.cwd, env=session.environ(), task_id=task_id)
+            result = f"📑 **Shell Execution:**\n{out}"
+        else:
+            result = "⚠️ No command specified. Try 'run command - satele help'."
+
+        report_result(task_id, result)
+    elif route == "printout":
+        log("📄 Printout request triggered.")
+        # Clean up the instruction to get the actual command
+        # Handles "send me printout - satele help", "send me printout satele help", etc.
+        clean_cmd = re.sub(r"(?i)send me printout\s*([-:]\s*)?", "", instruction).strip()
+        
+        if clean_cmd.startswith("satele "):
+            sub_cmd = clean_cmd[7:].strip()
+            log(f"🏃 Running Satele sub-command: {sub_cmd}")
+            satele_path = os.path.join(PROJECT_ROOT, "satele")
+            out = run_shell(f"\"{satele_path}\" {sub_cmd}")
+            result = f"🧾 **Satele Printout ({sub_cmd}):**\n{out}"
+        elif clean_cmd:
+            log(f"🏃 Running Shell command: {clean_cmd}")
+            out = run_shell(clean_cmd, cwd=session.cwd, env=session.environ(), task_id=task_id)
+            result = f"📑 **Shell Printout:**\n{out}"
+        else:
+            result = "⚠️ No command specified for printout. Try 'send me printout - satele help'."
+
+        report_result(task_id, result)
+    else:
+        result = process_instruction(instruction, media_path, task_id, session)
+        report_result(task_id, result)
+        log(f"✅ Result sent for {task_id}")
+
+def create_task_pool():
+    """
+    Worker-pool execution mode (MONITOR_WORKERS > 0).
+    MONITOR_WORKERS threads serve the fast lane, MONITOR_SLOW_WORKERS the slow lane.
+    """
+    try:
+        workers = int(os.getenv("MONITOR_WORKERS", "0"))
+        slow_workers = int(os.getenv("MONITOR_SLOW_WORKERS", str(max(1, workers))))
+    except (ValueError, TypeError):
+        workers, slow_workers = 0, 1
+    if workers <= 0:
+        return None
+    from task_pool import TaskPool
+    log(f"🧵 Worker Pool Mode: {workers} fast / {slow_workers} slow workers")
+    return TaskPool({"fast": workers, "slow": max(1, slow_workers)}, log=log)
+
+def memory_maintenance_loop():
+    """Keeps the memory collection bounded: compaction + retention, at startup and then periodically."""
+    interval = env_int("MEMORY_MAINTENANCE_INTERVAL", 3600)
+    while True:
+        try:
+            stats = brain_memory.maintain()
+            if any(stats.values()):
+                log(f"🧹 Memory maintenance: {stats}")
+        except Exception as e:
+            log(f"Memory maintenance error: {e}")
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
 def monitor_loop():
     log(f"🚀 Autonomous Monitoring Started... ({log_brain})")
-    
-    # RESTORE SESSION
+    if brain_memory:
+        threading.Thread(target=memory_maintenance_loop, name="memory-maintenance", daemon=True).start()
+    log(f"🔄 Sessions: {len(sessions)} restored (default CWD: {sessions.default_cwd})")
+
+    pool = create_task_pool()
     try:
-        cwd_file = os.path.join(os.path.dirname(__file__), ".satele_cwd")
-        if os.path.exists(cwd_file):
-            with open(cwd_file, "r") as f:
-                last_wd = f.read().strip()
-                if os.path.isdir(last_wd):
-                    os.chdir(last_wd)
-                    log(f"🔄 Restored Session CWD: {last_wd}")
-    except Exception as e:
-        log(f"⚠️ Failed to restore session: {e}")
+        max_backlog = int(os.getenv("MONITOR_MAX_BACKLOG", "50"))
+    except (ValueError, TypeError):
+        max_backlog = 50
+    workers = sum(lane.workers for lane in pool.lanes.values()) if pool else 1
+    threading.Thread(target=heartbeat_loop, args=(workers,), name="heartbeat", daemon=True).start()
+    atexit.register(unregister_consumer)
 
     while True:
         try:
+            # Don't pull more work off the bridge than the pool can reasonably queue
+            if pool and not pool.wait_for_capacity(max_backlog, timeout=1):
+                continue
+
             # now = datetime.datetime.now().strftime("%H:%M:%S")
             # log(f"[{now}] 🔍 Checking for tasks...")
+            poll_started = time.time()
             response = requests.get(
                 f"{BASE_URL}/get-task", 
+                params={"wait": LONG_POLL_WAIT, "consumer": CONSUMER_ID},
                 headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                timeout=5
+                timeout=LONG_POLL_WAIT + 10
             )
             
             task_processed = False
             if response.status_code == 200:
                 task = response.json()
-                if task:
-                    task_id = task.get('id')
-                    instruction = task.get('instruction')
-                    media_path = task.get('media_path')
-                    
-                    if task_id:
-                        log(f"📥 New Task [{task_id}]: {instruction}")
-                        
-                        # Satele Logic: If the user says "use gravity", we let the Antigravity Agent handle it.
-                        if instruction and "use gravity" in instruction.lower():
-                            log(f"🧠 Handoff: '{instruction}' -> Letting Antigravity Agent handle this.")
-                        elif instruction and re.search(r"(?i)\b(restart|reboot)\b", instruction):
-                            log("♻️ Internal Restart Triggered.")
-                            result = "♻️ **Restarting Satele.** I will be back in a moment..."
-                            # Send response BEFORE killing ourselves
-                            requests.post(
-                                f"{BASE_URL}/report-result",
-                                json={"id": task_id, "output": result},
-                                headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                                timeout=5
-                            )
-                            # Actual restart via background one-liner to ensure reliability
-                            satele_path = os.path.join(PROJECT_ROOT, "satele")
-                            os.system(f"nohup bash -c 'sleep 2; \"{satele_path}\" stop; \"{satele_path}\" start' > /dev/null 2>&1 &")
-                            task_processed = True
-                        elif instruction and re.search(r"(?i)\b(git pull|update|pull changes)\b", instruction):
-                            log("📥 Internal Git Pull Triggered.")
-                            satele_path = os.path.join(PROJECT_ROOT, "satele")
-                            out = run_shell(f"\"{satele_path}\" gitpull")
-                            result = f"📥 **System Update:**\n{out}"
-                            requests.post(
-                                f"{BASE_URL}/report-result",
-                                json={"id": task_id, "output": result},
-                                headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                                timeout=5
-                            )
-                            task_processed = True
-                        elif instruction and re.search(r"(?i)(status|alive)", instruction):
-                            log("📊 Internal Status Check Triggered.")
-                            satele_path = os.path.join(PROJECT_ROOT, "satele")
-                            out = run_shell(f"\"{satele_path}\" status")
-                            result = f"📊 **System Status:**\n{out}"
-                            requests.post(
-                                f"{BASE_URL}/report-result",
-                                json={"id": task_id, "output": result},
-                                headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                                timeout=5
-                            )
-                            task_processed = True
-                        elif instruction and re.search(r"(?i)\b(run command|execute command)\b", instruction):
-                            log("🏃 Direct Run Command Triggered.")
-                            # Extract command after 'run command' or 'execute command' (handles '-' or ':')
-                            clean_cmd = re.sub(r"(?i)\b(run command|execute command)\s*([-:]\s*)?", "", instruction).strip()
-                            
-                            if clean_cmd.startswith("satele "):
-                                sub_cmd = clean_cmd[7:].strip()
-                                log(f"🏃 Running Satele sub-command: {sub_cmd}")
-                                satele_path = os.path.join(PROJECT_ROOT, "satele")
-                                out = run_shell(f"\"{satele_path}\" {sub_cmd}")
-                                result = f"🧾 **Satele Printout ({sub_cmd}):**\n{out}"
-                            elif clean_cmd:
-                                log(f"🏃 Running Shell command: {clean_cmd}")
-                                out = run_shell(clean_cmd)
-                                result = f"📑 **Shell Execution:**\n{out}"
-                            else:
-                                result = "⚠️ No command specified. Try 'run command - satele help'."
-
-                            requests.post(
-                                f"{BASE_URL}/report-result",
-                                json={"id": task_id, "output": result},
-                                headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                                timeout=5
-                            )
-                            task_processed = True
-                        elif instruction and re.search(r"(?i)send me printout", instruction):
-                            log("📄 Printout request triggered.")
-                            # Clean up the instruction to get the actual command
-                            # Handles "send me printout - satele help", "send me printout satele help", etc.
-                            clean_cmd = re.sub(r"(?i)send me printout\s*([-:]\s*)?", "", instruction).strip()
-                            
-                            if clean_cmd.startswith("satele "):
-                                sub_cmd = clean_cmd[7:].strip()
-                                log(f"🏃 Running Satele sub-command: {sub_cmd}")
-                                satele_path = os.path.join(PROJECT_ROOT, "satele")
-                                out = run_shell(f"\"{satele_path}\" {sub_cmd}")
-                                result = f"🧾 **Satele Printout ({sub_cmd}):**\n{out}"
-                            elif clean_cmd:
-                                log(f"🏃 Running Shell command: {clean_cmd}")
-                                out = run_shell(clean_cmd)
-                                result = f"📑 **Shell Printout:**\n{out}"
-                            else:
-                                result = "⚠️ No command specified for printout. Try 'send me printout - satele help'."
-
-                            requests.post(
-                                f"{BASE_URL}/report-result",
-                                json={"id": task_id, "output": result},
-                                headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                                timeout=5
-                            )
-                            task_processed = True
-                        else:
-                            result = process_instruction(instruction, media_path, task_id)
-                            
-                            requests.post(
-                                f"{BASE_URL}/report-result",
-                                json={"id": task_id, "output": result},
-                                headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-                                timeout=5
-                            )
-                            log(f"✅ Result sent for {task_id}")
-                        task_processed = True
+                if task and task.get('id'):
+                    task["received_at"] = time.time()
+                    with in_flight_lock:
+                        in_flight.add(task["id"])
+                    log(f"📥 New Task [{task['id']}] (trace {task.get('trace_id', '-')}): {task.get('instruction')}")
+                    if pool:
+                        # Per-sender ordering: one sender's tasks run in order, also across lanes
+                        lane = task_lane(task)
+                        pool.submit(lane, task.get("sender") or task["id"], handle_task, task)
+                        log(f"🧵 Queued in {lane} lane ({pool.summary()})")
+                    else:
+                        handle_task(task)
+                    task_processed = True
             else:
                 log(f"⚠️ Server returned status {response.status_code}.")
+                time.sleep(POLL_INTERVAL)
+                continue
 
-            # Consistent sleep regardless of task processing to prevent network flood
-            time.sleep(POLL_INTERVAL)
+            # The bridge already held the request open while idle, so poll again right away.
+            # Only sleep if an empty answer came back instantly (old bridge without long-poll)
+            # to prevent a network flood.
+            if not task_processed and (LONG_POLL_WAIT <= 0 or time.time() - poll_started < 1):
+                time.sleep(POLL_INTERVAL)
 
                 
         except Exception as e:
@@ -891,4 +1175,7 @@ def monitor_loop():
             time.sleep(5)
 
 if __name__ == "__main__":
+    # `satele stop` sends SIGTERM; exit normally so atexit handlers (memory flush) run
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     monitor_loop()
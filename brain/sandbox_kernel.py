@@ -0,0 +1,161 @@
+"""
+Sandbox Kernel - Warm, resource-limited Python process for agentic mode
+One worker (sandbox_worker.py) runs under the sandbox venv's interpreter for a whole
+investigation, so steps skip interpreter startup and re-imports and can reuse what earlier
+steps computed (variables, parsed data, open sockets):
+- Each step gets a wall-clock timeout and a CPU-time budget; the worker interrupts the step
+  and keeps its namespace. If it doesn't answer within a grace period, it is killed.
+- Memory (SANDBOX_MEMORY_MB) and file size (SANDBOX_FILE_MB) are capped with rlimits
+- A killed or crashed worker is replaced on the next step, with a note that state was lost
+- KernelPool runs several independent probe blocks at once: the first in the persistent
+  session, the others in warm helper kernels with a fresh namespace each time
+"""
+import os
+import json
+import queue
+import signal
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from config import env_number
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+def read_bounded(path, head_chars=8000, tail_chars=4000):
+    """The step's output file, keeping only its beginning and end if it is huge."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= head_chars + tail_chars:
+                return f.read().decode(errors="replace")
+            head = f.read(head_chars).decode(errors="replace")
+            f.seek(size - tail_chars)
+            tail = f.read().decode(errors="replace")
+    except OSError:
+        return ""
+    return f"{head}\n\n... ({size - head_chars - tail_chars} characters omitted) ...\n\n{tail}"
+
+
+class SandboxKernel:
+    def __init__(self, python_bin, cwd, env=None, memory_mb=None, cpu_seconds=None, file_mb=None, grace=5):
+        self.python_bin = python_bin
+        self.cwd = cwd
+        self.env = env
+        self.limits = {
+            "memory_mb": memory_mb if memory_mb is not None else env_number("SANDBOX_MEMORY_MB", "1024"),
+            "file_mb": file_mb if file_mb is not None else env_number("SANDBOX_FILE_MB", "256"),
+        }
+        self.cpu_seconds = cpu_seconds if cpu_seconds is not None else env_number("SANDBOX_CPU_SECONDS", "30")
+        self.grace = grace
+        self.proc = None
+        self._replies = None
+        self._started_once = False
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        self.proc = subprocess.Popen(
+            [self.python_bin, "-u", WORKER_PATH, json.dumps(self.limits)],
+            cwd=self.cwd, env=self.env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, bufsize=1, start_new_session=True,
+        )
+        replies = self._replies = queue.Queue()
+        stdout = self.proc.stdout
+
+        def reader():
+            try:
+                for line in stdout:
+                    replies.put(line)
+            except (OSError, ValueError):
+                pass
+            replies.put(None)   # EOF: the worker is gone
+
+        threading.Thread(target=reader, name="sandbox-kernel", daemon=True).start()
+        self._started_once = True
+
+    def run(self, code, path, timeout=35, fresh=False):
+        """
+        Runs one step. `path` is where the code is saved (tracebacks point at it); its output
+        goes next to it. Returns (output, status) with status "ok", "error", "timeout" or "crashed".
+        `fresh` runs it in an empty namespace that is discarded afterwards.
+        """
+        note = ""
+        if not self.alive():
+            if self._started_once and not fresh:
+                note = "[Sandbox session restarted: variables from earlier steps are gone]\n"
+            self.start()
+        output_path = os.path.splitext(path)[0] + ".out"
+        with open(path, "w") as f:
+            f.write(code)
+        request = {"code": code, "path": path, "output": output_path, "timeout": timeout, "cpu": self.cpu_seconds, "fresh": fresh}
+        try:
+            self.proc.stdin.write(json.dumps(request) + "\n")
+            self.proc.stdin.flush()
+            reply = self._replies.get(timeout=timeout + self.grace)
+        except (OSError, ValueError):
+            reply = None
+        except queue.Empty:
+            self.kill()
+            output = read_bounded(output_path)
+            return note + output + f"\n[Step did not stop after {timeout}s; the sandbox session was killed]", "timeout"
+
+        output = read_bounded(output_path)
+        if reply is None:
+            exit_code = self.proc.wait()
+            self.kill()
+            reason = f"signal {-exit_code}" if exit_code < 0 else f"exit code {exit_code}"
+            return note + output + f"\n[Sandbox session crashed ({reason}); it will restart empty on the next step]", "crashed"
+        status = json.loads(reply).get("status", "error")
+        return note + output, status
+
+    def kill(self):
+        if self.proc is None:
+            return
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            else:
+                self.proc.kill()
+        except OSError:
+            pass
+        self.proc.wait()
+        self.proc = None
+
+    def close(self):
+        if self.alive():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        # Also reaps anything the steps left running in the session's process group
+        self.kill()
+
+
+class KernelPool:
+    def __init__(self, python_bin, cwd, size=3, **options):
+        self.size = max(1, int(size))
+        self.main = SandboxKernel(python_bin, cwd, **options)
+        self.helpers = [SandboxKernel(python_bin, cwd, **options) for _ in range(self.size - 1)]
+
+    def run(self, blocks, timeout=35):
+        """
+        Runs [(code, path)] concurrently, all within the same `timeout`; returns [(output, status)]
+        in the same order. Blocks beyond the pool size are not run.
+        """
+        blocks = blocks[:self.size]
+        if len(blocks) == 1:
+            code, path = blocks[0]
+            return [self.main.run(code, path, timeout=timeout)]
+        lanes = [(self.main, False)] + [(helper, True) for helper in self.helpers]
+        with ThreadPoolExecutor(max_workers=len(blocks), thread_name_prefix="sandbox-probe") as executor:
+            futures = [executor.submit(kernel.run, code, path, timeout, fresh)
+                       for (code, path), (kernel, fresh) in zip(blocks, lanes)]
+            return [future.result() for future in futures]
+
+    def close(self):
+        for kernel in [self.main] + self.helpers:
+            kernel.close()
@@ -0,0 +1,145 @@
+"""
+Sandbox Worker - Persistent Python process behind agentic mode's SandboxKernel
+Runs under the sandbox venv's interpreter (not Satele's), so it only uses the standard library.
+- Reads one JSON request per line on stdin: {"code", "path", "output", "timeout", "cpu", "fresh"}
+- Runs the code in a namespace shared by every step, so imports, parsed data and open
+  sockets carry over (`fresh` runs it in a throwaway namespace instead; modules stay
+  imported); stdout/stderr (including child processes) go to the `output` file
+- Answers with one JSON line: {"status": "ok" | "error" | "timeout", "elapsed"}
+- A step is interrupted after `timeout` wall-clock or `cpu` CPU seconds; the namespace survives
+- Memory (RLIMIT_AS) and file size (RLIMIT_FSIZE) are capped for the whole process
+"""
+import os
+import sys
+import json
+import time
+import signal
+import builtins
+import traceback
+
+try:
+    import resource
+except ImportError:   # Windows: no rlimits, the kernel's wall-clock timeout still applies
+    resource = None
+
+
+class StepInterrupted(BaseException):
+    """Not an Exception, so the step's own `except Exception:` blocks don't swallow it."""
+
+
+def set_limits(memory_mb, file_mb):
+    if resource is None:
+        return
+    for name, mb in (("RLIMIT_AS", memory_mb), ("RLIMIT_FSIZE", file_mb)):
+        limit = getattr(resource, name, None)
+        if limit is None or not mb:
+            continue
+        try:
+            _, hard = resource.getrlimit(limit)
+            value = int(mb) * 1024 * 1024
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+
+
+def cpu_budget(seconds):
+    """Lets this step use `seconds` more CPU time (RLIMIT_CPU counts the whole process)."""
+    if resource is None or not hasattr(signal, "SIGXCPU"):
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def interrupt(signum, frame):
+    raise StepInterrupted("CPU time" if signum == getattr(signal, "SIGXCPU", None) else "time")
+
+
+def run_step(namespace, request, kept=False):
+    """`kept`: the namespace holds earlier steps' variables, which an interrupted step leaves intact."""
+    status = "ok"
+    with open(request["output"], "wb", buffering=0) as out:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+        sys.argv = [request.get("path") or "<step>"]
+        timeout = request.get("timeout") or 0
+        try:
+            if timeout and hasattr(signal, "setitimer"):
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            cpu_budget(request.get("cpu"))
+            exec(compile(request["code"], request.get("path") or "<step>", "exec"), namespace)
+        except StepInterrupted as e:
+            status = "timeout"
+            note = " (variables from earlier steps are kept)" if kept else ""
+            print(f"\nStep exceeded its {e} limit and was interrupted{note}", file=sys.stderr)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                status = "error"
+                print(f"SystemExit: {e.code}", file=sys.stderr)
+        except BaseException:
+            status = "error"
+            # Skip this file's frame: the traceback starts in the step's code
+            etype, value, tb = sys.exc_info()
+            traceback.print_exception(etype, value, tb.tb_next)
+        finally:
+            if hasattr(signal, "setitimer"):
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            cpu_budget(0)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Between steps, stray output (e.g. from threads the code started) is discarded
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            os.close(devnull)
+    return status
+
+
+def main():
+    limits = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    set_limits(limits.get("memory_mb"), limits.get("file_mb"))
+
+    # The protocol keeps private copies of stdin/stdout; the code only ever sees /dev/null there
+    requests = os.fdopen(os.dup(0), "r")
+    replies = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, interrupt)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, interrupt)
+
+    namespace = {"__name__": "__main__", "__builtins__": builtins}
+    steps = 0   # run in the shared namespace
+    for line in requests:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        started = time.time()
+        if request.get("fresh"):
+            status = run_step({"__name__": "__main__", "__builtins__": builtins}, request)
+        else:
+            status = run_step(namespace, request, kept=steps > 0)
+            steps += 1
+        replies.write(json.dumps({"status": status, "elapsed": round(time.time() - started, 3)}) + "\n")
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()
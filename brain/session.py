@@ -0,0 +1,100 @@
+"""
+Sessions - Per-sender working directory and environment
+Replaces the process-global os.chdir so several users/tasks can be served at once.
+Each sender gets a Session holding its own cwd and env overrides, which are passed
+to subprocesses via cwd=/env=. Sessions are persisted in a compact JSON store.
+"""
+import os
+import json
+import time
+import threading
+
+
+class Session:
+    def __init__(self, sender, cwd, env=None):
+        self.sender = sender
+        self.cwd = cwd
+        self.env = dict(env or {})
+
+    def resolve(self, path):
+        """Resolves a (possibly relative, ~-prefixed) path against this session's cwd."""
+        path = os.path.expanduser(path)
+        if not os.path.isabs(path):
+            path = os.path.join(self.cwd, path)
+        return os.path.abspath(path)
+
+    def chdir(self, target):
+        path = self.resolve(target)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No such directory: '{target}'")
+        self.cwd = path
+        return path
+
+    def environ(self):
+        """Full environment for a subprocess: process env plus this session's overrides."""
+        if not self.env:
+            return None  # Inherit unchanged
+        merged = os.environ.copy()
+        merged.update(self.env)
+        return merged
+
+    def to_dict(self):
+        return {"cwd": self.cwd, "env": dict(self.env), "updated": int(time.time())}
+
+
+class SessionStore:
+    def __init__(self, path, default_cwd):
+        self.path = path
+        self.default_cwd = default_cwd
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                raw = json.load(f)
+            for sender, data in raw.items():
+                cwd = data.get("cwd") or self.default_cwd
+                if not os.path.isdir(cwd):
+                    cwd = self.default_cwd
+                self._sessions[sender] = Session(sender, cwd, data.get("env"))
+        except Exception:
+            self._sessions = {}
+
+    def get(self, sender):
+        sender = sender or "local"
+        with self._lock:
+            if sender not in self._sessions:
+                self._sessions[sender] = Session(sender, self.default_cwd)
+            return self._sessions[sender]
+
+    def chdir(self, session, target):
+        """Changes a session's folder and persists it. Returns the new cwd."""
+        with self._lock:
+            path = session.chdir(target)
+        self.save()
+        return path
+
+    def set_env(self, session, key, value):
+        """Sets a session variable and persists it (under the lock save() serialises with)."""
+        with self._lock:
+            session.env[key] = value
+        self.save()
+
+    def save(self):
+        """Persists all sessions atomically (temp file + rename)."""
+        with self._lock:
+            data = {s.sender: s.to_dict() for s in self._sessions.values()}
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._sessions)
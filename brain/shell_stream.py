@@ -0,0 +1,136 @@
+"""
+Shell Stream - Incremental execution of shell commands
+Reads stdout/stderr as the command runs instead of waiting for it to exit:
+- Output is kept in a bounded head/tail buffer, so huge outputs are never fully held in memory
+- New output is handed to an on_progress callback at most every `progress_interval` seconds
+"""
+import os
+import time
+import signal
+import codecs
+import threading
+import subprocess
+from collections import deque
+
+
+class OutputBuffer:
+    """Keeps the first `head_chars` and the last `tail_chars` characters written to it."""
+
+    def __init__(self, head_chars=8000, tail_chars=4000):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._head = []
+        self._head_len = 0
+        self._tail = deque()
+        self._tail_len = 0
+        self.total = 0
+
+    def write(self, text):
+        self.total += len(text)
+        if self._head_len < self.head_chars:
+            take = text[:self.head_chars - self._head_len]
+            self._head.append(take)
+            self._head_len += len(take)
+            text = text[len(take):]
+        if not text or self.tail_chars <= 0:
+            return
+        self._tail.append(text)
+        self._tail_len += len(text)
+        # Drop whole chunks first, then trim the oldest one
+        while self._tail_len - len(self._tail[0]) >= self.tail_chars:
+            self._tail_len -= len(self._tail.popleft())
+        if self._tail_len > self.tail_chars:
+            cut = self._tail_len - self.tail_chars
+            self._tail[0] = self._tail[0][cut:]
+            self._tail_len -= cut
+
+    def omitted(self):
+        return self.total - self._head_len - self._tail_len
+
+    def getvalue(self):
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        skipped = self.omitted()
+        if skipped > 0:
+            return f"{head}\n\n... ({skipped} characters omitted) ...\n\n{tail}"
+        return head + tail
+
+
+def run_streaming(cmd, cwd=None, env=None, timeout=180, on_progress=None, progress_interval=10,
+                  head_chars=8000, tail_chars=4000, chunk_chars=1500):
+    """
+    Runs `cmd` through the shell, merging stderr into stdout.
+    Returns (output, returncode). Raises subprocess.TimeoutExpired if `timeout` is hit
+    (the whole process group is killed).
+    on_progress(new_text, elapsed_seconds) receives at most the last `chunk_chars` of
+    output produced since the previous call.
+    """
+    buffer = OutputBuffer(head_chars, tail_chars)
+    lock = threading.Lock()
+    recent = {"text": "", "skipped": 0}
+
+    proc = subprocess.Popen(cmd, shell=True, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True)
+
+    def reader():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        fd = proc.stdout.fileno()
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                break
+            text = decoder.decode(data, final=not data)
+            if text:
+                with lock:
+                    buffer.write(text)
+                    combined = recent["text"] + text
+                    if len(combined) > chunk_chars:
+                        recent["skipped"] += len(combined) - chunk_chars
+                        combined = combined[-chunk_chars:]
+                    recent["text"] = combined
+            if not data:
+                break
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+
+    start = time.time()
+    last_push = start
+    try:
+        while True:
+            wait = timeout - (time.time() - start)
+            if on_progress and progress_interval > 0:
+                wait = min(wait, max(0.1, progress_interval - (time.time() - last_push)))
+            try:
+                proc.wait(timeout=max(0, wait))
+                break
+            except subprocess.TimeoutExpired:
+                if time.time() - start >= timeout:
+                    raise
+            if on_progress and time.time() - last_push >= progress_interval:
+                with lock:
+                    chunk, skipped = recent["text"], recent["skipped"]
+                    recent["text"], recent["skipped"] = "", 0
+                last_push = time.time()
+                if chunk.strip():
+                    if skipped:
+                        chunk = f"...\n{chunk}"
+                    try:
+                        on_progress(chunk, int(last_push - start))
+                    except Exception:
+                        pass
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            proc.kill()
+        proc.wait()
+        raise
+    finally:
+        # Grandchildren may keep the pipe open after the shell exits; don't wait on them forever
+        reader_thread.join(timeout=5)
+        proc.stdout.close()
+
+    with lock:
+        return buffer.getvalue(), proc.returncode
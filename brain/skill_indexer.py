@@ -1,146 +1,238 @@
 """
 Skill Indexer - Semantic search for skills
 Enables efficient skill discovery even with 100+ skills
-Uses sentence-transformers and local JSON storage (no ChromaDB needed)
+Uses the shared embedding service and a local memory-mapped vector store (no ChromaDB needed)
+Skills come already parsed from the SkillRegistry; only new or changed ones are re-embedded.
+The model (and torch) is only imported when it is loaded; with background=True that
+happens on a thread and keyword matching is used until it's warm.
 """
 import os
 import re
 import json
+import threading
 import numpy as np
-import warnings
 
-# Use a local cache for HuggingFace models to avoid permission issues
-HF_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "huggingface")
-os.makedirs(HF_CACHE, exist_ok=True)
-os.environ["HF_HOME"] = HF_CACHE
+from vector_store import VectorStore
+from skill_registry import SkillRegistry
+from embedding_service import get_embedding_service
 
-# Suppress warnings
-warnings.filterwarnings('ignore')
+STOP_WORDS = {"the", "and", "for", "with", "what", "how", "can", "you", "please", "from", "this", "that", "are", "is", "me", "my"}
 
-from sentence_transformers import SentenceTransformer
+def _keywords(text):
+    return {w for w in re.findall(r"[a-z0-9]+", text.lower()) if len(w) > 2 and w not in STOP_WORDS}
 
 class SkillIndexer:
-    def __init__(self, project_root):
+    def __init__(self, project_root, background=False, embedder=None, registry=None):
         self.project_root = project_root
-        self.skills_dir = os.path.join(project_root, ".agent", "skills")
-        self.cache_file = os.path.join(project_root, "brain", "skills_vault.json")
-        
-        # Initialize embedding model (lightweight, fast)
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.data = self._load_cache()
-        
-    def _load_cache(self):
-        if os.path.exists(self.cache_file):
+        # Skills come parsed from the registry; SKILL.md files are not read here
+        self.registry = registry or SkillRegistry(project_root, poll_interval=0)
+        self._indexed = {}   # skill id -> the registry's skill dict it was last indexed from
+        # Legacy JSON vault (embeddings as float lists); migrated once into the vector store
+        self.legacy_cache_file = os.path.join(project_root, "brain", "skills_vault.json")
+        self.store = VectorStore(os.path.join(project_root, "brain", "skills_vault"))
+        if not self.store.exists() and os.path.exists(self.legacy_cache_file):
+            self._migrate_legacy_cache()
+        # data["skills"] is the store's record dict: id -> {name, description, commands, text, row}
+        self.data = {"skills": self.store.records}
+        for record in self.store.records.values():
+            # Vaults written before the index was fed by the registry kept one "command"
+            if "commands" not in record:
+                record["commands"] = [record.pop("command", "")]
+
+        # Search index: (skill ids, skills, matrix) where matrix row i is the L2-normalised
+        # embedding of skills[i]. Replaced as a whole so readers never see a half-built index.
+        self._index = ([], [], np.zeros((0, 0), dtype=np.float32))
+        self._index_lock = threading.RLock()
+        self._rebuild_matrix()
+
+        # Embedding model (shared with Memory) - loaded lazily
+        self.embedder = embedder or get_embedding_service()
+        self.background = background
+        if background:
+            threading.Thread(target=self._load_and_index, name="skill-indexer-warmup", daemon=True).start()
+
+    @property
+    def semantic(self):
+        """True once the model is loaded; until then searches use keyword matching"""
+        return self.embedder.ready
+
+    def _use_embeddings(self):
+        """Synchronous indexers load the model on first use; background ones don't wait for it"""
+        if not self.background and not self.semantic:
             try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {"skills": {}}
-        return {"skills": {}}
+                self.embedder.load()
+            except RuntimeError:
+                pass
+        return self.semantic
+
+    def _load_and_index(self):
+        try:
+            self.embedder.load()
+            print("🧠 Semantic skill search enabled")
+            self.index_all_skills()
+        except Exception as e:
+            print(f"⚠️ Skill search staying in keyword mode: {e}")
 
-    def _save_cache(self):
-        with open(self.cache_file, 'w') as f:
-            json.dump(self.data, f)
+    def _migrate_legacy_cache(self):
+        try:
+            with open(self.legacy_cache_file, 'r') as f:
+                legacy = json.load(f)
+            for cache_id, skill in legacy.get("skills", {}).items():
+                embedding = skill.pop("embedding")
+                self.store.put(cache_id, skill, embedding)
+            self.store.save()
+            print(f"📦 Migrated {len(self.store)} skills from {os.path.basename(self.legacy_cache_file)} to the vector store")
+        except Exception as e:
+            print(f"⚠️ Could not migrate legacy skill vault: {e}")
 
-    def index_all_skills(self):
-        """Scan and index all SKILL.md files"""
-        if not os.path.exists(self.skills_dir):
-            print(f"⚠️ Skills directory not found: {self.skills_dir}")
+    def _rebuild_matrix(self):
+        """Packs all skill embeddings into one contiguous, prenormalised float32 matrix"""
+        keys = list(self.data["skills"])
+        skills = [self.data["skills"][k] for k in keys]
+        if not skills:
+            self._index = ([], [], np.zeros((0, 0), dtype=np.float32))
+            return
+        matrix = self.store.vectors(keys)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._index = (keys, skills, matrix / norms)
+
+    def refresh(self):
+        """Registry change listener: re-indexes changed skills if the model is loaded; a no-op in keyword mode"""
+        if not self.semantic:
             return 0
-        
-        skills_indexed = 0
-        current_skills = {}
-        
-        for skill_name in os.listdir(self.skills_dir):
-            skill_path = os.path.join(self.skills_dir, skill_name, "SKILL.md")
-            
-            if os.path.exists(skill_path):
-                try:
-                    with open(skill_path, 'r') as f:
-                        content = f.read()
-                        
-                    # Extract metadata
-                    name = skill_name
-                    description = ""
-                    command = ""
-                    
-                    # Parse YAML frontmatter
-                    for line in content.split('\n'):
-                        if line.startswith('name:'):
-                            name = line.replace('name:', '').strip()
-                        if line.startswith('description:'):
-                            description = line.replace('description:', '').strip()
-                    
-                    # Extract command (support python3, bash, or direct shell commands like ls, find)
-                    match = re.search(r'`((?:python3|bash|ls|find|cat|head|realpath) [^`]+)`', content)
-                    if match:
-                        command = match.group(1)
-                        # If it's a script in .agent/skills/, ensure it has absolute path
-                        if ".agent/skills/" in command:
-                            # Use regex to find the relative path and replace with absolute
-                            command = re.sub(r'\.?agent/skills/', os.path.join(self.project_root, ".agent/skills/"), command)
-                    
-                    if description and command:
-                        text_to_embed = f"{name}: {description}"
-                        
-                        # Only re-embed if text changed or not in cache
-                        cache_id = f"{skill_name}"
-                        if cache_id not in self.data["skills"] or self.data["skills"][cache_id]["text"] != text_to_embed:
-                            embedding = self.model.encode(text_to_embed).tolist()
-                            self.data["skills"][cache_id] = {
-                                "name": name,
-                                "description": description,
-                                "command": command,
-                                "text": text_to_embed,
-                                "embedding": embedding
-                            }
-                        
-                        current_skills[cache_id] = self.data["skills"][cache_id]
-                        skills_indexed += 1
-                        print(f"✅ Indexed: {name}")
-                        
-                except Exception as e:
-                    print(f"⚠️ Error indexing {skill_name}: {e}")
-        
-        # Clean up removed skills
-        self.data["skills"] = current_skills
-        self._save_cache()
-        return skills_indexed
-    
-    def search_skills(self, query, top_k=5):
-        """Search for relevant skills using cosine similarity"""
-        if not self.data["skills"]:
+        return self.index_all_skills()
+
+    def index_all_skills(self):
+        """Embeds the registry's new or changed skills and drops removed ones. Returns the skill count."""
+        with self._index_lock:
+            return self._index_all_skills()
+
+    def _index_all_skills(self):
+        self.embedder.load()
+        skills = self.registry.skills()
+        to_embed = []   # (skill id, record) of new or re-worded skills, embedded in one batch
+        changed = False
+
+        for skill_id, skill in skills.items():
+            # The registry replaces a skill's dict when its SKILL.md changes
+            if self._indexed.get(skill_id) is skill and skill_id in self.store.records:
+                continue
+            record = {
+                "name": skill["name"],
+                "description": skill["description"],
+                "commands": list(skill["commands"]),
+                "text": f"{skill['name']}: {skill['description']}",
+            }
+            cached = self.store.get(skill_id)
+            if not cached or cached["text"] != record["text"]:
+                to_embed.append((skill_id, record))
+                print(f"✅ Indexed: {record['name']}")
+            elif {k: cached.get(k) for k in record} != record:
+                # Same embedded text, only the metadata moved
+                self.store.put(skill_id, record)
+                changed = True
+            self._indexed[skill_id] = skill
+
+        if to_embed:
+            vectors = self.embedder.embed([record["text"] for _, record in to_embed])
+            for (skill_id, record), vector in zip(to_embed, vectors):
+                self.store.put(skill_id, record, vector)
+            changed = True
+
+        # Clean up removed skills (their rows are reused by the next new skill)
+        for skill_id in set(self.store.records) - set(skills):
+            self.store.delete(skill_id)
+            self._indexed.pop(skill_id, None)
+            changed = True
+        if changed or not self.store.exists():
+            self.store.save()
+        if changed or len(self._index[0]) != len(skills):
+            self._rebuild_matrix()
+        return len(skills)
+
+    def _encode_queries(self, queries):
+        vecs = self.embedder.embed(queries)
+        norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vecs / norms
+
+    def _top_k(self, scores, top_k):
+        """Indices of the top_k highest scores, best first (argpartition, not a full sort)"""
+        if top_k >= len(scores):
+            return np.argsort(-scores)
+        idx = np.argpartition(-scores, top_k - 1)[:top_k]
+        return idx[np.argsort(-scores[idx])]
+
+    def _keyword_scores(self, query, skills):
+        """Degraded mode until the model is warm: share of the query's keywords found in each skill"""
+        words = _keywords(query)
+        if not words:
+            return np.zeros(len(skills), dtype=np.float32)
+        return np.array([len(words & _keywords(" ".join([s["text"], *s["commands"]]))) / len(words) for s in skills], dtype=np.float32)
+
+    def _rank(self, queries, top_k):
+        """Returns (ids, skills, [[(score, row), ...] per query])"""
+        if self._use_embeddings() and not self.data["skills"]:
             self.index_all_skills()
-        
-        if not self.data["skills"]:
-            return ""
 
-        # Embed query
-        query_vec = self.model.encode(query)
-        
-        # Calculate similarities
-        results = []
-        for skill_id, skill in self.data["skills"].items():
-            skill_vec = np.array(skill["embedding"])
-            # Cosine similarity
-            similarity = np.dot(query_vec, skill_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(skill_vec))
-            results.append((similarity, skill))
-        
-        # Sort by similarity
-        results.sort(key=lambda x: x[0], reverse=True)
-        
-        # Filter top_k
-        top_results = results[:top_k]
-        
+        ids, skills, matrix = self._index
+        if not skills or top_k <= 0:
+            return ids, skills, [[] for _ in queries]
+
+        if self.semantic:
+            # (queries x dim) @ (dim x skills): cosine similarity, since both sides are normalised
+            scores = self._encode_queries(list(queries)) @ matrix.T
+        else:
+            scores = [self._keyword_scores(q, skills) for q in queries]
+        return ids, skills, [[(float(row[i]), i) for i in self._top_k(row, top_k)] for row in scores]
+
+    def search(self, query, top_k=5):
+        """Returns [(similarity, skill), ...] for the top_k skills, best first"""
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(self, queries, top_k=5):
+        """Scores many queries in one matrix product. Returns one result list per query."""
+        if not queries:
+            return []
+        _, skills, ranked = self._rank(queries, top_k)
+        return [[(score, skills[i]) for score, i in results] for results in ranked]
+
+    def search_ids(self, query, top_k=5, min_score=0.2):
+        """Skill ids (skill directory names) of the best matches above min_score, best first"""
+        ids, _, ranked = self._rank([query], top_k)
+        return [ids[i] for score, i in ranked[0] if score > min_score]
+
+    def _format_results(self, results):
         skills_context = "\n🚀 AVAILABLE SKILLS & CUSTOM SCRIPTS:\n"
-        for score, skill in top_results:
+        for score, skill in results:
             # Only include if similarity is reasonable (e.g. > 0.3)
             if score > 0.2:
                 skills_context += f"- {skill['name']}: {skill['description']}\n"
-                skills_context += f"  COMMAND: {skill['command']}\n"
-        
+                for command in skill["commands"]:
+                    skills_context += f"  COMMAND: {command}\n"
         return skills_context
-    
+
+    def search_skills(self, query, top_k=5):
+        """Search for relevant skills using cosine similarity"""
+        if self._use_embeddings() and not self.data["skills"]:
+            self.index_all_skills()
+
+        if not self.data["skills"]:
+            return ""
+
+        return self._format_results(self.search(query, top_k))
+
+    def search_skills_batch(self, queries, top_k=5):
+        """search_skills() for many queries at once; returns one context string per query"""
+        if self._use_embeddings() and not self.data["skills"]:
+            self.index_all_skills()
+
+        if not self.data["skills"]:
+            return ["" for _ in queries]
+
+        return [self._format_results(results) for results in self.search_batch(queries, top_k)]
+
     def get_all_skills(self):
         """Get all skills"""
         if not self.data["skills"]:
@@ -149,15 +241,16 @@ class SkillIndexer:
         skills_context = "\n🚀 AVAILABLE SKILLS & CUSTOM SCRIPTS:\n"
         for skill in self.data["skills"].values():
             skills_context += f"- {skill['name']}: {skill['description']}\n"
-            skills_context += f"  COMMAND: {skill['command']}\n"
+            for command in skill["commands"]:
+                skills_context += f"  COMMAND: {command}\n"
         
         return skills_context
 
 # Global instance
 _skill_indexer = None
 
-def get_skill_indexer(project_root):
+def get_skill_indexer(project_root, background=False, registry=None):
     global _skill_indexer
     if _skill_indexer is None:
-        _skill_indexer = SkillIndexer(project_root)
+        _skill_indexer = SkillIndexer(project_root, background=background, registry=registry)
     return _skill_indexer
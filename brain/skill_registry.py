@@ -0,0 +1,156 @@
+"""
+Skill Registry - Parsed skill catalogue kept in memory
+Parses every .agent/skills/*/SKILL.md once at startup, then watches the skills
+directory (mtime polling) and re-parses only the skills whose SKILL.md changed.
+The AI prompt's skills context is prebuilt, so get_context() is O(1).
+"""
+import os
+import re
+import time
+import threading
+
+
+class SkillRegistry:
+    def __init__(self, project_root, poll_interval=5, log=print):
+        self.project_root = project_root
+        self.skills_dir = os.path.join(project_root, ".agent", "skills")
+        self.poll_interval = poll_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._stamps = {}   # skill dir name -> (mtime_ns, size) of its SKILL.md
+        self._skills = {}   # skill dir name -> {"name", "description", "commands"}
+        self._context = ""
+        self.version = 0
+        self._watcher = None
+        self._listeners = []
+        self.refresh()
+
+    def _parse(self, skill_name, skill_path):
+        with open(skill_path, "r") as f:
+            content = f.read()
+        desc = ""
+        name = skill_name
+        # Extract metadata from YAML-ish frontmatter
+        for line in content.split("\n"):
+            if line.startswith("description:"):
+                desc = line.replace("description:", "").strip()
+            if line.startswith("name:"):
+                name = line.replace("name:", "").strip()
+
+        # Extract ALL commands (look for python3 commands in backticks)
+        # Match both inline and multiline code blocks
+        commands = []
+        for match in re.finditer(r'`(python3\s+[^`]+)`', content, re.MULTILINE):
+            cmd_text = match.group(1).strip()
+            # Ensure absolute paths for .agent/skills
+            if ".agent/skills/" in cmd_text:
+                cmd_text = cmd_text.replace(".agent/skills/", os.path.join(self.project_root, ".agent/skills/"))
+            elif "brain/" in cmd_text:
+                cmd_text = cmd_text.replace("brain/", os.path.join(self.project_root, "brain/"))
+            commands.append(cmd_text)
+
+        if desc and commands:
+            return {"name": name, "description": desc, "commands": commands}
+        return None
+
+    def refresh(self):
+        """Re-parses new or modified skills and drops deleted ones. Returns True if anything changed."""
+        if not os.path.isdir(self.skills_dir):
+            with self._lock:
+                changed = bool(self._skills)
+                self._stamps, self._skills, self._context = {}, {}, ""
+                if changed: self.version += 1
+            return changed
+
+        seen = set()
+        changed = False
+        for entry in os.scandir(self.skills_dir):
+            skill_path = os.path.join(entry.path, "SKILL.md")
+            try:
+                st = os.stat(skill_path)
+            except OSError:
+                continue
+            seen.add(entry.name)
+            stamp = (st.st_mtime_ns, st.st_size)
+            if self._stamps.get(entry.name) == stamp:
+                continue
+            try:
+                skill = self._parse(entry.name, skill_path)
+            except Exception as e:
+                self.log(f"Error loading skill {entry.name}: {e}")
+                skill = None
+            with self._lock:
+                self._stamps[entry.name] = stamp
+                if skill:
+                    self._skills[entry.name] = skill
+                else:
+                    self._skills.pop(entry.name, None)
+            if skill:
+                self.log(f"📦 Loaded skill: {skill['name']} ({len(skill['commands'])} commands)")
+            changed = True
+
+        removed = set(self._stamps) - seen
+        if removed:
+            with self._lock:
+                for name in removed:
+                    self._stamps.pop(name, None)
+                    self._skills.pop(name, None)
+            self.log(f"🗑️ Skills removed: {', '.join(sorted(removed))}")
+            changed = True
+
+        if changed:
+            self._rebuild_context()
+        return changed
+
+    @staticmethod
+    def _format(skills):
+        if not skills:
+            return ""
+        skills_context = "\n🚀 AVAILABLE SKILLS & CUSTOM SCRIPTS:\n"
+        for skill in skills:
+            skills_context += f"- {skill['name']}: {skill['description']}\n"
+            for c in skill["commands"]:
+                skills_context += f"  COMMAND: {c}\n"
+        return skills_context
+
+    def _rebuild_context(self):
+        with self._lock:
+            self._context = self._format([self._skills[key] for key in sorted(self._skills)])
+            self.version += 1
+        self.log(f"✅ Skills Context rebuilt ({len(self._skills)} skills, v{self.version}).")
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                self.log(f"Skill change listener error: {e}")
+
+    def get_context(self, names=None):
+        """The full prebuilt catalogue, or just the given skills (by directory name, in that order)."""
+        if names is None:
+            return self._context
+        with self._lock:
+            return self._format([self._skills[n] for n in names if n in self._skills])
+
+    def on_change(self, callback):
+        """Calls callback() (from the watcher thread) after the catalogue changed."""
+        self._listeners.append(callback)
+
+    def skills(self):
+        """Snapshot of parsed skills: {dir_name: {"name", "description", "commands"}}."""
+        with self._lock:
+            return dict(self._skills)
+
+    def start_watching(self):
+        if self._watcher or self.poll_interval <= 0:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self.log(f"Skill watcher error: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="skill-watcher", daemon=True)
+        self._watcher.start()
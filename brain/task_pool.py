@@ -0,0 +1,125 @@
+"""
+Task Pool - Concurrent task execution for the monitor
+Tasks are split into lanes (e.g. "fast" for built-in/shell commands, "slow" for
+AI and agentic work), each with its own worker threads, so a long investigation
+can never starve a quick status check.
+Tasks that share a key (the sender) run one at a time, in the order they were
+received, even across lanes: a key's next task is only handed to its lane once the
+previous one has finished, so a sender's `sh:` command can't overtake (or race with)
+its earlier AI task.
+"""
+import threading
+import queue
+from collections import deque
+
+
+class KeyedLane:
+    """Fixed set of worker threads. Jobs with the same key never run concurrently."""
+
+    def __init__(self, name, workers, log=print):
+        self.name = name
+        self.log = log
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._pending = {}            # key -> deque of (fn, args)
+        self._ready = queue.Queue()   # keys that have work and no active worker
+        self._queued = 0
+        self._active = 0
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{name}-worker-{i + 1}", daemon=True)
+            t.start()
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            self._queued += 1
+            if key in self._pending:
+                # A worker owns this key already; it will pick the job up in order
+                self._pending[key].append((fn, args))
+                return
+            self._pending[key] = deque([(fn, args)])
+        self._ready.put(key)
+
+    def backlog(self):
+        """Jobs received but not yet started."""
+        with self._lock:
+            return self._queued
+
+    def active(self):
+        with self._lock:
+            return self._active
+
+    def _worker(self):
+        while True:
+            key = self._ready.get()
+            while True:
+                with self._lock:
+                    jobs = self._pending.get(key)
+                    if not jobs:
+                        self._pending.pop(key, None)
+                        break
+                    fn, args = jobs.popleft()
+                    self._queued -= 1
+                    self._active += 1
+                try:
+                    fn(*args)
+                except Exception as e:
+                    self.log(f"❌ [{self.name}] Task failed: {e}")
+                finally:
+                    with self._lock:
+                        self._active -= 1
+
+
+class TaskPool:
+    """A set of named lanes sharing one submission interface."""
+
+    def __init__(self, lanes, log=print):
+        # lanes: {"fast": 2, "slow": 1}
+        self.lanes = {name: KeyedLane(name, workers, log) for name, workers in lanes.items()}
+        self._idle = threading.Condition()
+        self._lock = threading.Lock()
+        self._waiting = {}   # key -> deque of (lane, fn, args) behind the key's running/queued job
+        self._held = 0
+
+    def submit(self, lane, key, fn, *args):
+        with self._lock:
+            if key in self._waiting:
+                self._waiting[key].append((lane, fn, args))
+                self._held += 1
+                return
+            self._waiting[key] = deque()
+        self._dispatch(lane, key, fn, args)
+
+    def _dispatch(self, lane, key, fn, args):
+        def run(*a):
+            try:
+                fn(*a)
+            finally:
+                with self._lock:
+                    waiting = self._waiting[key]
+                    following = waiting.popleft() if waiting else None
+                    if following:
+                        self._held -= 1
+                    else:
+                        del self._waiting[key]
+                if following:
+                    next_lane, next_fn, next_args = following
+                    self._dispatch(next_lane, key, next_fn, next_args)
+                with self._idle:
+                    self._idle.notify_all()
+        self.lanes[lane].submit(key, run, *args)
+
+    def backlog(self):
+        with self._lock:
+            held = self._held
+        return held + sum(l.backlog() for l in self.lanes.values())
+
+    def wait_for_capacity(self, max_backlog, timeout=None):
+        """Blocks while more than max_backlog jobs are waiting to start."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.backlog() < max_backlog, timeout=timeout)
+
+    def summary(self):
+        with self._lock:
+            held = self._held
+        lanes = ", ".join(f"{n}: {l.active()} running / {l.backlog()} queued" for n, l in self.lanes.items())
+        return f"{lanes}, {held} behind same-sender tasks" if held else lanes
@@ -0,0 +1,64 @@
+"""
+Tracing - Per-task stage timings in the monitor
+handle_task() starts a trace for the task it runs (tagged with the bridge's trace id);
+code anywhere below it wraps work in `with stage("llm"):`. A task runs entirely on one
+thread (inline or in a worker lane), so the current trace is thread-local.
+The collected durations are sent back with /report-result and end up in /metrics.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Trace:
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.started = time.time()
+        self.enqueued_at = None   # bridge timestamp, echoed back so it can measure end-to-end
+        self.timings = {}   # stage -> seconds (summed if a stage runs more than once)
+
+    def add(self, name, seconds):
+        if seconds is not None and seconds >= 0:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def summary(self):
+        parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in sorted(self.timings.items(), key=lambda x: -x[1])]
+        return " ".join(parts)
+
+
+def start_trace(trace_id):
+    _local.trace = Trace(trace_id)
+    return _local.trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def end_trace():
+    trace = current_trace()
+    _local.trace = None
+    return trace
+
+
+def record_stage(name, seconds):
+    """Adds an already measured duration to the current trace."""
+    trace = current_trace()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block into the current trace (no-op outside a traced task)."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        trace.add(name, time.time() - started)
@@ -0,0 +1,155 @@
+"""
+Usage Tracker - In-memory token/latency accounting, flushed to token_usage.json
+Replaces the read-modify-write of token_usage.json after every LLM call:
+- Calls are accumulated in memory under a lock (safe with the worker pool)
+- A background thread merges the pending counts into the file every `flush_interval`
+  seconds with an atomic write (temp file + rename); also flushed on exit
+- Usage is broken down by provider, model, call site and sender, with p50/p95/p99
+  latency over the most recent calls of each
+
+The top-level "total"/"in"/"out" counters (read by the `satele` script) count Gemini
+tokens only, as before. Breakdown entries use "tokens"/"input"/"output" instead, so the
+script's grep never matches them.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from collections import defaultdict, deque
+
+DIMENSIONS = ("provider", "model", "site", "sender")
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class UsageTracker:
+    def __init__(self, path, flush_interval=5.0, latency_window=1000, log=print):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._totals = defaultdict(int)      # pending top-level increments
+        self._breakdown = {d: defaultdict(lambda: defaultdict(int)) for d in DIMENSIONS}
+        # Recent latencies (ms) per dimension value; not reset by flush, so percentiles
+        # always cover the last `latency_window` calls
+        self._latencies = {d: defaultdict(lambda: deque(maxlen=latency_window)) for d in DIMENSIONS}
+        self._latency_dirty = set()
+        self._thread = None
+
+    def record(self, provider, model, site, sender=None, tokens_in=0, tokens_out=0, total=None,
+               cached_tokens=0, latency=None):
+        """One LLM call. `latency` is in seconds."""
+        tokens_in, tokens_out, cached_tokens = tokens_in or 0, tokens_out or 0, cached_tokens or 0
+        total = total if total is not None else tokens_in + tokens_out
+        keys = {"provider": provider, "model": model, "site": site, "sender": sender or "unknown"}
+        with self._lock:
+            if provider == "gemini":
+                self._totals["total"] += total
+                self._totals["in"] += tokens_in
+                self._totals["out"] += tokens_out
+                self._totals["prompt_cache_tokens"] += cached_tokens
+            for dim, value in keys.items():
+                entry = self._breakdown[dim][value]
+                entry["calls"] += 1
+                entry["tokens"] += total
+                entry["input"] += tokens_in
+                entry["output"] += tokens_out
+                entry["cached"] += cached_tokens
+                if latency is not None:
+                    self._latencies[dim][value].append(latency * 1000)
+                    self._latency_dirty.add((dim, value))
+
+    def increment(self, **counters):
+        """Plain top-level counters (e.g. cache_hits=1)."""
+        with self._lock:
+            for key, value in counters.items():
+                self._totals[key] += value or 0
+
+    def _take_pending(self):
+        with self._lock:
+            totals = dict(self._totals)
+            breakdown = {d: {k: dict(v) for k, v in values.items()} for d, values in self._breakdown.items()}
+            latencies = {}
+            for dim, value in self._latency_dirty:
+                samples = sorted(self._latencies[dim][value])
+                latencies[(dim, value)] = {
+                    "p50": round(_percentile(samples, 50), 1),
+                    "p95": round(_percentile(samples, 95), 1),
+                    "p99": round(_percentile(samples, 99), 1),
+                    "samples": len(samples),
+                }
+            self._totals.clear()
+            for values in self._breakdown.values():
+                values.clear()
+            self._latency_dirty.clear()
+        return totals, breakdown, latencies
+
+    def _restore_pending(self, totals, breakdown):
+        with self._lock:
+            for key, value in totals.items():
+                self._totals[key] += value
+            for dim, values in breakdown.items():
+                for name, counters in values.items():
+                    for key, value in counters.items():
+                        self._breakdown[dim][name][key] += value
+
+    def flush(self):
+        """Merges pending usage into the file (atomic replace). Returns True if anything was written."""
+        with self._flush_lock:
+            totals, breakdown, latencies = self._take_pending()
+            if not totals and not any(breakdown.values()) and not latencies:
+                return False
+            try:
+                data = {"total": 0, "in": 0, "out": 0}
+                if os.path.exists(self.path):
+                    try:
+                        with open(self.path, "r") as f:
+                            data = json.load(f)
+                    except (OSError, ValueError):
+                        pass
+
+                for key, value in totals.items():
+                    data[key] = data.get(key, 0) + value
+                lookups = data.get("cache_hits", 0) + data.get("cache_misses", 0)
+                if lookups:
+                    data["cache_hit_rate"] = round(data.get("cache_hits", 0) / lookups, 3)
+
+                stored = data.setdefault("breakdown", {})
+                for dim, values in breakdown.items():
+                    for name, counters in values.items():
+                        entry = stored.setdefault(dim, {}).setdefault(name, {})
+                        for key, value in counters.items():
+                            entry[key] = entry.get(key, 0) + value
+                for (dim, name), stats in latencies.items():
+                    stored.setdefault(dim, {}).setdefault(name, {})["latency_ms"] = stats
+
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+                return True
+            except Exception as e:
+                # Keep the counts for the next attempt
+                self._restore_pending(totals, breakdown)
+                self.log(f"Token tracking error: {e}")
+                return False
+
+    def start(self):
+        if self._thread:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+
+        self._thread = threading.Thread(target=loop, name="usage-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
@@ -0,0 +1,123 @@
+"""
+Vector Store - Compact on-disk embedding storage
+- Metadata lives in <base>.meta.json (small, rewritten atomically on save)
+- Vectors live in <base>.f16 as raw little-endian float16 rows, memory-mapped on load
+- Updating a record patches its row in place; new records reuse freed rows or append,
+  so the vector file is never rewritten as a whole
+"""
+import os
+import json
+import numpy as np
+
+
+class VectorStore:
+    def __init__(self, base_path, dtype="<f2"):
+        self.meta_path = base_path + ".meta.json"
+        self.vectors_path = base_path + ".f16"
+        self.dtype = np.dtype(dtype)
+        self.dim = 0
+        self.records = {}   # key -> metadata dict, including its "row" in the vector file
+        self._free = []     # rows released by delete(), reused by the next put()
+        self._rows = 0
+        self._mmap = None
+        self._stale = True
+        self._load()
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def _load(self):
+        if not self.exists():
+            return
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read {self.meta_path}, starting empty: {e}")
+            return
+        self.dtype = np.dtype(meta.get("dtype", self.dtype.str))
+        self.dim = meta.get("dim", 0)
+        self.records = meta.get("records", {})
+        self._free = meta.get("free", [])
+        self._rows = meta.get("rows", 0)
+
+        # The metadata is authoritative; ignore rows the vector file doesn't actually hold
+        row_bytes = self.dim * self.dtype.itemsize
+        available = os.path.getsize(self.vectors_path) // row_bytes if row_bytes and os.path.exists(self.vectors_path) else 0
+        if available < self._rows:
+            print(f"⚠️ {self.vectors_path} is truncated ({available}/{self._rows} rows), dropping missing entries")
+            self.records = {k: r for k, r in self.records.items() if r["row"] < available}
+            self._free = [row for row in self._free if row < available]
+            self._rows = available
+
+    def _open_mmap(self):
+        self._mmap = None
+        if self._rows and self.dim:
+            self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self._rows, self.dim))
+        self._stale = False
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def put(self, key, record, vector=None):
+        """Stores `record` under `key`. With vector=None only the metadata is updated."""
+        record = dict(record)
+        old = self.records.get(key)
+        if vector is None:
+            if not old:
+                raise ValueError(f"No stored vector for {key}")
+            record["row"] = old["row"]
+        else:
+            vector = np.asarray(vector, dtype=self.dtype).reshape(-1)
+            if not self.dim:
+                self.dim = len(vector)
+            elif len(vector) != self.dim:
+                raise ValueError(f"Vector for {key} has {len(vector)} dims, store has {self.dim}")
+            if old:
+                row = old["row"]
+            elif self._free:
+                row = self._free.pop()
+            else:
+                row = self._rows
+                self._rows += 1
+            self._write_row(row, vector)
+            record["row"] = row
+        self.records[key] = record
+
+    def _write_row(self, row, vector):
+        mode = "r+b" if os.path.exists(self.vectors_path) else "w+b"
+        with open(self.vectors_path, mode) as f:
+            f.seek(row * self.dim * self.dtype.itemsize)
+            f.write(vector.tobytes())
+        self._stale = True
+
+    def delete(self, key):
+        record = self.records.pop(key, None)
+        if record:
+            self._free.append(record["row"])
+
+    def vectors(self, keys):
+        """float32 matrix of the vectors for `keys`, in that order."""
+        if not keys:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self._stale:
+            self._open_mmap()
+        rows = [self.records[k]["row"] for k in keys]
+        return np.asarray(self._mmap[rows], dtype=np.float32)
+
+    def save(self):
+        meta = {
+            "version": 1,
+            "dtype": self.dtype.str,
+            "dim": self.dim,
+            "rows": self._rows,
+            "free": self._free,
+            "records": self.records,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def __len__(self):
+        return len(self.records)
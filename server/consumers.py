@@ -0,0 +1,102 @@
+"""
+Consumers - Monitor registration, heartbeats and capability routing
+Several monitors (possibly on different hosts) can consume from one bridge:
+- Each monitor registers with an id, host, capability tags and worker count, then sends
+  a heartbeat every HEARTBEAT_INTERVAL seconds listing the tasks it is working on,
+  which keeps those leases alive
+- A monitor that misses heartbeats for CONSUMER_TIMEOUT seconds is considered dead; its
+  leases are released at once, so its tasks are redelivered without waiting for the
+  visibility timeout
+- TaskRouter tags incoming tasks from keyword rules (TASK_ROUTES); a tagged task is only
+  leased to a monitor that has all of its tags (e.g. the host with Gmail credentials)
+"""
+import os
+import re
+import time
+
+from config import env_number
+
+
+class TaskRouter:
+    def __init__(self, routes=None):
+        # tag -> compiled keyword pattern
+        self.patterns = {
+            tag: re.compile(r"\b(" + "|".join(re.escape(k) for k in keywords) + r")\b", re.IGNORECASE)
+            for tag, keywords in (routes or {}).items() if keywords
+        }
+
+    @classmethod
+    def parse(cls, spec):
+        """'gmail=gmail,email,inbox;trading=equity,balance' -> TaskRouter"""
+        routes = {}
+        for rule in (spec or "").split(";"):
+            tag, _, keywords = rule.partition("=")
+            tag = tag.strip().lower()
+            if tag:
+                routes[tag] = [k.strip() for k in keywords.split(",") if k.strip()]
+        return cls(routes)
+
+    def tags_for(self, text):
+        return sorted(tag for tag, pattern in self.patterns.items() if pattern.search(text or ""))
+
+
+def normalize_tags(tags):
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return sorted({str(t).strip().lower() for t in (tags or []) if str(t).strip()})
+
+
+class ConsumerRegistry:
+    def __init__(self, timeout=30, heartbeat_interval=10):
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._consumers = {}   # consumer id -> record
+
+    def register(self, consumer_id, host=None, tags=None, workers=None):
+        """Adds or refreshes a consumer (idempotent, so a heartbeat can re-register after a bridge restart)."""
+        now = time.time()
+        record = self._consumers.get(consumer_id)
+        if record is None:
+            record = self._consumers[consumer_id] = {"id": consumer_id, "registered_at": now, "in_flight": []}
+            print(f"🤝 Consumer joined: {consumer_id} ({host or '?'}) tags={normalize_tags(tags)}")
+        record.update({"host": host, "tags": normalize_tags(tags), "workers": workers, "last_seen": now})
+        return record
+
+    def unregister(self, consumer_id):
+        if self._consumers.pop(consumer_id, None) is not None:
+            print(f"👋 Consumer left: {consumer_id}")
+            return True
+        return False
+
+    def touch(self, consumer_id, in_flight=None):
+        record = self._consumers.get(consumer_id)
+        if record is None:
+            return False
+        record["last_seen"] = time.time()
+        if in_flight is not None:
+            record["in_flight"] = list(in_flight)
+        return True
+
+    def tags(self, consumer_id):
+        record = self._consumers.get(consumer_id)
+        return set(record["tags"]) if record else set()
+
+    def reap(self):
+        """Removes consumers whose heartbeats stopped; returns their ids."""
+        cutoff = time.time() - self.timeout
+        dead = [cid for cid, record in self._consumers.items() if record["last_seen"] < cutoff]
+        for cid in dead:
+            del self._consumers[cid]
+            print(f"💀 Consumer {cid} missed heartbeats for {self.timeout:.0f}s, releasing its tasks")
+        return dead
+
+    def list(self):
+        now = time.time()
+        return [{**record, "last_seen_age": round(now - record["last_seen"], 3)} for record in self._consumers.values()]
+
+
+def create_consumer_registry():
+    return ConsumerRegistry(
+        timeout=env_number("CONSUMER_TIMEOUT", "30"),
+        heartbeat_interval=env_number("HEARTBEAT_INTERVAL", "10"),
+    )
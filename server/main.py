@@ -9,22 +9,83 @@ if os.path.exists(lib_path) and lib_path not in sys.path:
     sys.path.append(lib_path)
 
 from fastapi import FastAPI, HTTPException, Header, Body
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 
 load_dotenv()
 from pydantic import BaseModel
 from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import time
 import uuid
 import re
-import requests
 import uvicorn
+from task_queue import create_task_queue
+from outbound import create_outbound_dispatcher
+from metrics import Metrics
+from consumers import TaskRouter, create_consumer_registry, normalize_tags
 
-app = FastAPI(title="Remote Bridge Server")
+# Monitors consuming from this bridge (registration, heartbeats) and capability routing (see consumers.py)
+consumers = create_consumer_registry()
+router = TaskRouter.parse(os.getenv("TASK_ROUTES", ""))
 
-# Simple in-memory storage for tasks
-# In a real app, you'd use Redis or a database
-tasks_queue = []
-results = {}
+# Per-stage latency histograms, exposed on /metrics (see metrics.py)
+metrics = Metrics()
+# Pending tasks and reply-routing metadata (in memory or durable SQLite, see task_queue.py)
+task_queue = create_task_queue(PROJECT_ROOT)
+# Non-blocking replies to the Node.js WhatsApp bridge (see outbound.py)
+outbound = create_outbound_dispatcher(observe=metrics.observe)
+
+@asynccontextmanager
+async def lifespan(app):
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    await outbound.start()
+    yield
+    await outbound.stop()
+
+app = FastAPI(title="Remote Bridge Server", lifespan=lifespan)
+
+# Long-poll support: /get-task?wait=N parks the request on this condition
+# until a task is queued or the (server-capped) timeout expires.
+task_available = asyncio.Condition()
+# Bumped on every wakeup: a parked poll only re-checks the queue once it changes
+wakeups = 0
+event_loop = None
+
+async def wake_pollers():
+    """Wakes every parked long-poll to re-check the queue (all of them: a task may only suit one)."""
+    global wakeups
+    async with task_available:
+        wakeups += 1
+        task_available.notify_all()
+
+def schedule_wakeup(_count=None):
+    """wake_pollers() from synchronous code (the queue's reap), on the event loop or in a worker thread."""
+    loop = event_loop
+    if loop is None or loop.is_closed():
+        return   # not serving yet: nobody is parked
+    loop.call_soon_threadsafe(lambda: loop.create_task(wake_pollers()))
+
+async def queue_call(method, *args):
+    """Calls a task queue method; a blocking backend (SQLite) runs in a worker thread."""
+    if task_queue.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+# Redelivered tasks (expired or released leases) may be waiting for a parked monitor
+task_queue.on_requeue = schedule_wakeup
+try:
+    LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "30"))
+except (ValueError, TypeError):
+    LONG_POLL_MAX_WAIT = 30.0
+# Parked polls also re-check the queue this often: a task can become available without a
+# notify (e.g. an expired lease is redelivered on the next queue access)
+try:
+    LONG_POLL_RECHECK = float(os.getenv("LONG_POLL_RECHECK", "1"))
+except (ValueError, TypeError):
+    LONG_POLL_RECHECK = 1.0
 
 class Task(BaseModel):
     id: str
@@ -82,50 +143,164 @@ async def handle_incoming_message(payload: dict):
             if "rm -rf" in cmd and "/" in cmd:
                  result_text = "❌ Forbidden command."
             else:
-                 # Execute relative to project root
-                 res = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=30, cwd=root)
+                 # Execute relative to project root (in a thread, so the event loop keeps serving webhooks)
+                 res = await asyncio.to_thread(subprocess.run, cmd, shell=True, capture_output=True, text=True, timeout=30, cwd=root)
                  result_text = (res.stdout + res.stderr).strip() or "✅ Success (No output)"
         except Exception as e:
             result_text = f"❌ Error: {e}"
 
         # Send back to WhatsApp immediately
         if source == "whatsapp" and sender:
-            import requests
-            try:
-                requests.post("http://localhost:8001/send", json={
-                    "to": sender,
-                    "text": f"🚨 [Emergency Execution]\n---\n{result_text}"
-                }, timeout=5)
-            except: pass
+            outbound.send_text(sender, f"🚨 [Emergency Execution]\n---\n{result_text}")
             
         return {"status": "executed_emergency", "task_id": str(uuid.uuid4())}
     # ---------------------------------------------------------------------------
 
     task_id = str(uuid.uuid4())
+    # Trace id: follows the task through the monitor and back with /report-result
+    trace_id = payload.get("traceId") or uuid.uuid4().hex[:16]
     new_task = {
         "id": task_id, 
+        "trace_id": trace_id,
         "instruction": instruction_clean if instruction_clean else "[VOICE COMMAND]", 
         "sender": sender,
         "source": source,
         "media_path": media_path,
+        # Capability tags a monitor needs to run this task (explicit, or from TASK_ROUTES keywords)
+        "requires": normalize_tags(payload.get("tags")) or router.tags_for(instruction_clean),
         "status": "pending"
     }
-    tasks_queue.append(new_task)
-    return {"status": "queued", "task_id": task_id}
+    await queue_call(task_queue.put, new_task)
+    # Wake up the monitors parked in a long-poll
+    await wake_pollers()
+    return {"status": "queued", "task_id": task_id, "trace_id": trace_id}
 
 # --- Endpoints for the Antigravity Bridge (Polling) ---
 
+async def reap_consumers():
+    """Releases the leases of monitors that stopped sending heartbeats."""
+    for consumer_id in consumers.reap():
+        released = await queue_call(task_queue.release, consumer_id)
+        if released:
+            print(f"♻️ {released} task(s) of {consumer_id} back in the queue")
+            await wake_pollers()
+
 @app.get("/get-task")
-async def get_task(authorization: Optional[str] = Header(None)):
+async def get_task(wait: float = 0, consumer: Optional[str] = None, authorization: Optional[str] = Header(None)):
+    """
+    Returns the next pending task this consumer may run, or null if there is none.
+    With ?wait=N the request is held open (long-poll) for up to N seconds
+    (capped by LONG_POLL_MAX_WAIT) until a task arrives.
+    ?consumer=ID identifies a registered monitor (its tags decide which tasks it gets).
+    """
     verify_token(authorization)
-    if not tasks_queue:
-        return None
-    task = tasks_queue.pop(0)
-    task["status"] = "processing"
-    # Store task metadata to know where to send results
-    results[task["id"]] = {"sender": task.get("sender"), "source": task.get("source")}
+    await reap_consumers()
+    consumers.touch(consumer)
+    tags = consumers.tags(consumer)
+    wait = min(max(wait, 0.0), LONG_POLL_MAX_WAIT)
+    if wait > 0:
+        deadline = time.monotonic() + wait
+        while True:
+            # Read before checking, so a wakeup during the check isn't missed
+            seen = wakeups
+            if await queue_call(task_queue.has_pending, consumer, tags):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            async with task_available:
+                try:
+                    await asyncio.wait_for(task_available.wait_for(lambda: wakeups != seen),
+                                           timeout=min(remaining, LONG_POLL_RECHECK))
+                except asyncio.TimeoutError:
+                    pass
+    # Leased, not popped: if no result/ack arrives within the visibility timeout it is re-delivered.
+    # The queue also keeps the task metadata (sender/source) to know where to send results.
+    task = await queue_call(task_queue.lease, consumer, tags)
+    if task and task.get("enqueued_at"):
+        metrics.observe("queue_wait", time.time() - task["enqueued_at"])
     return task
 
+@app.post("/ack")
+async def ack_task(
+    payload: dict = Body(...), 
+    authorization: Optional[str] = Header(None)
+):
+    """Marks a task as handled without sending a reply (e.g. handed off elsewhere)."""
+    verify_token(authorization)
+    if await queue_call(task_queue.ack, payload.get("id")):
+        # The sender's next task may have been waiting for this one to finish
+        await wake_pollers()
+    return {"status": "acked"}
+
+@app.post("/consumers/register")
+async def register_consumer(payload: dict = Body(...), authorization: Optional[str] = Header(None)):
+    """A monitor announces itself: {consumer, host, tags, workers}."""
+    verify_token(authorization)
+    consumer_id = payload.get("consumer")
+    if not consumer_id:
+        raise HTTPException(status_code=400, detail="consumer is required")
+    consumers.register(consumer_id, payload.get("host"), payload.get("tags"), payload.get("workers"))
+    return {"status": "registered", "heartbeat_interval": consumers.heartbeat_interval, "timeout": consumers.timeout}
+
+@app.post("/consumers/heartbeat")
+async def consumer_heartbeat(payload: dict = Body(...), authorization: Optional[str] = Header(None)):
+    """
+    Periodic liveness signal with the ids of the tasks the monitor is working on;
+    their leases are extended. Re-registers the monitor if the bridge forgot it (restart).
+    """
+    verify_token(authorization)
+    consumer_id = payload.get("consumer")
+    if not consumer_id:
+        raise HTTPException(status_code=400, detail="consumer is required")
+    await reap_consumers()
+    in_flight = payload.get("tasks") or []
+    consumers.register(consumer_id, payload.get("host"), payload.get("tags"), payload.get("workers"))
+    consumers.touch(consumer_id, in_flight)
+    extend_all = lambda: sum(1 for task_id in in_flight if task_queue.extend(task_id, consumer_id))
+    extended = await queue_call(extend_all)
+    return {"status": "ok", "extended": extended}
+
+@app.post("/consumers/unregister")
+async def unregister_consumer(payload: dict = Body(...), authorization: Optional[str] = Header(None)):
+    """Clean shutdown of a monitor: its unfinished tasks go back to the queue right away."""
+    verify_token(authorization)
+    consumer_id = payload.get("consumer")
+    consumers.unregister(consumer_id)
+    released = await queue_call(task_queue.release, consumer_id) if consumer_id else 0
+    if released:
+        await wake_pollers()
+    return {"status": "unregistered", "released": released}
+
+@app.get("/consumers")
+async def list_consumers(authorization: Optional[str] = Header(None)):
+    verify_token(authorization)
+    await reap_consumers()
+    return {"consumers": consumers.list()}
+
+@app.get("/stats")
+async def stats(authorization: Optional[str] = Header(None)):
+    """Queue depth, age of the oldest pending/leased task and delivery counters."""
+    verify_token(authorization)
+    return {**await queue_call(task_queue.stats), "consumers": len(consumers.list()), "outbound": outbound.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """Per-stage latency histograms plus queue/outbound gauges, in Prometheus text format."""
+    verify_token(authorization)
+    queue_stats = await queue_call(task_queue.stats)
+    outbound_stats = outbound.stats()
+    gauges = {
+        "satele_queue_pending": queue_stats["pending"],
+        "satele_queue_leased": queue_stats["leased"],
+        "satele_queue_oldest_pending_age_seconds": queue_stats["oldest_pending_age"],
+        "satele_outbound_queued": outbound_stats["queued"],
+        "satele_consumers": len(consumers.list()),
+    }
+    counters = {f"satele_queue_{k}_total": queue_stats[k] for k in ("enqueued", "delivered", "redelivered", "acked", "dropped", "duplicates")}
+    counters.update({f"satele_outbound_{k}_total": outbound_stats[k] for k in ("sent", "retried", "failed", "dropped")})
+    return metrics.render(gauges, counters)
+
 @app.post("/status-update")
 async def status_update(
     payload: dict = Body(...), 
@@ -135,17 +310,14 @@ async def status_update(
     task_id = payload.get("id")
     message = payload.get("message")
     
-    meta = results.get(task_id, {})
+    # Progress from the monitor means the task is still alive: keep its lease
+    await queue_call(task_queue.extend, task_id)
+    meta = await queue_call(task_queue.get_meta, task_id)
     sender = meta.get("sender")
     source = meta.get("source")
 
     if source == "whatsapp" and sender:
-        try:
-            requests.post("http://localhost:8001/send", json={
-                "to": sender,
-                "text": message
-            }, timeout=5)
-        except: pass
+        outbound.send_text(sender, message)
     
     return {"status": "sent"}
 
@@ -158,11 +330,22 @@ async def report_result(
     task_id = payload.get("id")
     output = payload.get("output")
     
-    meta = results.get(task_id, {})
+    # Stage timings measured by the monitor, plus the bridge's own end-to-end view
+    metrics.observe_timings(payload.get("timings"))
+    if payload.get("enqueued_at"):
+        metrics.observe("end_to_end", time.time() - float(payload["enqueued_at"]))
+
+    if not await queue_call(task_queue.ack, task_id):
+        # Another monitor already answered (lease expired and the task was redelivered)
+        print(f"🔁 Duplicate result for {task_id} from {payload.get('consumer', '?')}, not sent")
+        return {"status": "duplicate"}
+    # The sender's next task may have been waiting for this one to finish
+    await wake_pollers()
+    meta = await queue_call(task_queue.get_meta, task_id)
     sender = meta.get("sender")
     source = meta.get("source")
 
-    print(f"✅ Result for {task_id}: {output[:50]}...")
+    print(f"✅ Result for {task_id} (trace {payload.get('trace_id', '-')}): {output[:50]}...")
 
     # If from WhatsApp, push back to the Node.js bridge
     if source == "whatsapp" and sender:
@@ -170,23 +353,8 @@ async def report_result(
             # Check for File Upload Command
             if output.strip().startswith("UPLOAD:"):
                 filepath = output.strip().split("UPLOAD:")[1].strip()
-                resp = requests.post("http://localhost:8001/send-media", json={
-                    "to": sender,
-                    "filePath": filepath,
-                    "caption": f"📄 Here is the file: {os.path.basename(filepath)}"
-                })
-                
-                if resp.status_code != 200:
-                    # Fallback message if file fails
-                    try:
-                        err_msg = resp.json().get('error', 'Unknown Error')
-                    except:
-                        err_msg = f"HTTP {resp.status_code}"
-                    
-                    requests.post("http://localhost:8001/send", json={
-                         "to": sender,
-                         "text": f"❌ Failed to send file: {err_msg}\n(Path: {filepath})"
-                     })
+                # Falls back to a text message with the error if the file can't be sent
+                outbound.send_media(sender, filepath, f"📄 Here is the file: {os.path.basename(filepath)}")
             else:
                 # Standard Text Reply
                 # If output starts with an emoji, or already has a status header (like '📥', '📊', '♻️'), use it as is
@@ -196,14 +364,11 @@ async def report_result(
                 else:
                     final_text = f"✅ Result:\n{output}"
 
-                requests.post("http://localhost:8001/send", json={
-                    "to": sender,
-                    "text": final_text
-                })
+                outbound.send_text(sender, final_text)
         except Exception as e:
             print(f"❌ Failed to process reply: {e}")
     
     return {"status": "received"}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("BRIDGE_PORT", "8000")))
@@ -0,0 +1,86 @@
+"""
+Metrics - Per-stage latency histograms in Prometheus text format (served on /metrics)
+No prometheus_client dependency: a small fixed-bucket histogram is all the bridge needs.
+
+Stages observed by the server: queue_wait (webhook -> leased by a monitor),
+end_to_end (webhook -> result reported), outbound_wait / outbound_send (reply queued
+-> delivered to the Node bridge). The monitor reports its own stages (pool_wait,
+memory_recall, skill_context, llm, shell, reasoning, process) with each result.
+"""
+import re
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Label values come from the monitor; cap them so a bad client can't blow up cardinality
+MAX_STAGES = 64
+STAGE_PATTERN = re.compile(r"^[a-z][a-z0-9_]{0,39}$")
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}   # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_value, seconds):
+        if seconds is None or seconds < 0:
+            return
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                if len(self._series) >= MAX_STAGES:
+                    return
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for value in sorted(snapshot):
+            series = snapshot[value]
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series[len(self.buckets)]}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {series[len(self.buckets)]}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.stages = Histogram(
+            "satele_stage_duration_seconds",
+            "Time spent per pipeline stage of a WhatsApp request",
+            "stage",
+        )
+
+    def observe(self, stage, seconds):
+        if STAGE_PATTERN.match(stage or ""):
+            self.stages.observe(stage, seconds)
+
+    def observe_timings(self, timings):
+        """Stage durations (seconds) reported by the monitor for one task."""
+        if not isinstance(timings, dict):
+            return
+        for stage, seconds in timings.items():
+            try:
+                self.observe(stage, float(seconds))
+            except (TypeError, ValueError):
+                continue
+
+    def render(self, gauges=None, counters=None):
+        """Histograms plus numeric gauges/counters ({metric_name: value}) in exposition format."""
+        lines = self.stages.render()
+        for kind, values in (("gauge", gauges or {}), ("counter", counters or {})):
+            for name, value in sorted(values.items()):
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,153 @@
+"""
+Outbound Delivery - Async, pooled replies to the Node.js WhatsApp bridge
+Replaces blocking requests.post() calls inside the FastAPI handlers.
+- One keep-alive httpx.AsyncClient shared by all sends
+- Bounded send queue (messages beyond OUTBOUND_MAX_QUEUE are dropped and logged)
+- Retry with exponential backoff on connection errors and 5xx responses
+- Per-recipient ordering: each recipient's messages are delivered one at a time, in order
+"""
+import os
+import time
+import asyncio
+from collections import deque
+
+import httpx
+
+from config import env_number
+
+
+class OutboundDispatcher:
+    def __init__(self, base_url, max_queue=1000, max_retries=4, backoff=0.5, timeout=10.0, max_connections=20,
+                 observe=None):
+        self.base_url = base_url.rstrip("/")
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.observe = observe  # observe(stage, seconds) for outbound_wait / outbound_send
+        self.client = None
+        self._queues = {}       # recipient -> deque of jobs
+        self._drainers = set()  # running per-recipient tasks
+        self._size = 0
+        self._semaphore = None
+        self._counters = {"sent": 0, "retried": 0, "failed": 0, "dropped": 0}
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+
+    async def stop(self, drain_timeout=10.0):
+        """Gives queued replies a chance to go out, then closes the pool."""
+        if self._drainers:
+            await asyncio.wait(list(self._drainers), timeout=drain_timeout)
+        for task in list(self._drainers):
+            task.cancel()
+        if self.client:
+            await self.client.aclose()
+
+    def send_text(self, to, text):
+        return self._enqueue(to, {"kind": "text", "to": to, "text": text})
+
+    def send_media(self, to, file_path, caption):
+        return self._enqueue(to, {"kind": "media", "to": to, "filePath": file_path, "caption": caption})
+
+    def stats(self):
+        return {"queued": self._size, "recipients": len(self._queues), **self._counters}
+
+    def _enqueue(self, to, job):
+        if self._size >= self.max_queue:
+            self._counters["dropped"] += 1
+            print(f"⚠️ Outbound queue full ({self._size}), dropping reply to {to}")
+            return False
+        self._size += 1
+        job["queued_at"] = time.monotonic()
+        queue = self._queues.get(to)
+        if queue is not None:
+            # A drainer is already delivering for this recipient; keep order
+            queue.append(job)
+            return True
+        self._queues[to] = deque([job])
+        task = asyncio.get_running_loop().create_task(self._drain(to))
+        self._drainers.add(task)
+        task.add_done_callback(self._drainers.discard)
+        return True
+
+    async def _drain(self, to):
+        queue = self._queues[to]
+        try:
+            while queue:
+                job = queue[0]
+                async with self._semaphore:
+                    started = time.monotonic()
+                    await self._deliver(job)
+                    if self.observe:
+                        self.observe("outbound_wait", started - job["queued_at"])
+                        self.observe("outbound_send", time.monotonic() - started)
+                queue.popleft()
+                self._size -= 1
+        finally:
+            self._size -= len(queue)
+            self._queues.pop(to, None)
+
+    async def _post(self, path, payload, retry_5xx=True):
+        """POST with retry/backoff. Returns the final response, or None if the bridge is unreachable."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = await self.client.post(path, json=payload)
+                if resp.status_code < 500 or not retry_5xx:
+                    return resp
+                error = f"HTTP {resp.status_code}"
+            except httpx.HTTPError as e:
+                resp, error = None, str(e) or e.__class__.__name__
+            if attempt < self.max_retries:
+                self._counters["retried"] += 1
+                await asyncio.sleep(min(self.backoff * (2 ** attempt), 30))
+        print(f"❌ Outbound {path} failed after {self.max_retries + 1} attempts: {error}")
+        return resp
+
+    async def _deliver(self, job):
+        if job["kind"] == "text":
+            resp = await self._post("/send", {"to": job["to"], "text": job["text"]})
+            self._count(resp)
+            return
+
+        # The bridge answers 5xx when WhatsApp rejects the file; don't re-upload, report it instead
+        resp = await self._post("/send-media", {"to": job["to"], "filePath": job["filePath"], "caption": job["caption"]}, retry_5xx=False)
+        if resp is not None and resp.status_code == 200:
+            self._count(resp)
+            return
+        # Fallback message if file fails
+        if resp is None:
+            err_msg = "Bridge unreachable"
+        else:
+            try:
+                err_msg = resp.json().get('error', 'Unknown Error')
+            except Exception:
+                err_msg = f"HTTP {resp.status_code}"
+        resp = await self._post("/send", {
+            "to": job["to"],
+            "text": f"❌ Failed to send file: {err_msg}\n(Path: {job['filePath']})"
+        })
+        self._count(resp)
+
+    def _count(self, resp):
+        if resp is not None and resp.status_code < 400:
+            self._counters["sent"] += 1
+        else:
+            self._counters["failed"] += 1
+
+
+def create_outbound_dispatcher(observe=None):
+    return OutboundDispatcher(
+        os.getenv("NODE_BRIDGE_URL", "http://localhost:8001"),
+        max_queue=int(env_number("OUTBOUND_MAX_QUEUE", "1000")),
+        max_retries=int(env_number("OUTBOUND_MAX_RETRIES", "4")),
+        timeout=env_number("OUTBOUND_TIMEOUT", "10"),
+        max_connections=int(env_number("OUTBOUND_MAX_CONNECTIONS", "20")),
+        observe=observe,
+    )
@@ -0,0 +1,507 @@
+"""
+Task Queue - Pluggable storage for the bridge's pending tasks
+- MemoryTaskQueue: in-process, indexed by sender and required tags, lost on restart (default)
+- SQLiteTaskQueue: durable, WAL-journaled SQLite file
+
+Both backends hand tasks out as leases: a leased task that is not acked
+(via /report-result or /ack) within the visibility timeout is put back
+in its place in the queue (ahead of everything queued after it), so a
+crashed monitor's task is re-delivered first.
+Delivery metadata (sender/source, needed to route replies) is kept for
+RESULTS_TTL seconds after the last activity and then evicted.
+
+With several monitors (see consumers.py) a lease records its consumer, and lease()
+only hands a consumer the oldest task it may run: every tag in the task's "requires"
+is among the consumer's tags, and no other consumer is working on a task from the
+same sender (keeps one sender's messages in order). The first result for a task
+wins; ack() returns False for a duplicate.
+
+`on_requeue(count)`, if set, is called whenever expired or released leases put tasks
+back in the queue, so the bridge can wake the long-polls parked on it.
+
+`blocking` tells the bridge whether calls do I/O (run them in a worker thread) or only
+touch memory (call them on the event loop).
+"""
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from collections import deque, defaultdict
+
+from config import env_number
+
+
+# Above this many consumer tags, SQLite looks up the distinct requirement sets instead of
+# listing every subset of the tags in the query
+MAX_SUBSET_TAGS = 8
+
+
+def _requires_key(requires):
+    return ",".join(sorted(set(requires or ())))
+
+
+def _tag_subsets(tags):
+    """Every requires value (sorted, comma-joined) a consumer with these tags may run."""
+    subsets = [""]
+    for tag in sorted(set(tags or ())):
+        subsets += [f"{s},{tag}" if s else tag for s in subsets]
+    return subsets
+
+
+class MemoryTaskQueue:
+    """
+    Pending tasks are grouped by (sender, requires), each group a deque in queue order. Per
+    requirement set, a heap holds the head of every group whose sender is not busy; the
+    senders each consumer is working on are tracked as leases come and go. lease() and
+    has_pending() therefore look at one heap head per requirement set plus that consumer's
+    busy senders, never at the whole queue.
+    """
+    backend = "memory"
+    blocking = False
+
+    def __init__(self, visibility_timeout=300, results_ttl=3600, max_deliveries=3):
+        self.visibility_timeout = visibility_timeout
+        self.results_ttl = results_ttl
+        self.max_deliveries = max_deliveries
+        self._groups = {}                        # (sender, requires) -> deque of (seq, task)
+        self._sender_groups = defaultdict(set)   # sender -> requires of its non-empty groups
+        self._ready = defaultdict(list)          # requires -> heap of (seq, sender), stale entries skipped lazily
+        self._busy = {}                          # sender -> [consumer, leases]
+        self._busy_by_consumer = defaultdict(set)
+        self._size = 0
+        self._seq = 0
+        self._leased = {}    # task_id -> (task, lease_until)
+        self._lease_seq = {} # task_id -> its seq, so a requeued task gets its place back
+        self._deadlines = [] # heap of (lease_until, task_id), stale after extend/ack
+        self._meta = {}      # task_id -> {"sender", "source", "expires", "done"}
+        self._last_evict = 0
+        self._counters = {"enqueued": 0, "delivered": 0, "redelivered": 0, "acked": 0, "dropped": 0, "duplicates": 0}
+        self.on_requeue = None
+
+    def put(self, task):
+        task.setdefault("enqueued_at", time.time())
+        task.setdefault("deliveries", 0)
+        task.setdefault("requires", [])
+        self._seq += 1
+        self._push(self._seq, task)
+        self._counters["enqueued"] += 1
+
+    def _push(self, seq, task):
+        key = (task.get("sender"), frozenset(task.get("requires") or ()))
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = deque()
+            self._sender_groups[key[0]].add(key[1])
+        if not group or group[-1][0] < seq:
+            group.append((seq, task))
+        else:
+            # Requeued: back in its place, near the front of its group
+            index = 0
+            while group[index][0] < seq:
+                index += 1
+            group.insert(index, (seq, task))
+        self._size += 1
+        if group[0][0] == seq:
+            self._offer(key)
+
+    def _offer(self, key):
+        """Puts the group's head on its requirement set's heap (unless the sender is busy)."""
+        sender, requires = key
+        group = self._groups.get(key)
+        if group and sender not in self._busy:
+            heapq.heappush(self._ready[requires], (group[0][0], sender))
+
+    def _pop(self, key, index=0):
+        group = self._groups[key]
+        _, task = group[index]
+        del group[index]
+        self._size -= 1
+        if not group:
+            del self._groups[key]
+            self._sender_groups[key[0]].discard(key[1])
+            if not self._sender_groups[key[0]]:
+                del self._sender_groups[key[0]]
+        elif index == 0:
+            self._offer(key)
+        return task
+
+    def _hold(self, sender, consumer):
+        entry = self._busy.setdefault(sender, [consumer, 0])
+        entry[1] += 1
+        self._busy_by_consumer[entry[0]].add(sender)
+
+    def _free(self, sender):
+        entry = self._busy.get(sender)
+        if not entry:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del self._busy[sender]
+        senders = self._busy_by_consumer[entry[0]]
+        senders.discard(sender)
+        if not senders:
+            del self._busy_by_consumer[entry[0]]
+        # The sender's other tasks are up for grabs again
+        for requires in self._sender_groups.get(sender, ()):
+            self._offer((sender, requires))
+
+    def _reap(self, now):
+        expired = []
+        while self._deadlines and self._deadlines[0][0] < now:
+            until, tid = heapq.heappop(self._deadlines)
+            lease = self._leased.get(tid)
+            if lease is None or lease[1] != until:
+                continue   # acked, or extended since
+            del self._leased[tid]
+            expired.append((self._lease_seq.pop(tid), lease[0]))
+        requeued = 0
+        for seq, task in expired:
+            if task["deliveries"] >= self.max_deliveries:
+                self._counters["dropped"] += 1
+                print(f"⚠️ Dropping task {task['id']} after {task['deliveries']} failed deliveries")
+            else:
+                task["status"] = "pending"
+                self._push(seq, task)
+                self._counters["redelivered"] += 1
+                requeued += 1
+            self._free(task.get("sender"))
+        if requeued and self.on_requeue:
+            self.on_requeue(requeued)
+        # TTL eviction of delivered task metadata, at most once a minute
+        if now - self._last_evict > 60:
+            self._evict(now)
+
+    def _evict(self, now):
+        self._last_evict = now
+        stale = [tid for tid, m in self._meta.items() if m["expires"] < now and tid not in self._leased]
+        for tid in stale:
+            del self._meta[tid]
+
+    def _ready_head(self, requires):
+        heap = self._ready[requires]
+        while heap:
+            seq, sender = heap[0]
+            group = self._groups.get((sender, requires))
+            if group and group[0][0] == seq and sender not in self._busy:
+                return seq, (sender, requires)
+            heapq.heappop(heap)   # leased, or its sender got busy (re-offered when free)
+        return None
+
+    def _next_group(self, consumer, tags):
+        """Key of the group holding the oldest task this consumer may run, or None."""
+        if not self._size:
+            return None
+        tags = frozenset(tags or ())
+        best = None
+        for requires in list(self._ready):
+            if requires <= tags:
+                head = self._ready_head(requires)
+                if head and (best is None or head[0] < best[0]):
+                    best = head
+        # Senders this consumer is already working on are only eligible for it
+        for sender in self._busy_by_consumer.get(consumer, ()):
+            for requires in self._sender_groups.get(sender, ()):
+                if requires <= tags:
+                    seq = self._groups[(sender, requires)][0][0]
+                    if best is None or seq < best[0]:
+                        best = (seq, (sender, requires))
+        return best[1] if best else None
+
+    def has_pending(self, consumer=None, tags=None):
+        self._reap(time.time())
+        return self._next_group(consumer, tags) is not None
+
+    def lease(self, consumer=None, tags=None):
+        now = time.time()
+        self._reap(now)
+        key = self._next_group(consumer, tags)
+        if key is None:
+            return None
+        self._hold(key[0], consumer)
+        seq = self._groups[key][0][0]
+        task = self._pop(key)
+        self._lease_seq[task["id"]] = seq
+        task["status"] = "processing"
+        task["deliveries"] += 1
+        task["consumer"] = consumer
+        self._lease(task, now + self.visibility_timeout)
+        self._meta[task["id"]] = {"sender": task.get("sender"), "source": task.get("source"), "expires": now + self.results_ttl, "done": False}
+        self._counters["delivered"] += 1
+        return task
+
+    def _lease(self, task, until):
+        self._leased[task["id"]] = (task, until)
+        heapq.heappush(self._deadlines, (until, task["id"]))
+
+    def extend(self, task_id, consumer=None):
+        """Pushes the lease deadline out again (task is still being worked on).
+        With `consumer`, only if that consumer still holds the lease."""
+        now = time.time()
+        if task_id in self._leased:
+            task, _ = self._leased[task_id]
+            if consumer is not None and task.get("consumer") != consumer:
+                return False
+            self._lease(task, now + self.visibility_timeout)
+        if task_id in self._meta:
+            self._meta[task_id]["expires"] = now + self.results_ttl
+        return task_id in self._leased
+
+    def release(self, consumer):
+        """Expires every lease held by `consumer` (it died); the tasks are redelivered on the next reap."""
+        released = 0
+        for tid, (task, _) in list(self._leased.items()):
+            if task.get("consumer") == consumer:
+                self._lease(task, 0)
+                released += 1
+        self._reap(time.time())
+        return released
+
+    def _remove_pending(self, task_id, meta):
+        senders = [meta["sender"]] if meta else list(self._sender_groups)
+        for sender in senders:
+            for requires in list(self._sender_groups.get(sender, ())):
+                for index, (_, task) in enumerate(self._groups[(sender, requires)]):
+                    if task["id"] == task_id:
+                        self._pop((sender, requires), index)
+                        return
+
+    def ack(self, task_id):
+        """Marks the task done. Returns False if it was already done (duplicate result)."""
+        meta = self._meta.get(task_id)
+        if meta and meta.get("done"):
+            self._counters["duplicates"] += 1
+            return False
+        lease = self._leased.pop(task_id, None)
+        if lease is not None:
+            self._lease_seq.pop(task_id, None)
+            self._free(lease[0].get("sender"))
+        else:
+            # Late result for a task whose lease expired and is waiting for redelivery
+            self._remove_pending(task_id, meta)
+        self._counters["acked"] += 1
+        if meta:
+            meta["done"] = True
+            meta["expires"] = time.time() + self.results_ttl
+        return True
+
+    def get_meta(self, task_id):
+        meta = self._meta.get(task_id)
+        if not meta or meta["expires"] < time.time():
+            return {}
+        return {"sender": meta["sender"], "source": meta["source"]}
+
+    def stats(self):
+        now = time.time()
+        self._reap(now)
+        self._evict(now)
+        oldest_pending = min((t["enqueued_at"] for group in self._groups.values() for _, t in group), default=None)
+        oldest_leased = min((t["enqueued_at"] for t, _ in self._leased.values()), default=None)
+        return {
+            "backend": self.backend,
+            "pending": self._size,
+            "leased": len(self._leased),
+            "results_tracked": len(self._meta),
+            "oldest_pending_age": round(now - oldest_pending, 3) if oldest_pending else 0,
+            "oldest_leased_age": round(now - oldest_leased, 3) if oldest_leased else 0,
+            **self._counters,
+        }
+
+
+class SQLiteTaskQueue:
+    """
+    The next task is found by one indexed query (oldest pending row whose requirements the
+    consumer meets and whose sender no other consumer holds a lease for), not by reading
+    the pending rows into Python. Calls block on disk I/O: the bridge runs them in threads.
+    """
+    backend = "sqlite"
+    blocking = True
+
+    def __init__(self, path, visibility_timeout=300, results_ttl=3600, max_deliveries=3):
+        self.visibility_timeout = visibility_timeout
+        self.results_ttl = results_ttl
+        self.max_deliveries = max_deliveries
+        self._lock = threading.Lock()
+        self._counters = {"enqueued": 0, "delivered": 0, "redelivered": 0, "acked": 0, "dropped": 0, "duplicates": 0}
+        self.on_requeue = None
+        self._last_evict = 0
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                sender TEXT,
+                source TEXT,
+                enqueued_at REAL NOT NULL,
+                lease_until REAL,
+                deliveries INTEGER NOT NULL DEFAULT 0,
+                meta_expires REAL,
+                requires TEXT NOT NULL DEFAULT '',
+                consumer TEXT
+            )""")
+        # Databases created before consumer routing
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(tasks)")}
+        if "requires" not in columns:
+            self.db.execute("ALTER TABLE tasks ADD COLUMN requires TEXT NOT NULL DEFAULT ''")
+        if "consumer" not in columns:
+            self.db.execute("ALTER TABLE tasks ADD COLUMN consumer TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state_seq ON tasks(state, seq)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state_lease ON tasks(state, lease_until)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_meta_expires ON tasks(state, meta_expires)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state_sender ON tasks(state, sender, consumer)")
+        # Requirements are matched as sorted, comma-joined strings; older rows may not be sorted
+        for seq, requires in self.db.execute("SELECT seq, requires FROM tasks WHERE state IN ('pending', 'leased') AND requires LIKE '%,%'").fetchall():
+            if _requires_key(requires.split(",")) != requires:
+                self.db.execute("UPDATE tasks SET requires = ? WHERE seq = ?", (_requires_key(requires.split(",")), seq))
+
+    def put(self, task):
+        task.setdefault("enqueued_at", time.time())
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO tasks (id, payload, sender, source, enqueued_at, requires) VALUES (?, ?, ?, ?, ?, ?)",
+                (task["id"], json.dumps(task), task.get("sender"), task.get("source"), task["enqueued_at"],
+                 _requires_key(task.get("requires"))))
+            self._counters["enqueued"] += 1
+
+    def _reap(self, now):
+        # Caller holds the lock
+        dropped = self.db.execute(
+            "UPDATE tasks SET state = 'dead' WHERE state = 'leased' AND lease_until < ? AND deliveries >= ?",
+            (now, self.max_deliveries)).rowcount
+        self._counters["dropped"] += dropped
+        requeued = self.db.execute(
+            "UPDATE tasks SET state = 'pending', lease_until = NULL WHERE state = 'leased' AND lease_until < ?",
+            (now,)).rowcount
+        self._counters["redelivered"] += requeued
+        if requeued and self.on_requeue:
+            self.on_requeue(requeued)
+        # TTL eviction of delivered task metadata, at most once a minute
+        if now - self._last_evict > 60:
+            self._last_evict = now
+            self.db.execute("DELETE FROM tasks WHERE state IN ('done', 'dead') AND meta_expires < ?", (now,))
+
+    def _next_row(self, consumer, tags, columns="seq, payload, deliveries"):
+        # Caller holds the lock
+        tags = set(tags or ())
+        if len(tags) <= MAX_SUBSET_TAGS:
+            allowed = _tag_subsets(tags)
+        else:
+            allowed = [r for (r,) in self.db.execute("SELECT DISTINCT requires FROM tasks WHERE state = 'pending'")
+                       if set(filter(None, r.split(","))) <= tags]
+        if not allowed:
+            return None
+        return self.db.execute(f"""
+            SELECT {columns} FROM tasks t
+            WHERE state = 'pending' AND requires IN ({",".join("?" * len(allowed))})
+              AND NOT EXISTS (SELECT 1 FROM tasks l WHERE l.state = 'leased' AND l.sender IS t.sender AND l.consumer IS NOT ?)
+            ORDER BY seq LIMIT 1""", (*allowed, consumer)).fetchone()
+
+    def has_pending(self, consumer=None, tags=None):
+        with self._lock:
+            self._reap(time.time())
+            return self._next_row(consumer, tags, columns="1") is not None
+
+    def lease(self, consumer=None, tags=None):
+        now = time.time()
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._reap(now)
+                row = self._next_row(consumer, tags)
+                if not row:
+                    self.db.execute("COMMIT")
+                    return None
+                seq, payload, deliveries = row
+                self.db.execute(
+                    "UPDATE tasks SET state = 'leased', lease_until = ?, deliveries = ?, meta_expires = ?, consumer = ? WHERE seq = ?",
+                    (now + self.visibility_timeout, deliveries + 1, now + self.results_ttl, consumer, seq))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            self._counters["delivered"] += 1
+        task = json.loads(payload)
+        task["status"] = "processing"
+        task["deliveries"] = deliveries + 1
+        task["consumer"] = consumer
+        return task
+
+    def extend(self, task_id, consumer=None):
+        now = time.time()
+        with self._lock:
+            self.db.execute("UPDATE tasks SET meta_expires = ? WHERE id = ?", (now + self.results_ttl, task_id))
+            query = "UPDATE tasks SET lease_until = ? WHERE id = ? AND state = 'leased'"
+            params = [now + self.visibility_timeout, task_id]
+            if consumer is not None:
+                query += " AND consumer IS ?"
+                params.append(consumer)
+            return self.db.execute(query, params).rowcount > 0
+
+    def release(self, consumer):
+        now = time.time()
+        with self._lock:
+            released = self.db.execute(
+                "UPDATE tasks SET lease_until = 0 WHERE state = 'leased' AND consumer IS ?", (consumer,)).rowcount
+            self._reap(now)
+        return released
+
+    def ack(self, task_id):
+        """Marks the task done. Returns False if it was already done (duplicate result)."""
+        with self._lock:
+            updated = self.db.execute(
+                "UPDATE tasks SET state = 'done', lease_until = NULL, meta_expires = ? WHERE id = ? AND state IN ('leased', 'pending', 'dead')",
+                (time.time() + self.results_ttl, task_id)).rowcount
+            if updated:
+                self._counters["acked"] += updated
+                return True
+            if self.db.execute("SELECT 1 FROM tasks WHERE id = ? AND state = 'done'", (task_id,)).fetchone():
+                self._counters["duplicates"] += 1
+                return False
+            return True
+
+    def get_meta(self, task_id):
+        with self._lock:
+            row = self.db.execute(
+                "SELECT sender, source FROM tasks WHERE id = ? AND state != 'pending' AND meta_expires >= ?",
+                (task_id, time.time())).fetchone()
+        return {"sender": row[0], "source": row[1]} if row else {}
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            self._reap(now)
+            counts = dict(self.db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+            oldest_pending = self.db.execute("SELECT MIN(enqueued_at) FROM tasks WHERE state = 'pending'").fetchone()[0]
+            oldest_leased = self.db.execute("SELECT MIN(enqueued_at) FROM tasks WHERE state = 'leased'").fetchone()[0]
+            tracked = self.db.execute(
+                "SELECT COUNT(*) FROM tasks WHERE state != 'pending' AND meta_expires >= ?", (now,)).fetchone()[0]
+        return {
+            "backend": self.backend,
+            "pending": counts.get("pending", 0),
+            "leased": counts.get("leased", 0),
+            "results_tracked": tracked,
+            "oldest_pending_age": round(now - oldest_pending, 3) if oldest_pending else 0,
+            "oldest_leased_age": round(now - oldest_leased, 3) if oldest_leased else 0,
+            **self._counters,
+        }
+
+
+def create_task_queue(project_root):
+    """Builds the backend selected by TASK_QUEUE_BACKEND (memory | sqlite)."""
+    options = {
+        "visibility_timeout": env_number("TASK_VISIBILITY_TIMEOUT", "300"),
+        "results_ttl": env_number("RESULTS_TTL", "3600"),
+        "max_deliveries": int(env_number("TASK_MAX_DELIVERIES", "3")),
+    }
+    backend = os.getenv("TASK_QUEUE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("TASK_QUEUE_PATH", os.path.join(project_root, "server", "satele_tasks.db"))
+        print(f"🗄️ Task queue: SQLite (WAL) at {path}")
+        return SQLiteTaskQueue(path, **options)
+    return MemoryTaskQueue(**options)
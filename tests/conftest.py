@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ("brain", "server", os.path.join(".agent", "skills", "gmail")):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+# The monitor reads these at import time: keep its state out of the install and stay offline
+os.environ["SATELE_STATE_DIR"] = tempfile.mkdtemp(prefix="satele-tests-")
+os.environ["GOOGLE_API_KEY"] = ""
+os.environ.setdefault("REMOTE_BRIDGE_URL", "http://127.0.0.1:9")
@@ -0,0 +1,71 @@
+"""In-memory IMAP4 stand-in for the Gmail skill tests: the subset of UID SEARCH/FETCH the skill uses."""
+import email
+import email.utils
+import time
+
+
+def make_message(sender, subject, body, days_ago=0):
+    date = email.utils.formatdate(time.time() - days_ago * 86400)
+    return f"From: {sender}\r\nSubject: {subject}\r\nDate: {date}\r\n\r\n{body}\r\n".encode()
+
+
+class FakeImap:
+    def __init__(self, messages=None, uidvalidity=1):
+        self.messages = dict(messages or {})     # uid -> raw RFC 822 bytes
+        self.uidvalidity = uidvalidity
+        self.commands = []
+
+    def add(self, uid, sender, subject, body, days_ago=0):
+        self.messages[uid] = make_message(sender, subject, body, days_ago)
+
+    def select(self, mailbox, readonly=False):
+        return "OK", [str(len(self.messages)).encode()]
+
+    def response(self, code):
+        return code, [str(self.uidvalidity).encode()]
+
+    def noop(self):
+        return "OK", []
+
+    def logout(self):
+        pass
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        if command == "SEARCH":
+            return "OK", [" ".join(str(uid) for uid in self._search(args[-1])).encode()]
+        return "OK", self._fetch([int(uid) for uid in args[0].split(",")], args[1])
+
+    def _search(self, query):
+        uids = sorted(self.messages)
+        if query.startswith("UID "):
+            if query == "UID *":
+                return uids[-1:]
+            low, high = query[4:].split(":")
+            high = max(uids, default=0) if high == "*" else int(high)
+            # Like a real server, "N:*" always matches the highest UID
+            return [uid for uid in uids if int(low) <= uid <= high] or uids[-1:]
+        if query.startswith("SINCE "):
+            since = time.mktime(time.strptime(query.split('"')[1], "%d-%b-%Y"))
+            return [uid for uid in uids if self._date(uid) >= since]
+        return uids
+
+    def _date(self, uid):
+        return email.utils.parsedate_to_datetime(email.message_from_bytes(self.messages[uid])["Date"]).timestamp()
+
+    def _fetch(self, uids, items):
+        data = []
+        for uid in uids:
+            if uid not in self.messages:
+                continue
+            raw = self.messages[uid]
+            head, _, body = raw.partition(b"\r\n\r\n")
+            if "BODYSTRUCTURE" in items:
+                structure = b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" %d 1)' % len(body)
+                data += [(b"1 (UID %d BODYSTRUCTURE %s BODY[HEADER.FIELDS (FROM SUBJECT DATE)] {%d}" % (uid, structure, len(head) + 4),
+                          head + b"\r\n\r\n"), b")"]
+            elif "BODY.PEEK[1]" in items:
+                data += [(b"1 (UID %d BODY[1] {%d}" % (uid, len(body)), body), b")"]
+            else:
+                data += [(b"1 (UID %d BODY[] {%d}" % (uid, len(raw)), raw), b")"]
+        return data
@@ -0,0 +1,84 @@
+from extract import SectionFilter, bodystructure, decode_part, parse_sexp, text_part
+
+PLAIN = b'("text" "plain" ("charset" "UTF-8") NIL NIL "quoted-printable" 120 4 NIL NIL NIL)'
+HTML = b'("text" "html" ("charset" "UTF-8") NIL NIL "quoted-printable" 300 6 NIL NIL NIL)'
+PDF = b'("application" "pdf" ("name" "r.pdf") NIL NIL "base64" 5000 NIL ("attachment" ("filename" "r.pdf")) NIL)'
+NOTES = b'("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" 40 2 NIL ("attachment" ("filename" "notes.txt")) NIL)'
+
+
+def structure(body):
+    return text_part(bodystructure(b"1 (UID 7 BODYSTRUCTURE " + body + b" BODY[HEADER.FIELDS (FROM)] {12}"))
+
+
+def multipart(subtype, *parts):
+    return b"(" + b"".join(parts) + b' "' + subtype + b'" ("boundary" "b") NIL NIL)'
+
+
+def test_alternative_prefers_the_plain_part():
+    assert structure(multipart(b"alternative", PLAIN, HTML)) == ("1", "plain", "quoted-printable", "UTF-8")
+    assert structure(multipart(b"alternative", HTML, PLAIN)) == ("2", "plain", "quoted-printable", "UTF-8")
+
+
+def test_nested_multipart_numbers_the_sections():
+    nested = multipart(b"alternative", PLAIN.replace(b"UTF-8", b"iso-8859-1").replace(b"quoted-printable", b"base64"), HTML)
+    assert structure(multipart(b"mixed", nested, PDF)) == ("1.1", "plain", "base64", "iso-8859-1")
+    related = multipart(b"related", multipart(b"alternative", PLAIN, HTML), PDF)
+    assert structure(multipart(b"mixed", PDF, related)) == ("2.1.1", "plain", "quoted-printable", "UTF-8")
+
+
+def test_html_only_message():
+    html = HTML.replace(b"quoted-printable", b"7bit")
+    assert structure(html) == ("1", "html", "7bit", "UTF-8")
+    # A plain-text attachment is not the body
+    assert structure(multipart(b"mixed", NOTES, HTML)) == ("2", "html", "quoted-printable", "UTF-8")
+    assert structure(multipart(b"mixed", NOTES, PDF)) is None
+
+
+def test_parse_sexp_and_missing_structure():
+    assert parse_sexp(rb'("a \"b\"" NIL (x 12)) trailing') == [["a \"b\"", None, ["x", "12"]], "trailing"]
+    assert bodystructure(b"1 (UID 7 BODY[1] {3}") is None
+    assert text_part(None) is None
+
+
+def test_decode_part():
+    assert decode_part(b"Y2Fm6Q==", "base64", "iso-8859-1") == "café"
+    assert decode_part(b"caf=C3=A9", "quoted-printable", "utf-8") == "café"
+    assert decode_part("café".encode(), "8bit", "x-unknown") == "café"
+
+
+LETTER = "\n".join([
+    "Hello,",                        # 0
+    "equity is up this week",        # 1
+    "", "", "", "", "", "", "",      # 2-8
+    "Final-Equity: 1000",            # 9
+    "",                              # 10
+    "final equity after fees: 990",  # 11
+    "", "", "", "", "", "", "", "",  # 12-19
+    "final notes",                   # 20
+])
+
+
+def test_section_filter_ranks_the_phrase_first():
+    found = SectionFilter("final equity", before=0, after=0, max_sections=5).sections(LETTER)
+    assert found == [(5, "Final-Equity: 1000"), (5, "final equity after fees: 990"),
+                     (1, "equity is up this week"), (1, "final notes")]
+
+
+def test_section_filter_merges_overlapping_windows():
+    sections = SectionFilter("final equity", before=1, after=1).sections(LETTER)
+    # Lines 9 and 11 share one window
+    assert sections[0] == (5, "Final-Equity: 1000\n\nfinal equity after fees: 990")
+    assert [score for score, _ in sections] == [5, 1, 1]
+    assert len(SectionFilter("final equity", before=1, after=1, max_sections=1).sections(LETTER)) == 1
+    # With equal scores, the section with more hits comes first, then the earlier one
+    assert SectionFilter("equity", before=1, after=1).extract(LETTER).split("\n...\n") == [
+        "Final-Equity: 1000\n\nfinal equity after fees: 990", "Hello,\nequity is up this week"]
+
+
+def test_section_filter_words():
+    assert SectionFilter("P&L of the fund").words == ["the", "fund"]
+    assert SectionFilter("of a").words == ["of", "a"]
+    assert not SectionFilter("  ") and SectionFilter("").extract(LETTER) is None
+    assert SectionFilter("missing").extract(LETTER) is None
+    assert SectionFilter("final equity").imap_criteria() == 'OR BODY "final" BODY "equity"'
+    assert SectionFilter("équité").imap_criteria() == ""
@@ -0,0 +1,44 @@
+import pytest
+
+import gmail_tool
+from fake_imap import FakeImap
+from mail_cache import MailCache
+
+
+@pytest.fixture
+def imap(tmp_path, monkeypatch):
+    server = FakeImap()
+    monkeypatch.setattr(gmail_tool, "connect", lambda: server)
+    monkeypatch.setattr(gmail_tool, "_pool", None)
+    monkeypatch.setattr(gmail_tool, "_cache", MailCache(str(tmp_path / "cache.db")))
+    monkeypatch.setattr(gmail_tool, "_sync_thread", None)
+    monkeypatch.setenv("GMAIL_CACHE", "1")
+    yield server
+    gmail_tool._pool.close_all()
+
+
+def test_in_process_first_sync_fills_the_cache(imap):
+    imap.add(1, "a@x", "Report", "final equity: 1000", days_ago=3)
+    imap.add(2, "b@x", "Two", "balance", days_ago=1)
+
+    cache, offline = gmail_tool.synced_cache()
+
+    assert cache is not None and not offline
+    assert gmail_tool._sync_thread is None
+    assert cache.get(1)["body"].strip() == "final equity: 1000"
+    assert sorted(m["uid"] for m in cache.query(None, None, None, limit=5)) == [1, 2]
+
+
+def test_in_process_backlog_refills_only_the_newest_messages(imap, monkeypatch):
+    monkeypatch.setenv("GMAIL_SYNC_INLINE_MAX", "2")
+    monkeypatch.setenv("GMAIL_SYNC_INTERVAL", "0")
+    imap.add(1, "a@x", "One", "first", days_ago=3)
+    gmail_tool.synced_cache()
+    for uid in (2, 3, 4):
+        imap.add(uid, "b@x", f"New {uid}", "later", days_ago=0)
+
+    cache, _ = gmail_tool.synced_cache()
+
+    assert gmail_tool._sync_thread is None
+    assert sorted(m["uid"] for m in cache.query(None, None, None, limit=10)) == [3, 4]
+    assert cache.state()["last_uid"] == 4
@@ -0,0 +1,52 @@
+import os
+import socket
+import tempfile
+import threading
+
+import pytest
+
+from imap_pool import DaemonClient
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+@pytest.fixture
+def socket_path():
+    # Short path: Unix socket paths are limited to ~100 bytes
+    directory = tempfile.mkdtemp(prefix="imap-")
+    yield os.path.join(directory, "d.sock")
+
+
+def listen(path, reply=None):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    received = []
+
+    def accept():
+        conn, _ = server.accept()
+        with conn:
+            received.append(conn.makefile("rb").readline())
+            if reply is not None:
+                conn.sendall(reply)
+            threading.Event().wait(1)
+        server.close()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return received
+
+
+def test_unreachable_daemon_falls_back_to_in_process(socket_path):
+    assert DaemonClient(socket_path).request("search", []) is None
+
+
+def test_answer_from_daemon(socket_path):
+    listen(socket_path, reply=b'{"output": "done"}\n')
+    assert DaemonClient(socket_path, timeout=5).request("search", ["{}"]) == "done"
+
+
+def test_timeout_after_sending_is_an_error_not_a_rerun(socket_path):
+    received = listen(socket_path)
+    output = DaemonClient(socket_path, timeout=0.2).request("search", ["{}"])
+    assert output is not None and output.startswith("Error: no answer from the daemon")
+    assert len(received) == 1
@@ -0,0 +1,60 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+AUTH = {"Authorization": "Bearer default-secret-key"}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def bridge(request, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    import main
+    from task_queue import MemoryTaskQueue, SQLiteTaskQueue
+    if request.param == "sqlite":
+        # Runs in worker threads: its requeue wakeups come from off the event loop
+        queue = SQLiteTaskQueue(str(tmp_path / "tasks.db"), visibility_timeout=0.3)
+    else:
+        queue = MemoryTaskQueue(visibility_timeout=0.3)
+    queue.on_requeue = main.schedule_wakeup
+    monkeypatch.setattr(main, "task_queue", queue)
+    monkeypatch.setattr(main, "LONG_POLL_RECHECK", 0.1)
+    # Each TestClient runs its own event loop
+    monkeypatch.setattr(main, "task_available", asyncio.Condition())
+    with TestClient(main.app) as client:
+        yield main, client
+
+
+def test_parked_poll_gets_a_redelivered_task(bridge):
+    main, client = bridge
+    main.task_queue.put({"id": "t1", "instruction": "status", "sender": "s1"})
+    assert client.get("/get-task", headers=AUTH).json()["id"] == "t1"
+
+    # Nobody acks it: the lease expires while the next poll is parked, with no webhook to notify
+    started = time.time()
+    task = client.get("/get-task?wait=5", headers=AUTH).json()
+    assert task["id"] == "t1" and task["deliveries"] == 2
+    assert time.time() - started < 2
+
+
+def test_ack_wakes_a_poll_waiting_for_the_same_sender(bridge, monkeypatch):
+    main, client = bridge
+    # Only a notify can wake the poll in time
+    monkeypatch.setattr(main, "LONG_POLL_RECHECK", 100)
+    main.task_queue.visibility_timeout = 300
+    main.task_queue.put({"id": "t1", "instruction": "first", "sender": "s1"})
+    main.task_queue.put({"id": "t2", "instruction": "second", "sender": "s1"})
+    assert client.get("/get-task?consumer=a", headers=AUTH).json()["id"] == "t1"
+
+    # Monitor b may not take t2 while a is working on the same sender's t1
+    result = {}
+    poll = threading.Thread(target=lambda: result.update(
+        task=client.get("/get-task?consumer=b&wait=5", headers=AUTH).json()))
+    poll.start()
+    time.sleep(0.3)
+    started = time.time()
+    client.post("/ack", json={"id": "t1"}, headers=AUTH)
+    poll.join()
+    assert result["task"]["id"] == "t2"
+    assert time.time() - started < 2
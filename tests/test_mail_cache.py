@@ -0,0 +1,120 @@
+import pytest
+
+from fake_imap import FakeImap
+from gmail_tool import fetch_texts, uid_search
+from mail_cache import MailCache
+
+
+@pytest.fixture
+def imap():
+    server = FakeImap()
+    server.add(1, "old@x", "Ancient", "from last year", days_ago=40)
+    server.add(2, "alice@x", "Weekly report", "final equity: 1000", days_ago=3)
+    server.add(3, "bob@x", "Lunch", "the report can wait", days_ago=2)
+    return server
+
+
+@pytest.fixture
+def cache():
+    return MailCache(":memory:")
+
+
+def sync(cache, imap, **options):
+    return cache.sync(imap, uid_search, fetch_texts, **options)
+
+
+def uids(cache, **filters):
+    return [m["uid"] for m in cache.query(limit=10, **filters)]
+
+
+def test_first_sync_covers_recent_mail_then_fetches_only_new_uids(cache, imap):
+    assert sync(cache, imap) == 2
+    assert uids(cache) == [2, 3]
+    assert cache.state()["last_uid"] == 3
+    assert cache.get(2)["body"].strip() == "final equity: 1000"
+    assert cache.covers(cache.state()["covers_since"]) and not cache.covers(0)
+
+    imap.add(4, "carol@x", "New", "hello", days_ago=0)
+    imap.commands.clear()
+    assert sync(cache, imap) == 1
+    assert ("SEARCH", None, "UID 4:*") in imap.commands
+    assert uids(cache) == [2, 3, 4]
+    # Nothing new: "4:*" still matches UID 4 on the server, but it isn't fetched again
+    assert sync(cache, imap) == 0
+
+
+def test_sync_gives_up_on_too_many_new_messages(cache, imap):
+    sync(cache, imap)
+    for uid in (4, 5, 6):
+        imap.add(uid, "carol@x", f"New {uid}", "hello", days_ago=0)
+
+    assert sync(cache, imap, max_new=2) is None
+    assert cache.state()["last_uid"] == 3
+    assert sync(cache, imap, max_new=3) == 3
+
+
+def test_capped_first_sync_covers_from_the_oldest_cached_message(cache, imap):
+    assert sync(cache, imap, max_initial=1) == 1
+    assert uids(cache) == [3]
+    assert cache.state()["covers_since"] == cache.get(3)["date_epoch"]
+
+
+def test_sync_prunes_messages_expunged_on_the_server(cache, imap):
+    sync(cache, imap)
+    del imap.messages[2]
+    imap.add(4, "carol@x", "New", "hello", days_ago=0)
+
+    assert sync(cache, imap) == 1
+    assert uids(cache) == [3, 4]
+    assert cache.get(2) is None
+    assert uids(cache, text="equity") == []
+
+
+def test_uidvalidity_change_rebuilds_the_cache(cache, imap):
+    sync(cache, imap)
+    # The server renumbered the mailbox: UID 2 is now a different message
+    imap.messages = {}
+    imap.add(2, "dave@x", "Renumbered", "new content", days_ago=1)
+    imap.add(5, "alice@x", "Weekly report", "final equity: 1000", days_ago=3)
+    imap.uidvalidity = 2
+
+    assert sync(cache, imap) == 2
+    assert cache.state()["uidvalidity"] == 2
+    assert cache.get(2)["subject"] == "Renumbered"
+    assert uids(cache) == [5, 2]
+
+
+@pytest.fixture(params=["fts", "like"])
+def filled(request, cache, imap):
+    imap.add(4, "50%_off@shop", "Sale", "everything must go", days_ago=1)
+    sync(cache, imap)
+    if request.param == "like":
+        cache.fts = False
+    return cache
+
+
+def test_query_filters(filled):
+    assert uids(filled, sender="alice") == [2]
+    assert uids(filled, subject="REPORT") == [2]
+    # LIKE wildcards in the filter are matched literally
+    assert uids(filled, sender="50%_") == [4]
+    assert uids(filled, sender="5_%") == []
+    assert uids(filled, since=filled.get(3)["date_epoch"]) == [3, 4]
+    assert uids(filled, body_words=["equity", "everything"]) == [2, 4]
+    assert [m["uid"] for m in filled.query(limit=2)] == [3, 4]
+    assert "body" in filled.query(with_body=True)[0] and "body" not in filled.query()[0]
+
+
+def test_text_query_matches_subject_or_body(filled):
+    assert sorted(uids(filled, text="report")) == [2, 3]
+    assert uids(filled, text="equity", sender="bob") == []
+    assert uids(filled, text="nothing like this") == []
+
+
+def test_fts_ranks_subject_matches_first(cache, imap):
+    sync(cache, imap)
+    assert cache.fts
+    # "report" is in 3's body but 2's subject, which bm25 weighs higher, although 3 is newer
+    assert uids(cache, text="report") == [2, 3]
+    # More of the words rank higher
+    assert uids(cache, text="report wait") == [3, 2]
@@ -0,0 +1,91 @@
+import datetime
+import zlib
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+np = pytest.importorskip("numpy")
+
+from memory import Memory
+
+
+class HashEmbedder:
+    """Bag-of-words hashing vectors: deterministic and no model download."""
+    ready = True
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), 64), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode()) % 64] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+def test_recall_by_sender_finds_legacy_entries_without_sender(tmp_path):
+    path = str(tmp_path / "memory")
+    # A collection written before per-sender partitioning: no sender / timestamp_epoch
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection(name="satele_logs")
+    text = "the backup server lives at 10.0.0.7"
+    collection.add(ids=["legacy-1"], documents=[text], embeddings=HashEmbedder().embed([text]).tolist(),
+                   metadatas=[{"role": "user", "timestamp": datetime.datetime.now().isoformat()}])
+
+    memory = Memory(db_path=path, silent=True, embedder=HashEmbedder())
+    hits = memory.search("where is the backup server", sender="alice")
+    assert [h["id"] for h in hits] == ["legacy-1"]
+    assert hits[0]["metadata"]["sender"] == ""
+    assert any("10.0.0.7" in line for line in memory.recall("backup server", sender="alice"))
+
+
+class SlowCustomEmbedder(HashEmbedder):
+    """A custom EMBED_MODEL that is only loaded by the first embed() call."""
+    matches_chroma_default = False
+
+    def __init__(self, size=64):
+        self.size = size
+        self.ready = False
+
+    def load(self):
+        self.ready = True
+
+    def embed(self, texts):
+        self.load()
+        return HashEmbedder.embed(self, texts)[:, :self.size]
+
+
+def test_custom_model_is_waited_for_instead_of_chroma_default(tmp_path):
+    embedder = SlowCustomEmbedder()
+    memory = Memory(db_path=str(tmp_path / "memory"), silent=True, embedder=embedder)
+    text = "the backup server lives at 10.0.0.7"
+    memory.collection.add(ids=["old"], documents=[text], embeddings=HashEmbedder().embed([text]).tolist(),
+                          metadatas=[{"role": "user", "sender": "", "timestamp_epoch": 0.0}])
+
+    # Still loading: keyword ranking only, no Chroma default vectors for the query
+    assert [h["id"] for h in memory.search("backup server")] == ["old"]
+    assert not embedder.ready
+
+    memory.remember("the printer is on the second floor", metadata={"sender": "alice"})
+    assert embedder.ready
+    vectors = memory.collection.get(include=["embeddings"])["embeddings"]
+    assert {len(v) for v in vectors} == {64}
+
+
+def test_reindex_swaps_in_a_collection_with_the_new_vector_size(tmp_path):
+    from memory_tools import reindex_memory
+
+    path = str(tmp_path / "memory")
+    memory = Memory(db_path=path, silent=True, embedder=HashEmbedder())
+    for i, text in enumerate(["backup server at 10.0.0.7", "printer on the second floor", "vpn uses wireguard"]):
+        memory.remember(text, metadata={"sender": "alice", "n": i})
+
+    memory.embedder = SlowCustomEmbedder(size=32)
+    assert reindex_memory(memory, batch_size=2) == 3
+
+    names = [c.name for c in memory.client.list_collections()]
+    assert names == ["satele_logs"]
+    got = memory.collection.get(include=["embeddings", "metadatas"])
+    assert {len(v) for v in got["embeddings"]} == {32}
+    assert {m["sender"] for m in got["metadatas"]} == {"alice"}
+    assert memory.collection.metadata.get("partitioned")
+
+    reopened = Memory(db_path=path, silent=True, embedder=SlowCustomEmbedder(size=32))
+    assert reopened.search("backup server", sender="alice")[0]["document"] == "backup server at 10.0.0.7"
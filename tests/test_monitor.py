@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def monitor():
+    import monitor
+    return monitor
+
+
+def test_export_then_plain_command_use_the_session(monitor, monkeypatch):
+    session = monitor.sessions.get("test-export")
+    plans = iter([["export FOO=bar"], ["echo value=$FOO"]])
+    monkeypatch.setattr(monitor, "ai_interpret", lambda *args, **kwargs: next(plans))
+
+    assert "Session variable set: FOO" in monitor.process_instruction("set foo to bar", session=session)
+    assert session.env == {"FOO": "bar"}
+    assert "value=bar" in monitor.process_instruction("print foo", session=session)
+
+
+def test_plain_command_runs_in_the_session_cwd(monitor, monkeypatch, tmp_path):
+    session = monitor.sessions.get("test-cwd")
+    session.chdir(str(tmp_path))
+    monkeypatch.setattr(monitor, "ai_interpret", lambda *args, **kwargs: ["pwd"])
+
+    assert str(tmp_path) in monitor.process_instruction("where am i", session=session)
@@ -0,0 +1,29 @@
+import sys
+
+import pytest
+
+from sandbox_kernel import SandboxKernel
+
+KEPT = "variables from earlier steps are kept"
+
+
+@pytest.fixture
+def kernel(tmp_path):
+    kernel = SandboxKernel(sys.executable, str(tmp_path), memory_mb=0, cpu_seconds=0, file_mb=0)
+    yield kernel
+    kernel.close()
+
+
+def test_interrupt_only_mentions_kept_variables_when_there_are_some(kernel, tmp_path):
+    spin = "import time\nwhile True:\n    time.sleep(0.01)\n"
+
+    output, status = kernel.run(spin, str(tmp_path / "step1.py"), timeout=0.5)
+    assert status == "timeout" and "interrupted" in output and KEPT not in output
+
+    assert kernel.run("x = 41", str(tmp_path / "step2.py"), timeout=5) == ("", "ok")
+    output, status = kernel.run(spin, str(tmp_path / "step3.py"), timeout=0.5)
+    assert status == "timeout" and KEPT in output
+
+    output, status = kernel.run(spin, str(tmp_path / "probe.py"), timeout=0.5, fresh=True)
+    assert status == "timeout" and KEPT not in output
+    assert kernel.run("print(x + 1)", str(tmp_path / "step4.py"), timeout=5) == ("42\n", "ok")
@@ -0,0 +1,47 @@
+import json
+import threading
+
+from session import SessionStore
+
+
+def test_saves_while_other_sessions_change(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.json"), str(tmp_path))
+    errors = []
+
+    def worker(sender):
+        session = store.get(sender)
+        try:
+            for i in range(300):
+                store.set_env(session, f"VAR_{i}", str(i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(f"user-{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(tmp_path / "sessions.json") as f:
+        saved = json.load(f)
+    assert {sender: len(data["env"]) for sender, data in saved.items()} == {f"user-{n}": 300 for n in range(4)}
+
+
+def test_to_dict_is_a_snapshot(tmp_path):
+    session = SessionStore(str(tmp_path / "sessions.json"), str(tmp_path)).get("alice")
+    data = session.to_dict()
+    session.env["LATER"] = "1"
+    assert data["env"] == {}
+
+
+def test_set_env_waits_for_a_save_in_progress(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.json"), str(tmp_path))
+    session = store.get("alice")
+    with store._lock:   # as held by save() while it serialises the sessions
+        writer = threading.Thread(target=store.set_env, args=(session, "FOO", "bar"))
+        writer.start()
+        writer.join(0.2)
+        assert session.env == {}
+    writer.join()
+    assert session.env == {"FOO": "bar"}
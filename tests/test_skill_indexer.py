@@ -0,0 +1,83 @@
+import os
+import zlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from skill_indexer import SkillIndexer
+from skill_registry import SkillRegistry
+
+
+class CountingEmbedder:
+    """Bag-of-words hashing vectors that records every text it embeds."""
+    ready = True
+
+    def __init__(self):
+        self.embedded = []
+
+    def load(self):
+        pass
+
+    def embed(self, texts):
+        self.embedded += texts
+        vectors = np.zeros((len(texts), 64), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().replace(":", " ").split():
+                vectors[row, zlib.crc32(word.encode()) % 64] += 1
+        return vectors
+
+
+def write_skill(root, name, description, script="tool.py"):
+    folder = os.path.join(root, ".agent", "skills", name)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "SKILL.md"), "w") as f:
+        f.write(f"---\nname: {name}\ndescription: {description}\n---\n`python3 .agent/skills/{name}/{script} run`\n")
+
+
+@pytest.fixture
+def root(tmp_path):
+    os.makedirs(tmp_path / "brain")
+    write_skill(str(tmp_path), "weather", "forecast and temperature for a city")
+    write_skill(str(tmp_path), "gmail", "search and read email messages")
+    return str(tmp_path)
+
+
+def test_index_follows_the_registry_and_embeds_only_changed_skills(root):
+    registry = SkillRegistry(root, poll_interval=0, log=lambda *a: None)
+    embedder = CountingEmbedder()
+    indexer = SkillIndexer(root, embedder=embedder, registry=registry)
+    registry.on_change(indexer.refresh)
+
+    assert indexer.index_all_skills() == 2
+    assert sorted(embedder.embedded) == ["gmail: search and read email messages", "weather: forecast and temperature for a city"]
+    assert indexer.search_ids("read my email messages", top_k=1) == ["gmail"]
+    assert indexer.data["skills"]["gmail"]["commands"] == [f"python3 {root}/.agent/skills/gmail/tool.py run"]
+
+    embedder.embedded.clear()
+    write_skill(root, "weather", "weather forecast, rain and temperature for any city")
+    write_skill(root, "gmail", "search and read email messages", script="gmail_tool.py")
+    write_skill(root, "notes", "take and list notes")
+    assert registry.refresh()
+    # gmail's command moved but its embedded text didn't: only weather and notes are embedded
+    assert sorted(embedder.embedded) == ["notes: take and list notes",
+                                         "weather: weather forecast, rain and temperature for any city"]
+    assert indexer.data["skills"]["gmail"]["commands"] == [f"python3 {root}/.agent/skills/gmail/gmail_tool.py run"]
+
+    embedder.embedded.clear()
+    os.remove(os.path.join(root, ".agent", "skills", "notes", "SKILL.md"))
+    assert registry.refresh()
+    assert indexer.index_all_skills() == 2
+    assert embedder.embedded == []
+    assert set(indexer.data["skills"]) == {"weather", "gmail"}
+    assert indexer.search_ids("will it rain in the city", top_k=1) == ["weather"]
+
+
+def test_restart_reuses_the_stored_vectors(root):
+    SkillIndexer(root, embedder=CountingEmbedder()).index_all_skills()
+
+    embedder = CountingEmbedder()
+    indexer = SkillIndexer(root, embedder=embedder)
+    assert indexer.index_all_skills() == 2
+    assert embedder.embedded == []
+    assert indexer.search_ids("read my email messages", top_k=1) == ["gmail"]
@@ -0,0 +1,27 @@
+import time
+import threading
+
+from task_pool import TaskPool
+
+
+def test_same_key_runs_in_submission_order_across_lanes():
+    pool = TaskPool({"fast": 2, "slow": 1})
+    order = []
+    done = threading.Event()
+
+    def slow():
+        time.sleep(0.3)
+        order.append("slow")
+
+    def fast():
+        order.append("fast")
+        done.set()
+
+    pool.submit("slow", "alice", slow)
+    pool.submit("fast", "alice", fast)
+    # Other senders are not held up
+    pool.submit("fast", "bob", order.append, "other")
+
+    assert done.wait(5)
+    assert order == ["other", "slow", "fast"]
+    assert pool.backlog() == 0
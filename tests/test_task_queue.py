@@ -0,0 +1,189 @@
+import random
+import types
+
+import pytest
+
+import task_queue
+from task_queue import MemoryTaskQueue, SQLiteTaskQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    def make(**options):
+        if request.param == "sqlite":
+            return SQLiteTaskQueue(str(tmp_path / "tasks.db"), **options)
+        return MemoryTaskQueue(**options)
+    return make
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the queue's wall clock with one the test moves by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(task_queue, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+class LinearQueue:
+    """Reference: scans every pending task and lease on each call."""
+
+    def __init__(self):
+        self.pending = []   # [position, task], kept sorted by position
+        self.leased = {}    # task_id -> [position, task]
+        self.last = 0
+
+    def put(self, task):
+        self.last += 1
+        self.pending.append([self.last, dict(task)])
+
+    def next_index(self, consumer, tags):
+        busy = {task["sender"]: task["consumer"] for _, task in self.leased.values()}
+        for i, (_, task) in enumerate(self.pending):
+            if set(task["requires"]) <= set(tags) and busy.get(task["sender"], consumer) == consumer:
+                return i
+        return None
+
+    def lease(self, consumer, tags):
+        index = self.next_index(consumer, tags)
+        if index is None:
+            return None
+        entry = self.pending.pop(index)
+        entry[1]["consumer"] = consumer
+        self.leased[entry[1]["id"]] = entry
+        return entry[1]
+
+    def ack(self, task_id):
+        self.leased.pop(task_id, None)
+        self.pending = [e for e in self.pending if e[1]["id"] != task_id]
+
+    def release(self, consumer):
+        """Requeues the consumer's tasks, each back in its place."""
+        released = [e for e in self.leased.values() if e[1]["consumer"] == consumer]
+        for entry in released:
+            del self.leased[entry[1]["id"]]
+        self.pending = sorted(self.pending + released, key=lambda e: e[0])
+        return len(released)
+
+
+def test_queue_matches_linear_scan(make_queue):
+    rng = random.Random(7)
+    queue, reference = make_queue(max_deliveries=100), LinearQueue()
+    consumers = {"a": [], "b": ["gmail"], "c": ["gmail", "gpu"], None: []}
+    for step in range(3000):
+        op = rng.random()
+        if op < 0.4:
+            task = {"id": f"t{step}", "sender": rng.choice(["s1", "s2", "s3", "s4", None]),
+                    "requires": rng.choice([[], [], ["gmail"], ["gpu"], ["gmail", "gpu"]])}
+            queue.put(dict(task))
+            reference.put(task)
+        elif op < 0.75:
+            consumer = rng.choice(list(consumers))
+            tags = consumers[consumer]
+            assert queue.has_pending(consumer, tags) == (reference.next_index(consumer, tags) is not None)
+            got, want = queue.lease(consumer, tags), reference.lease(consumer, tags)
+            assert (got and got["id"]) == (want and want["id"])
+        elif op < 0.97:
+            # Mostly results for leased tasks, sometimes a late one for a task back in the queue
+            ids = sorted(reference.leased) if rng.random() < 0.8 else [task["id"] for _, task in reference.pending]
+            if ids:
+                task_id = rng.choice(ids)
+                assert queue.ack(task_id)
+                reference.ack(task_id)
+        else:
+            consumer = rng.choice(list(consumers))
+            assert queue.release(consumer) == reference.release(consumer)
+        stats = queue.stats()
+        assert (stats["pending"], stats["leased"]) == (len(reference.pending), len(reference.leased))
+
+
+def test_requeued_task_is_redelivered_first_and_sender_stays_exclusive(make_queue):
+    queue = make_queue()
+    for task_id, sender in (("t1", "alice"), ("t2", "alice"), ("t3", "bob"), ("t4", "carol")):
+        queue.put({"id": task_id, "sender": sender})
+    assert queue.lease("a")["id"] == "t1"
+    # alice is busy with consumer a: b skips her next task, a may take it
+    assert queue.lease("b")["id"] == "t3"
+    assert queue.lease("a")["id"] == "t2"
+
+    woken = []
+    queue.on_requeue = woken.append
+    assert queue.release("b") == 1
+    assert woken == [1]
+    # bob's task is back in front of carol's; alice's is still a's
+    assert queue.lease("c")["id"] == "t3"
+    assert queue.lease("c")["id"] == "t4"
+    assert queue.lease("c") is None
+    assert queue.ack("t1") and queue.ack("t2")
+    assert queue.stats()["pending"] == 0
+
+
+def test_sqlite_expired_lease_is_requeued(tmp_path, clock):
+    queue = SQLiteTaskQueue(str(tmp_path / "tasks.db"), visibility_timeout=10)
+    woken = []
+    queue.on_requeue = woken.append
+    queue.put({"id": "t1", "sender": "alice"})
+    assert queue.lease("a")["deliveries"] == 1
+    assert not queue.has_pending("b")
+
+    clock[0] += 5
+    assert queue.extend("t1", "a")
+    clock[0] += 11
+    # The extended lease ran out: the task, and alice, are free for another consumer
+    task = queue.lease("b")
+    assert (task["id"], task["deliveries"], task["consumer"]) == ("t1", 2, "b")
+    assert woken == [1]
+    assert not queue.extend("t1", "a")
+    assert queue.stats()["redelivered"] == 1
+
+
+def test_sqlite_task_is_dropped_after_max_deliveries(tmp_path, clock):
+    queue = SQLiteTaskQueue(str(tmp_path / "tasks.db"), visibility_timeout=10, max_deliveries=2)
+    queue.put({"id": "t1", "sender": "alice"})
+    queue.put({"id": "t2", "sender": "alice"})
+    for _ in range(2):
+        assert queue.lease("a")["id"] == "t1"
+        clock[0] += 11
+    # t1 is dead; alice's next task goes out
+    assert queue.lease("a")["id"] == "t2"
+    stats = queue.stats()
+    assert (stats["pending"], stats["leased"], stats["dropped"], stats["redelivered"]) == (0, 1, 1, 1)
+    # A late result for the dropped task is still accepted once
+    assert queue.ack("t1")
+    assert not queue.ack("t1")
+
+
+def test_sqlite_evicts_finished_tasks_after_results_ttl(tmp_path, clock):
+    queue = SQLiteTaskQueue(str(tmp_path / "tasks.db"), results_ttl=100)
+    queue.put({"id": "t1", "sender": "alice", "source": "whatsapp"})
+    queue.lease("a")
+    assert queue.ack("t1")
+    assert queue.get_meta("t1") == {"sender": "alice", "source": "whatsapp"}
+    assert queue.stats()["results_tracked"] == 1
+
+    clock[0] += 101
+    assert queue.get_meta("t1") == {}
+    assert queue.stats()["results_tracked"] == 0
+    assert queue.db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 0
+
+
+def test_sqlite_queue_survives_a_restart(tmp_path, clock):
+    path = str(tmp_path / "tasks.db")
+    queue = SQLiteTaskQueue(path, visibility_timeout=10)
+    queue.put({"id": "t1", "sender": "alice", "requires": ["gpu", "gmail"], "command": "report"})
+    queue.put({"id": "t2", "sender": "alice"})
+    queue.put({"id": "t3", "sender": "bob"})
+    assert queue.lease("a", ["gmail", "gpu"])["id"] == "t1"
+    assert queue.lease("b")["id"] == "t3"
+    assert queue.ack("t3")
+    queue.db.close()
+
+    queue = SQLiteTaskQueue(path, visibility_timeout=10)
+    stats = queue.stats()
+    assert (stats["pending"], stats["leased"]) == (1, 1)
+    # The lease outlives the restart: alice stays with consumer a until it runs out
+    assert queue.lease("b") is None
+    assert not queue.ack("t3")
+    clock[0] += 11
+    task = queue.lease("b", ["gmail", "gpu"])
+    assert (task["id"], task["command"], task["deliveries"]) == ("t1", "report", 2)
+    assert queue.lease("b")["id"] == "t2"
@@ -0,0 +1,90 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from vector_store import VectorStore
+
+
+def vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+@pytest.fixture
+def base(tmp_path):
+    return str(tmp_path / "vault")
+
+
+def test_new_records_reuse_deleted_rows(base):
+    store = VectorStore(base)
+    for i, key in enumerate("abc"):
+        store.put(key, {"name": key}, vec(i, i, i))
+    assert store.vectors(["a", "b", "c"]).tolist() == [[0, 0, 0], [1, 1, 1], [2, 2, 2]]
+    size = os.path.getsize(store.vectors_path)
+
+    freed = store.get("b")["row"]
+    store.delete("b")
+    store.put("d", {"name": "d"}, vec(7, 8, 9))
+
+    assert store.get("d")["row"] == freed
+    assert os.path.getsize(store.vectors_path) == size
+    assert store.vectors(["c", "a", "d"]).tolist() == [[2, 2, 2], [0, 0, 0], [7, 8, 9]]
+
+
+def test_update_patches_the_row_in_place(base):
+    store = VectorStore(base)
+    store.put("a", {"hash": 1}, vec(1, 2))
+    store.put("b", {"hash": 1}, vec(3, 4))
+    store.vectors(["a"])   # maps the file before it changes
+
+    store.put("a", {"hash": 2}, vec(5, 6))
+    store.put("b", {"hash": 3})
+
+    assert (store.get("a"), store.get("b")) == ({"hash": 2, "row": 0}, {"hash": 3, "row": 1})
+    assert os.path.getsize(store.vectors_path) == 2 * 2 * 2
+    assert store.vectors(["a", "b"]).tolist() == [[5, 6], [3, 4]]
+    with pytest.raises(ValueError):
+        store.put("c", {"hash": 1})
+    with pytest.raises(ValueError):
+        store.put("c", {"hash": 1}, vec(1, 2, 3))
+
+
+def test_meta_json_matches_the_vector_file_across_reloads(base):
+    store = VectorStore(base)
+    for i, key in enumerate("abc"):
+        store.put(key, {"name": key}, vec(i, -i))
+    store.delete("a")
+    store.save()
+
+    with open(base + ".meta.json") as f:
+        meta = json.load(f)
+    assert (meta["dim"], meta["rows"], meta["free"], meta["dtype"]) == (2, 3, [0], "<f2")
+    assert meta["records"] == {"b": {"name": "b", "row": 1}, "c": {"name": "c", "row": 2}}
+    assert not os.path.exists(base + ".meta.json.tmp")
+
+    reloaded = VectorStore(base)
+    assert (reloaded.records, reloaded._free, reloaded._rows) == (store.records, [0], 3)
+    assert reloaded.vectors(["c", "b"]).tolist() == [[2, -2], [1, -1]]
+    # The freed row is still reused after the reload
+    reloaded.put("d", {"name": "d"}, vec(4, 4))
+    assert reloaded.get("d")["row"] == 0
+    assert os.path.getsize(base + ".f16") == 3 * 2 * 2
+
+
+def test_truncated_vector_file_drops_the_missing_rows(base):
+    store = VectorStore(base)
+    for i, key in enumerate("abc"):
+        store.put(key, {}, vec(i, i))
+    store.delete("a")
+    store.save()
+    with open(store.vectors_path, "r+b") as f:
+        f.truncate(2 * 2 * 2)
+
+    reloaded = VectorStore(base)
+    assert set(reloaded.records) == {"b"}
+    assert (reloaded._rows, reloaded._free) == (2, [0])
+    assert reloaded.vectors(["b"]).tolist() == [[1, 1]]
+    reloaded.put("e", {}, vec(5, 5))
+    reloaded.put("f", {}, vec(6, 6))
+    assert (reloaded.get("e")["row"], reloaded.get("f")["row"]) == (0, 2)